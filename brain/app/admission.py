@@ -0,0 +1,319 @@
+"""
+Admission control for /analyze.
+
+Without a bound, a burst of large statements is read, decoded and held in
+memory all at once, and every request in the worker slows down together.
+The AdmissionController caps the work a worker has in flight:
+
+  weight     each request costs ceil(Content-Length / unit_bytes) units
+             (unknown_weight when the length is not sent), at most the
+             whole capacity — so a very large statement runs, but alone.
+             Requests are admitted before their body is read.
+
+  lanes      "realtime" (default) and "batch", from the X-Brain-Priority
+             header. Queued realtime requests are always admitted before
+             queued batch ones, and batch may hold at most batch_share of
+             the capacity, so a backfill cannot crowd out live applications.
+
+  tenants    X-Tenant-Id (default "default"). When units free up, the
+             queued tenant holding the fewest units goes next, and while
+             other tenants are queued no tenant may hold more than
+             tenant_share of the capacity. When a lane's queue is full, a
+             request from a tenant with fewer queued pushes out the newest
+             request of the tenant with the most.
+
+  rejection  a lane whose queue already holds max_queue requests rejects
+             at once (unless it can push out); a queued request that is
+             not admitted within the lane's max wait is rejected then.
+             Both raise Overloaded, which the API turns into a 429 with
+             Retry-After — an estimate from the recent hold time and the
+             work queued ahead.
+
+The controller lives on the worker's event loop and is only touched from
+it, so it needs no locks. stats() reports units and requests in flight,
+queue depth, admissions, rejections and recent wait-time percentiles per
+lane.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+import numpy as np
+
+LANES = ("realtime", "batch")
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; retry_after is in whole seconds."""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        super().__init__(f"{lane} lane {reason.replace('_', ' ')}")
+        self.lane        = lane
+        self.reason      = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    lane:     str
+    tenant:   str
+    weight:   int
+    future:   asyncio.Future
+    queued_at: float
+    granted:  bool = False
+
+
+@dataclass
+class _LaneStats:
+    in_flight:    int = 0                  # units
+    requests:     int = 0
+    queued:       int = 0
+    queued_units: int = 0
+    admitted:     int = 0
+    rejected:     Dict[str, int] = field(default_factory=lambda: {"queue_full": 0, "pushed_out": 0, "timeout": 0})
+    waits_ms:     Deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+
+
+class AdmissionController:
+    """Weighted in-flight budget with priority lanes and per-tenant fair dispatch."""
+
+    def __init__(
+        self,
+        capacity: int = 64,
+        unit_bytes: int = 256 * 1024,
+        unknown_weight: int = 8,
+        batch_share: float = 0.5,
+        tenant_share: float = 0.5,
+        max_queue: Optional[Dict[str, int]] = None,
+        max_wait: Optional[Dict[str, float]] = None,
+    ):
+        self.capacity       = capacity
+        self.unit_bytes     = unit_bytes
+        self.unknown_weight = unknown_weight
+        self.batch_share    = batch_share
+        self.tenant_share   = tenant_share
+        self.max_queue      = max_queue or {"realtime": 256, "batch": 1024}
+        self.max_wait       = max_wait or {"realtime": 5.0, "batch": 30.0}
+
+        self.in_flight = 0
+        self._tenants: Dict[str, int] = {}                          # tenant → units in flight
+        self._queues:  Dict[str, Dict[str, Deque[_Waiter]]] = {lane: {} for lane in LANES}
+        self._lanes    = {lane: _LaneStats() for lane in LANES}
+        self._hold_s   = 0.0                                         # EWMA of time held per request
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        if os.getenv("ADMISSION", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            capacity=int(os.getenv("ADMISSION_CAPACITY", "64")),
+            unit_bytes=int(os.getenv("ADMISSION_UNIT_KB", "256")) * 1024,
+            unknown_weight=int(os.getenv("ADMISSION_UNKNOWN_WEIGHT", "8")),
+            batch_share=float(os.getenv("ADMISSION_BATCH_SHARE", "0.5")),
+            tenant_share=float(os.getenv("ADMISSION_TENANT_SHARE", "0.5")),
+            max_queue={
+                "realtime": int(os.getenv("ADMISSION_MAX_QUEUE", "256")),
+                "batch":    int(os.getenv("ADMISSION_BATCH_MAX_QUEUE", "1024")),
+            },
+            max_wait={
+                "realtime": float(os.getenv("ADMISSION_MAX_WAIT_MS", "5000")) / 1000,
+                "batch":    float(os.getenv("ADMISSION_BATCH_MAX_WAIT_MS", "30000")) / 1000,
+            },
+        )
+
+    # ── Sizing ──────────────────────────────────────────────────────────────
+
+    def weight(self, content_length: Optional[str]) -> int:
+        try:
+            size = int(content_length)
+        except (TypeError, ValueError):
+            return min(self.unknown_weight, self.capacity)
+        return max(1, min(self.capacity, math.ceil(size / self.unit_bytes)))
+
+    @staticmethod
+    def lane(priority: Optional[str]) -> str:
+        return "batch" if (priority or "").strip().lower() in ("batch", "backfill", "bulk") else "realtime"
+
+    # ── Admission ───────────────────────────────────────────────────────────
+
+    def _fits(self, lane: str, tenant: str, weight: int) -> bool:
+        if self.in_flight + weight > self.capacity:
+            return False
+        if lane == "batch" and self._lanes["batch"].in_flight + weight > max(weight, self.batch_share * self.capacity):
+            return False
+        held = self._tenants.get(tenant, 0)
+        if held and held + weight > self.tenant_share * self.capacity and self._others_waiting(tenant):
+            return False
+        return True
+
+    def _others_waiting(self, tenant: str) -> bool:
+        return any(t != tenant for queue in self._queues.values() for t in queue)
+
+    def _has_waiters(self, lane: str) -> bool:
+        lanes = LANES[: LANES.index(lane) + 1]                      # this lane and the ones above it
+        return any(self._queues[l] for l in lanes)
+
+    def _grant(self, lane: str, tenant: str, weight: int) -> None:
+        self.in_flight += weight
+        self._tenants[tenant] = self._tenants.get(tenant, 0) + weight
+        stats = self._lanes[lane]
+        stats.in_flight += weight
+        stats.requests  += 1
+        stats.admitted  += 1
+
+    def _dispatch(self) -> None:
+        """Admit queued requests: realtime before batch, least-loaded tenant first."""
+        for lane in LANES:
+            queues = self._queues[lane]
+            while queues:
+                tenant = min(queues, key=lambda t: (self._tenants.get(t, 0), queues[t][0].queued_at))
+                waiter = queues[tenant][0]
+                if not self._fits(lane, tenant, waiter.weight):
+                    return                                           # head-of-line: keeps big requests from starving
+                self._dequeue(waiter)
+                self._grant(lane, tenant, waiter.weight)
+                waiter.granted = True
+                self._lanes[lane].waits_ms.append((time.monotonic() - waiter.queued_at) * 1000)
+                if not waiter.future.done():
+                    waiter.future.set_result(None)
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        queues = self._queues[waiter.lane]
+        queue  = queues.get(waiter.tenant)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del queues[waiter.tenant]
+        stats = self._lanes[waiter.lane]
+        stats.queued       -= 1
+        stats.queued_units -= waiter.weight
+
+    def _push_out(self, lane: str, tenant: str) -> bool:
+        """Full queue: reject the newest waiter of the longest tenant queue if it is longer than tenant's."""
+        queues = self._queues[lane]
+        own    = len(queues.get(tenant, ()))
+        victim = max(queues, key=lambda t: len(queues[t]), default=None)
+        if victim is None or len(queues[victim]) <= own + 1:
+            return False
+        waiter = queues[victim][-1]
+        self._dequeue(waiter)
+        self._lanes[lane].rejected["pushed_out"] += 1
+        waiter.future.set_exception(Overloaded(lane, "pushed_out", self.retry_after(lane)))
+        return True
+
+    def _release(self, lane: str, tenant: str, weight: int, held_s: float) -> None:
+        self.in_flight -= weight
+        left = self._tenants.get(tenant, 0) - weight
+        if left > 0:
+            self._tenants[tenant] = left
+        else:
+            self._tenants.pop(tenant, None)
+        stats = self._lanes[lane]
+        stats.in_flight -= weight
+        stats.requests  -= 1
+        self._hold_s = held_s if self._hold_s == 0.0 else 0.9 * self._hold_s + 0.1 * held_s
+        self._dispatch()
+
+    def retry_after(self, lane: str) -> int:
+        """Seconds until the queued work ahead of a new request has likely drained."""
+        ahead = sum(self._lanes[l].queued_units for l in LANES[: LANES.index(lane) + 1])
+        hold  = self._hold_s or 1.0
+        return max(1, math.ceil(hold * (1 + (self.in_flight + ahead) / self.capacity)))
+
+    async def acquire(self, lane: str, tenant: str, weight: int, max_wait: Optional[float] = None) -> float:
+        """
+        Wait for admission; returns the time spent queued (s). Raises Overloaded.
+        max_wait (s) shortens the lane's wait limit, e.g. to the request's deadline.
+        """
+        stats = self._lanes[lane]
+        if not self._has_waiters(lane) and self._fits(lane, tenant, weight):
+            self._grant(lane, tenant, weight)
+            stats.waits_ms.append(0.0)
+            return 0.0
+
+        if stats.queued >= self.max_queue[lane] and not self._push_out(lane, tenant):
+            stats.rejected["queue_full"] += 1
+            raise Overloaded(lane, "queue_full", self.retry_after(lane))
+
+        waiter = _Waiter(lane, tenant, weight, asyncio.get_running_loop().create_future(), time.monotonic())
+        self._queues[lane].setdefault(tenant, deque()).append(waiter)
+        stats.queued       += 1
+        stats.queued_units += weight
+        try:
+            limit = self.max_wait[lane] if max_wait is None else max(0.0, min(max_wait, self.max_wait[lane]))
+            await asyncio.wait_for(asyncio.shield(waiter.future), limit)
+        except asyncio.TimeoutError:
+            if not waiter.granted:
+                self._dequeue(waiter)
+                stats.rejected["timeout"] += 1
+                self._dispatch()                                     # the head may have been blocking others
+                raise Overloaded(lane, "timeout", self.retry_after(lane))
+        except asyncio.CancelledError:
+            # The client went away while queued.
+            if waiter.granted:
+                self._release(lane, tenant, weight, 0.0)
+            else:
+                self._dequeue(waiter)
+                self._dispatch()
+            raise
+        return time.monotonic() - waiter.queued_at
+
+    def slot(self, lane: str, tenant: str, weight: int, max_wait: Optional[float] = None) -> "_Slot":
+        """async with controller.slot(...): admitted for the body of the block."""
+        return _Slot(self, lane, tenant, weight, max_wait)
+
+    # ── Reporting ───────────────────────────────────────────────────────────
+
+    def queued(self) -> Dict[str, int]:
+        """Requests waiting for admission, per lane."""
+        return {lane: s.queued for lane, s in self._lanes.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {}
+        for lane, s in self._lanes.items():
+            waits = np.fromiter(s.waits_ms, dtype=np.float64, count=len(s.waits_ms))
+            p50, p99 = np.percentile(waits, (50, 99)) if len(waits) else (0.0, 0.0)
+            lanes[lane] = {
+                "in_flight_units":    s.in_flight,
+                "in_flight_requests": s.requests,
+                "queued":             s.queued,
+                "queued_units":       s.queued_units,
+                "admitted":           s.admitted,
+                "rejected":           dict(s.rejected),
+                "wait_ms":            {"p50": round(float(p50), 1), "p99": round(float(p99), 1),
+                                       "max": round(float(waits.max()), 1) if len(waits) else 0.0},
+            }
+        return {
+            "capacity_units":  self.capacity,
+            "unit_bytes":      self.unit_bytes,
+            "in_flight_units": self.in_flight,
+            "tenants_active":  len(self._tenants),
+            "hold_ms_ewma":    round(self._hold_s * 1000, 1),
+            "lanes":           lanes,
+        }
+
+
+class _Slot:
+    def __init__(self, controller: AdmissionController, lane: str, tenant: str, weight: int,
+                 max_wait: Optional[float] = None):
+        self.controller = controller
+        self.lane       = lane
+        self.tenant     = tenant
+        self.weight     = weight
+        self.max_wait   = max_wait
+        self.waited_s   = 0.0
+        self._start     = 0.0
+
+    async def __aenter__(self) -> "_Slot":
+        self.waited_s = await self.controller.acquire(self.lane, self.tenant, self.weight, self.max_wait)
+        self._start   = time.monotonic()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.controller._release(self.lane, self.tenant, self.weight, time.monotonic() - self._start)
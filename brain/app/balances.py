@@ -0,0 +1,102 @@
+"""
+End-of-day balance series.
+
+Mono reports a running balance on every transaction, so counting
+transactions with a low balance says little about how many *days* the
+account sat near zero: a quiet week on ₦200 is one row, a busy afternoon
+is twenty. This module rebuilds the daily picture instead.
+
+  last_balance_per_day()  per account, the balance after the last
+                          transaction of each active day — O(n) over the
+                          columns (group maxima by day offset, no sort).
+  daily_balance_series()  forward-fills each account's end-of-day balance
+                          across the calendar and sums the accounts into one
+                          combined series. An account contributes from its
+                          first observed day on.
+  balance_features()      true days below the threshold, average daily
+                          balance, minimum and percentiles of the series.
+
+Transactions sharing the latest timestamp of a day are resolved by input
+order (the later row wins). Undated transactions are left out.
+"""
+
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+LOW_BALANCE_NGN     = 1000.0
+BALANCE_PERCENTILES = (10, 50, 90)
+
+DaySeries = Tuple[np.ndarray, np.ndarray]   # (day ordinals int64 ascending, end-of-day balance float64)
+
+
+def last_balance_per_day(ts: np.ndarray, balance: np.ndarray) -> DaySeries:
+    """ts is datetime64[s] (NaT rows are skipped); returns one balance per active day."""
+    dated = ~np.isnat(ts)
+    if not dated.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    secs    = ts[dated].astype(np.int64)
+    bal     = balance[dated]
+    days    = ts[dated].astype("datetime64[D]").astype(np.int64)
+    first   = days.min()
+    offset  = days - first
+    n_days  = int(offset.max()) + 1
+
+    latest = np.full(n_days, np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(latest, offset, secs)
+
+    rows     = np.arange(len(secs))
+    is_last  = secs == latest[offset]
+    last_row = np.full(n_days, -1, dtype=np.int64)
+    np.maximum.at(last_row, offset[is_last], rows[is_last])
+
+    active = np.flatnonzero(last_row >= 0)
+    return first + active, bal[last_row[active]]
+
+
+def daily_balance_series(accounts: Iterable[DaySeries]) -> np.ndarray:
+    """
+    Combined end-of-day balance for every calendar day from the earliest to
+    the latest active day across accounts; each account forward-filled.
+    """
+    accounts = [(d, b) for d, b in accounts if len(d)]
+    if not accounts:
+        return np.empty(0, dtype=np.float64)
+
+    start  = min(int(d.min()) for d, _ in accounts)
+    end    = max(int(d.max()) for d, _ in accounts)
+    n_days = end - start + 1
+
+    grid = np.full((len(accounts), n_days), np.nan)
+    for row, (days, eod) in enumerate(accounts):
+        grid[row, days - start] = eod
+
+    observed = ~np.isnan(grid)
+    idx      = np.where(observed, np.arange(n_days)[None, :], 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    filled   = np.take_along_axis(grid, idx, axis=1)
+    started  = np.maximum.accumulate(observed, axis=1)
+    return np.where(started, filled, 0.0).sum(axis=0)
+
+
+def balance_features(series: np.ndarray, threshold: float = LOW_BALANCE_NGN) -> Dict[str, float]:
+    if len(series) == 0:
+        out = {
+            "days_below_1000_ngn":    0,
+            "min_balance_maintained": 0.0,
+            "avg_daily_balance":      0.0,
+            "balance_days":           0,
+        }
+        out.update({f"balance_p{p}": 0.0 for p in BALANCE_PERCENTILES})
+        return out
+
+    out = {
+        "days_below_1000_ngn":    int(np.count_nonzero(series < threshold)),
+        "min_balance_maintained": float(series.min()),
+        "avg_daily_balance":      float(series.mean()),
+        "balance_days":           int(len(series)),
+    }
+    percentiles = np.percentile(series, BALANCE_PERCENTILES)
+    out.update({f"balance_p{p}": float(v) for p, v in zip(BALANCE_PERCENTILES, percentiles)})
+    return out
@@ -0,0 +1,168 @@
+"""
+Indexed view of the credit-bureau response.
+
+The getCreditHistory payload is nested — institutions → loans → repayment
+schedule — and used to be walked separately by the credit-history, debt and
+thin-file features and by the active-default knockout, each pass re-parsing
+date_opened with strptime and re-iterating every schedule.
+
+BureauHistory.parse() walks it once and keeps:
+  per-loan columns   institution, loan_status, performance_status (lower-
+                     cased), opened (datetime64[D], NaT when unparseable),
+                     opening_balance
+  repayment columns  one flat int8 status code per scheduled repayment with
+                     the owning loan's index, so paid counts and the longest
+                     run of failed/missed repayments per loan are computed
+                     with NumPy instead of per-loan Python loops
+  by_status          loan_status → loan indexes
+
+Consumers call bureau_history(request), which parses on first use and caches
+the result on the request (as transaction_columns() does for transactions).
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+REPAYMENT_OTHER  = 0
+REPAYMENT_PAID   = 1
+REPAYMENT_FAILED = 2   # "failed" or "missed"
+
+_REPAYMENT_CODES = {"paid": REPAYMENT_PAID, "failed": REPAYMENT_FAILED, "missed": REPAYMENT_FAILED}
+
+
+def _parse_opened(value: Any) -> Optional[date]:
+    try:
+        return datetime.strptime(value, "%d-%m-%Y").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass
+class BureauHistory:
+    present:            bool                   # credit_history was supplied at all
+    institution:        List[str]
+    loan_status:        List[str]              # lower-cased
+    performance_status: List[str]              # lower-cased
+    opened:             np.ndarray             # datetime64[D], NaT when missing/unparseable
+    opening_balance:    np.ndarray             # float64
+    repayment_status:   np.ndarray             # int8 REPAYMENT_* per scheduled repayment
+    repayment_loan:     np.ndarray             # int32 loan index per scheduled repayment
+    paid_count:         np.ndarray             # int64 per loan
+    max_failure_streak: np.ndarray             # int64 per loan
+    by_status:          Dict[str, np.ndarray] = field(default_factory=dict)
+
+    @property
+    def loan_count(self) -> int:
+        return len(self.loan_status)
+
+    @property
+    def open_loans(self) -> np.ndarray:
+        return self.by_status.get("open", np.empty(0, dtype=np.int64))
+
+    @property
+    def repayment_count(self) -> int:
+        return int(self.repayment_status.shape[0])
+
+    @property
+    def paid_repayments(self) -> int:
+        return int(self.paid_count.sum())
+
+    @property
+    def oldest_opened(self) -> Optional[date]:
+        valid = self.opened[~np.isnat(self.opened)]
+        return valid.min().item() if len(valid) else None
+
+    @property
+    def open_balance(self) -> float:
+        return float(self.opening_balance[self.open_loans].sum())
+
+    @classmethod
+    def parse(cls, credit_history: Optional[Dict[str, Any]]) -> "BureauHistory":
+        institution, loan_status, performance = [], [], []
+        opened, balance = [], []
+        statuses: List[int] = []
+        owners:   List[int] = []
+
+        for entry in (credit_history or {}).get("credit_history", None) or []:
+            name = entry.get("institution", "unknown institution")
+            for loan in entry.get("history", None) or []:
+                index = len(loan_status)
+                institution.append(name)
+                loan_status.append((loan.get("loan_status") or "").lower())
+                performance.append((loan.get("performance_status") or "").lower())
+                opened.append(_parse_opened(loan.get("date_opened")))
+                balance.append(_to_float(loan.get("opening_balance", 0)))
+                for payment in loan.get("repayment_schedule", None) or []:
+                    statuses.append(_REPAYMENT_CODES.get(payment.get("status"), REPAYMENT_OTHER))
+                    owners.append(index)
+
+        n_loans          = len(loan_status)
+        repayment_status = np.asarray(statuses, dtype=np.int8)
+        repayment_loan   = np.asarray(owners, dtype=np.int32)
+
+        paid_count = np.bincount(
+            repayment_loan[repayment_status == REPAYMENT_PAID], minlength=n_loans,
+        ).astype(np.int64)
+
+        by_status: Dict[str, List[int]] = {}
+        for index, status in enumerate(loan_status):
+            by_status.setdefault(status, []).append(index)
+
+        return cls(
+            present=bool(credit_history),
+            institution=institution,
+            loan_status=loan_status,
+            performance_status=performance,
+            opened=np.array(opened, dtype="datetime64[D]"),
+            opening_balance=np.asarray(balance, dtype=np.float64),
+            repayment_status=repayment_status,
+            repayment_loan=repayment_loan,
+            paid_count=paid_count,
+            max_failure_streak=_max_failure_streaks(repayment_status, repayment_loan, n_loans),
+            by_status={k: np.asarray(v, dtype=np.int64) for k, v in by_status.items()},
+        )
+
+
+def _max_failure_streaks(status: np.ndarray, loan: np.ndarray, n_loans: int) -> np.ndarray:
+    """
+    Longest run of consecutive REPAYMENT_FAILED entries within each loan.
+
+    A run at position i has length i - (index of the last non-failure before
+    it). Loan boundaries count as a non-failure just before the loan's first
+    repayment, so runs never span two loans.
+    """
+    streaks = np.zeros(n_loans, dtype=np.int64)
+    if status.shape[0] == 0:
+        return streaks
+
+    idx     = np.arange(status.shape[0])
+    failed  = status == REPAYMENT_FAILED
+    starts  = np.flatnonzero(np.r_[True, loan[1:] != loan[:-1]])
+
+    reset         = np.where(failed, -1, idx)
+    reset[starts] = np.maximum(reset[starts], starts - 1)
+    last_reset    = np.maximum.accumulate(reset)
+    run           = np.where(failed, idx - last_reset, 0)
+
+    np.maximum.at(streaks, loan, run)
+    return streaks
+
+
+def bureau_history(request: Any) -> BureauHistory:
+    """Return the request's parsed bureau history, parsing on first use."""
+    history: Optional[BureauHistory] = request._bureau
+    if history is None:
+        history = BureauHistory.parse(request.credit_history)
+        request._bureau = history
+    return history
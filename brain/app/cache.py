@@ -0,0 +1,114 @@
+"""
+Idempotent response cache for /analyze.
+
+The gateway's callBrainService retries on timeouts and BullMQ can redeliver
+jobs, so the brain sometimes receives the same request several times. A hit
+returns the stored AnalyzeResponse without re-running the pipeline.
+
+Key: a hash of the raw request body, its content type, the ?fields= query
+value and the scorecard version pinned for the request, plus the
+evaluation date. Retries and redeliveries resend the same bytes, so the
+body is hashed as received rather than re-serialising every transaction
+into a canonical form on each miss.
+The same request encoded differently (key order, JSON vs MessagePack)
+misses. The date is part of the key because recency features
+(income_recency_days, credit_age_months, account age) are computed against
+date.today() — the same request evaluated tomorrow is a different
+evaluation.
+
+Bounded by entry count (LRU eviction) and TTL. Counters are exposed through
+stats() for the /metrics endpoint.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from app.models import AnalyzeResponse
+
+
+def request_key(
+    body: bytes,
+    content_type: Optional[str],
+    fields: Optional[str],
+    scorecard_version: str,
+    evaluation_date: Optional[date] = None,
+) -> str:
+    digest = hashlib.blake2b(body, digest_size=20)
+    for part in (content_type or "", fields if fields is not None else "\0", scorecard_version,
+                 (evaluation_date or date.today()).isoformat()):
+        digest.update(b"\x1f")
+        digest.update(part.encode())
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of AnalyzeResponse objects."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, AnalyzeResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits        = 0
+        self.misses      = 0
+        self.stores      = 0
+        self.evictions   = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key: str) -> Optional[AnalyzeResponse]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, response = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses      += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key: str, response: AnalyzeResponse) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "enabled":     self.enabled,
+            "size":        size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits":        self.hits,
+            "misses":      self.misses,
+            "hit_ratio":   round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores":      self.stores,
+            "evictions":   self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,581 @@
+"""
+Sampled traffic capture.
+
+Benchmarks and backtests want real request distributions, not synthetic
+ones, without anyone reading production databases. With CAPTURE_DIR set, a
+sample of /analyze requests and their responses is scrubbed of personal data
+and appended to a local replay corpus:
+
+  - submit() never blocks the request. Scrubbing, serialising and
+    compressing happen on one background thread; when `max_pending`
+    captures are already waiting, the new one is dropped and counted.
+  - Requests rejected by the transaction-free knockouts are captured with
+    their transactions, which are decoded on the capture thread.
+    Cache hits are not captured.
+  - Each capture is one gzip member appended to the worker's current
+    segment, capture-{pid}-{n}.jsonl.gz. A segment is closed at
+    `segment_mb`; when the directory holds `max_mb` the capture stops
+    (counted as disk_full) rather than deleting anything.
+  - index.jsonl, shared by the workers, gets one line per capture: segment,
+    byte offset and length of its gzip member, decision, score and sizes.
+    read_captures() seeks straight to a record; the segments can also be
+    read end to end with any gzip reader.
+
+Scrubbing (Scrubber) keeps what the pipeline reads and removes the rest:
+
+  allowlist identity, account_details and credit_history keep only the
+            keys in their *_FIELDS tables: identity full_name and bvn, the
+            account name, currency and type, and the bureau fields
+            app.bureau reads (institution, loan and performance status,
+            date opened, opening balance, repayment statuses). Any other
+            key (address, gender, marital status, account numbers, bureau
+            profile, ...) is dropped;
+  names     applicant_name, identity full_name, account names: each word
+            becomes a keyed token, so the identity knockout compares the
+            same words as it did on the original;
+  BVNs      11 keyed digits, so equal BVNs stay equal;
+  other     elsewhere in the request, email, phone, address, date of
+            birth, account numbers, applicant_id and account_id become keyed
+            tokens and the free-text purpose is dropped;
+  text      a narration is replaced by canonical keywords that set the same
+            keyword flags (app.columns); a recurring-transaction description
+            keeps only its debt keywords; income descriptions are dropped;
+  response  free-text details (risk factor details, explainability) are
+            dropped.
+
+Tokens are HMACs under CAPTURE_KEY. Without it, each process draws a random
+key, so tokens are consistent within a record but not across workers.
+
+Configured from the environment (CaptureWriter.from_env):
+
+    CAPTURE_DIR=captures/          output directory; capture is off unless set
+    CAPTURE_SAMPLE_RATE=0.01       fraction of analysed requests to capture
+    CAPTURE_SEGMENT_MB=64          compressed size at which a segment is closed
+    CAPTURE_MAX_MB=1024            stop capturing when the directory holds this much
+    CAPTURE_MAX_PENDING=16         bound on queued + running captures
+    CAPTURE_KEY=...                HMAC key for tokens
+
+    python -m app.capture export captures/ payloads.jsonl [--limit N]
+
+writes the captured requests as JSONL for app.loadtest --payloads (which
+also accepts the directory itself) and app.cli score.
+
+    python -m app.capture check [requests.jsonl]
+
+scrubs each request (by default a Mono-shaped sample, MONO_SAMPLE_ACCOUNT)
+and fails if any value from its identity, account details or credit
+history that the allowlist does not keep verbatim survives the scrub.
+"""
+
+import argparse
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from app.codecs import StagedRequest
+from app.columns import (
+    BOUNCE_KEYWORDS, HIGH_RISK_KEYWORDS, KNOCKOUT_BOUNCE_KEYWORDS,
+    LOANAPP_KEYWORDS, SALARY_KEYWORDS, TransactionColumns,
+)
+from app.logging_config import fields
+from app.models import AnalyzeRequest, AnalyzeResponse
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.jsonl"
+MB         = 1024 * 1024
+
+NAME_KEYS  = {"applicant_name", "full_name", "name", "first_name", "last_name", "middle_name"}
+BVN_KEYS   = {"applicant_bvn", "bvn"}
+TOKEN_KEYS = {
+    "applicant_id", "account_id", "email", "phone", "phone_number", "address", "date_of_birth", "dob",
+    "account_number", "accountNumber", "bank_account_number", "nuban",
+}
+DROP_KEYS  = {"last_income_description", "purpose"}
+
+# Allowlisted sections: only these keys survive. True keeps a scalar as is,
+# "name" / "bvn" tokenise it, a dict describes the object (or each object
+# of a list) under the key.
+IDENTITY_FIELDS = {"full_name": "name", "bvn": "bvn"}
+ACCOUNT_DETAIL_FIELDS = {"name": "name", "currency": True, "type": True}
+CREDIT_HISTORY_FIELDS = {
+    "credit_history": {
+        "institution": True,
+        "history": {
+            "loan_status":        True,
+            "performance_status": True,
+            "date_opened":        True,
+            "opening_balance":    True,
+            "repayment_schedule": {"status": True},
+        },
+    },
+}
+ALLOWLISTED = {
+    "identity":        IDENTITY_FIELDS,
+    "account_details": ACCOUNT_DETAIL_FIELDS,
+    "credit_history":  CREDIT_HISTORY_FIELDS,
+}
+
+# An account as the gateway forwards it from Mono's /accounts/{id} and
+# /accounts/{id}/identity, for `check`.
+MONO_SAMPLE_ACCOUNT = {
+    "account_id": "65f1c0a2e4b0c8a1d2e3f4a5",
+    "account_details": {
+        "id": "65f1c0a2e4b0c8a1d2e3f4a5",
+        "name": "SAMUEL OLAMIDE NOMO",
+        "currency": "NGN",
+        "type": "SAVINGS_ACCOUNT",
+        "account_number": "0131883461",
+        "accountNumber": "0131883461",
+        "balance": 1250000,
+        "bvn": "22110033445",
+        "institution": {"name": "GTBank", "bank_code": "058", "type": "PERSONAL_BANKING"},
+    },
+    "balance": 12500.0,
+    "transactions": [],
+    "identity": {
+        "full_name": "SAMUEL OLAMIDE NOMO",
+        "email": "samuel.nomo@example.com",
+        "phone": "08031234567",
+        "gender": "Male",
+        "dob": "1997-05-16",
+        "bvn": "22110033445",
+        "marital_status": "Single",
+        "address_line1": "12 Allen Ave, Ikeja",
+        "address_line2": "Lagos",
+        "created_at": "2024-03-13T09:41:22.104Z",
+        "updated_at": "2024-03-13T09:41:22.104Z",
+    },
+}
+DEBT_KEYWORDS = ("loan", "repay", "lend", "credit") + LOANAPP_KEYWORDS
+
+
+def _flags_narration(salary: bool, bounce: bool, ko_bounce: bool, high_risk: bool) -> str:
+    """A narration that sets exactly these keyword flags in app.columns."""
+    words = []
+    if salary:
+        words.append("salary")
+    if ko_bounce:
+        words.append("insufficient")        # in both bounce lists
+    elif bounce:
+        words.append("failed debit")        # in BOUNCE_KEYWORDS only
+    if high_risk:
+        words.append("bet")
+    return " ".join(words)
+
+
+def _contains_any(text: str, keywords: Sequence[str]) -> bool:
+    return any(kw in text for kw in keywords)
+
+
+class Scrubber:
+    """Keyed, deterministic replacement of the personal fields in a request document."""
+
+    def __init__(self, key: bytes):
+        self.key = key
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self.key, value.encode(), hashlib.blake2b).digest()
+
+    def token(self, value: Any) -> str:
+        return "t_" + self._digest(str(value)).hex()[:16]
+
+    def name(self, value: Any) -> str:
+        return " ".join(
+            "n" + self._digest(word).hex()[:10] for word in str(value).upper().split()
+        )
+
+    def bvn(self, value: Any) -> str:
+        value = str(value).strip()
+        if not value:
+            return value
+        return str(int.from_bytes(self._digest(value)[:8], "big") % 10**11).zfill(11)
+
+    @staticmethod
+    def narration(value: Any) -> str:
+        text = str(value or "").lower()
+        return _flags_narration(
+            _contains_any(text, SALARY_KEYWORDS), _contains_any(text, BOUNCE_KEYWORDS),
+            _contains_any(text, KNOCKOUT_BOUNCE_KEYWORDS), _contains_any(text, HIGH_RISK_KEYWORDS),
+        )
+
+    @staticmethod
+    def description(value: Any) -> str:
+        text = str(value or "").lower()
+        return " ".join(kw for kw in DEBT_KEYWORDS if kw in text)
+
+    def scrub(self, value: Any) -> Any:
+        """Recursively scrub a JSON-shaped document."""
+        if isinstance(value, dict):
+            out = {}
+            for k, v in value.items():
+                if k in DROP_KEYS:
+                    continue
+                if k in ALLOWLISTED:
+                    out[k] = self._allowed(v, ALLOWLISTED[k])
+                elif v is None or isinstance(v, (dict, list)):
+                    out[k] = self.scrub(v)
+                elif k in NAME_KEYS:
+                    out[k] = self.name(v)
+                elif k in BVN_KEYS:
+                    out[k] = self.bvn(v)
+                elif k in TOKEN_KEYS:
+                    out[k] = self.token(v)
+                elif k == "narration":
+                    out[k] = self.narration(v)
+                elif k == "description":
+                    out[k] = self.description(v)
+                else:
+                    out[k] = v
+            return out
+        if isinstance(value, list):
+            return [self.scrub(v) for v in value]
+        return value
+
+    def _allowed(self, value: Any, spec: Dict[str, Any]) -> Any:
+        """Keep only the keys in `spec` (see ALLOWLISTED); None for anything not shaped like it."""
+        if isinstance(value, list):
+            return [self._allowed(v, spec) for v in value if isinstance(v, dict)]
+        if not isinstance(value, dict):
+            return None
+        out = {}
+        for k, rule in spec.items():
+            if k not in value:
+                continue
+            v = value[k]
+            if v is None:
+                out[k] = None
+            elif isinstance(rule, dict):
+                if isinstance(v, (dict, list)):
+                    out[k] = self._allowed(v, rule)
+            elif isinstance(v, (dict, list)):
+                continue
+            elif rule == "name":
+                out[k] = self.name(v)
+            elif rule == "bvn":
+                out[k] = self.bvn(v)
+            else:
+                out[k] = v
+        return out
+
+    def request(self, request: AnalyzeRequest) -> Dict[str, Any]:
+        """The request as a scrubbed JSON document, transactions included."""
+        payload = request.model_dump(mode="json", exclude_defaults=True)
+        columns = request._columns
+        if columns is not None and columns.source == "arrow":
+            # Arrow requests hold their transactions only as columns.
+            for index, txns in enumerate(_column_transactions(columns, len(request.accounts))):
+                payload["accounts"][index]["transactions"] = txns
+        return self.scrub(payload)
+
+    def response(self, response: AnalyzeResponse) -> Dict[str, Any]:
+        payload = response.model_dump(mode="json", exclude_none=True, exclude={"explainability", "trace", "feature_state"})
+        for factor in payload.get("risk_factors", []):
+            factor.pop("detail", None)
+        if "applicant_id" in payload:
+            payload["applicant_id"] = self.token(payload["applicant_id"])
+        return payload
+
+
+def _column_transactions(cols: TransactionColumns, n_accounts: int) -> List[List[Dict[str, Any]]]:
+    """Per-account transaction dicts rebuilt from columns; narrations carry only the keyword flags."""
+    accounts: List[List[Dict[str, Any]]] = [[] for _ in range(n_accounts)]
+    dates = np.datetime_as_string(cols.ts, unit="s")
+    types = {1: "credit", -1: "debit"}
+    for i in range(len(cols)):
+        txn = {
+            "date":      None if np.isnat(cols.ts[i]) else dates[i] + "Z",
+            "amount":    float(cols.amount[i]),
+            "type":      types.get(int(cols.kind[i]), "other"),
+            "balance":   float(cols.balance[i]),
+            "narration": _flags_narration(
+                bool(cols.salary_kw[i]), bool(cols.bounce_kw[i]),
+                bool(cols.ko_bounce_kw[i]), bool(cols.high_risk_kw[i]),
+            ),
+        }
+        accounts[int(cols.account[i])].append(txn)
+    return accounts
+
+
+class CaptureWriter:
+    """Sampled, drop-on-pressure capture of requests and responses into gzip segments."""
+
+    def __init__(
+        self,
+        directory: str,
+        scrubber: Scrubber,
+        sample_rate: float = 0.01,
+        segment_mb: float = 64,
+        max_mb: float = 1024,
+        max_pending: int = 16,
+    ):
+        self.directory     = Path(directory)
+        self.scrubber      = scrubber
+        self.sample_rate   = sample_rate
+        self.segment_bytes = int(segment_mb * MB)
+        self.max_bytes     = int(max_mb * MB)
+        self.max_pending   = max_pending
+
+        self._lock     = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid = None
+        self._pending  = 0
+        self._segment  = None        # open file of the current segment
+        self._segment_n = 0
+        self._dir_bytes: Optional[int] = None
+
+        self.submitted = 0
+        self.dropped   = 0
+        self.written   = 0
+        self.failed    = 0
+        self.disk_full = 0
+        self.bytes_written = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["CaptureWriter"]:
+        directory = os.getenv("CAPTURE_DIR")
+        if not directory:
+            return None
+        key = os.getenv("CAPTURE_KEY")
+        return cls(
+            directory=directory,
+            scrubber=Scrubber(key.encode() if key else os.urandom(32)),
+            sample_rate=float(os.getenv("CAPTURE_SAMPLE_RATE", "0.01")),
+            segment_mb=float(os.getenv("CAPTURE_SEGMENT_MB", "64")),
+            max_mb=float(os.getenv("CAPTURE_MAX_MB", "1024")),
+            max_pending=int(os.getenv("CAPTURE_MAX_PENDING", "16")),
+        )
+
+    def _executor(self) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            self._pool      = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+            self._pool_pid  = pid
+            self._pending   = 0
+            self._segment   = None
+            self._segment_n = 0
+        return self._pool
+
+    def submit(
+        self,
+        request: AnalyzeRequest,
+        response: AnalyzeResponse,
+        staged: Optional[StagedRequest] = None,
+        content_type: Optional[str] = None,
+    ) -> bool:
+        """Queue a capture; False when sampled out or dropped. Never blocks on the pool."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            pool = self._executor()
+            self._pending  += 1
+            self.submitted += 1
+        pool.submit(self._write, request, response, staged, content_type)
+        return True
+
+    def _write(
+        self,
+        request: AnalyzeRequest,
+        response: AnalyzeResponse,
+        staged: Optional[StagedRequest],
+        content_type: Optional[str],
+    ) -> None:
+        try:
+            if staged is not None:
+                request = staged.complete()
+            document = {
+                "ts":           time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "content_type": content_type,
+                "request":      self.scrubber.request(request),
+                "response":     self.scrubber.response(response),
+            }
+            member = gzip.compress(
+                json.dumps(document, separators=(",", ":")).encode() + b"\n", compresslevel=6,
+            )
+            self._append(member, {
+                "ts":           document["ts"],
+                "decision":     response.decision,
+                "score":        response.score,
+                "accounts":     len(request.accounts),
+                "transactions": sum(len(a["transactions"]) for a in document["request"]["accounts"]),
+            })
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.warning(
+                "Traffic capture failed",
+                extra=fields(applicant=request.applicant_id, error_type=type(e).__name__, error=str(e)),
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _append(self, member: bytes, entry: Dict[str, Any]) -> None:
+        """Runs on the capture thread only."""
+        rotate = self._segment is None or self._segment.tell() + len(member) > self.segment_bytes
+        if rotate or self._dir_bytes is None:
+            # Other workers write here too; recount at each new segment.
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._dir_bytes = sum(p.stat().st_size for p in self.directory.glob("capture-*.jsonl.gz"))
+        if self._dir_bytes + len(member) > self.max_bytes:
+            with self._lock:
+                self.disk_full += 1
+            return
+
+        if rotate:
+            self._rotate()
+        offset = self._segment.tell()
+        self._segment.write(member)
+        self._segment.flush()
+        self._dir_bytes += len(member)
+
+        entry = {"segment": Path(self._segment.name).name, "offset": offset, "length": len(member), **entry}
+        line  = (json.dumps(entry, separators=(",", ":")) + "\n").encode()
+        fd    = os.open(self.directory / INDEX_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)        # one short O_APPEND write: lines from workers never interleave
+        finally:
+            os.close(fd)
+        with self._lock:
+            self.written       += 1
+            self.bytes_written += len(member)
+
+    def _rotate(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+        while True:
+            self._segment_n += 1
+            path = self.directory / f"capture-{os.getpid()}-{self._segment_n:04d}.jsonl.gz"
+            if not path.exists():
+                break
+        self._segment = open(path, "ab")
+
+    def shutdown(self) -> None:
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=True)
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "directory":     str(self.directory),
+                "sample_rate":   self.sample_rate,
+                "pending":       self._pending,
+                "max_pending":   self.max_pending,
+                "submitted":     self.submitted,
+                "dropped":       self.dropped,
+                "written":       self.written,
+                "failed":        self.failed,
+                "disk_full":     self.disk_full,
+                "bytes_written": self.bytes_written,
+            }
+
+
+def read_captures(directory: str, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Captured documents ({ts, content_type, request, response}) in index order."""
+    root = Path(directory)
+    with open(root / INDEX_FILE, encoding="utf-8") as index:
+        for n, line in enumerate(index):
+            if limit is not None and n >= limit:
+                return
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            with open(root / entry["segment"], "rb") as fh:
+                fh.seek(entry["offset"])
+                yield json.loads(gzip.decompress(fh.read(entry["length"])))
+
+
+def leaks(original: Dict[str, Any], scrubbed: Dict[str, Any]) -> List[str]:
+    """
+    Paths of values in the allowlisted sections of `original` that appear
+    in `scrubbed` although the allowlist does not keep them verbatim.
+    """
+    text  = json.dumps(scrubbed)
+    found = []
+
+    def walk(value: Any, spec: Any, path: str) -> None:
+        if isinstance(value, list):
+            for i, v in enumerate(value):
+                walk(v, spec, f"{path}[{i}]")
+        elif isinstance(value, dict):
+            for k, v in value.items():
+                walk(v, spec.get(k) if isinstance(spec, dict) else None, f"{path}.{k}")
+        elif value is not None and spec is not True:
+            s = str(value)
+            if len(s) >= 4 and (json.dumps(s) in text or s in text):
+                found.append(path)
+
+    for index, account in enumerate(original.get("accounts", [])):
+        for section in ("identity", "account_details"):
+            walk(account.get(section), ALLOWLISTED[section], f"accounts[{index}].{section}")
+    walk(original.get("credit_history"), CREDIT_HISTORY_FIELDS, "credit_history")
+    return found
+
+
+def _check(path: Optional[str]) -> int:
+    from app.payloads import synthetic_request
+
+    if path is None:
+        sample = synthetic_request(20, seed=0)
+        sample["accounts"][0] = {**MONO_SAMPLE_ACCOUNT, "transactions": sample["accounts"][0]["transactions"]}
+        sample["applicant_name"] = MONO_SAMPLE_ACCOUNT["identity"]["full_name"]
+        sample["applicant_bvn"]  = MONO_SAMPLE_ACCOUNT["identity"]["bvn"]
+        documents = [sample]
+    else:
+        with open(path, encoding="utf-8") as fh:
+            documents = [json.loads(line) for line in fh if line.strip()]
+
+    scrubber = Scrubber(os.urandom(32))
+    failed   = 0
+    for number, document in enumerate(documents, start=1):
+        found = leaks(document, scrubber.request(AnalyzeRequest.model_validate(document)))
+        if found:
+            failed += 1
+            print(f"request {number}: kept {', '.join(found)}", file=sys.stderr)
+    print(f"{len(documents) - failed}/{len(documents)} requests scrubbed clean", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.capture", description="Traffic capture corpus tools")
+    sub    = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Write the captured requests as JSONL")
+    export.add_argument("directory")
+    export.add_argument("output")
+    export.add_argument("--limit", type=int)
+    check  = sub.add_parser("check", help="Check that scrubbing removes the personal fields")
+    check.add_argument("requests", nargs="?", help="JSONL of requests (default: a Mono-shaped sample)")
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        return _check(args.requests)
+
+    count = 0
+    with open(args.output, "w", encoding="utf-8") as out:
+        for document in read_captures(args.directory, args.limit):
+            out.write(json.dumps(document["request"], separators=(",", ":")) + "\n")
+            count += 1
+    print(f"{count} requests → {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Monthly cash-flow aggregation.
+
+Works on the per-month credit/debit totals in TransactionAggregates
+(app.state) and produces, in one NumPy pass:
+
+  all-history   monthly_avg_credits / monthly_avg_debits (a month counts
+                towards an average only if it has at least one credit /
+                debit), net_monthly_surplus, surplus_ratio,
+                positive_cash_flow_ratio, spending_volatility
+                (sample std / mean of debit months)
+
+  rolling       for each window W in ROLLING_WINDOWS (3, 6, 12 months),
+                over the W calendar months ending at the evaluation month
+                (the current month, or the latest month with activity if
+                that is later):
+                  avg_credits_{W}m, avg_debits_{W}m, avg_net_flow_{W}m
+                  spending_volatility_{W}m    std / mean of monthly debits
+                  credit_trend_{W}m           OLS slope of monthly credits (NGN/month)
+                  net_flow_trend_{W}m         OLS slope of monthly net flow (NGN/month)
+                  min_net_flow_{W}m / max_net_flow_{W}m
+
+The rolling windows use a dense calendar series: the sparse months are
+bincounted onto consecutive month offsets running up to the evaluation
+month, so a month with no activity after the history starts (including
+the dormant months up to now) counts as zero flow. An account dormant for
+8 months therefore has 3-month averages of zero, as the other recency
+features would suggest. Months before the history starts are not
+observed: a 12-month window over 5 months of history is computed over
+those 5 months. All windows are evaluated together as masked rows of one
+(windows × 12) matrix.
+"""
+
+from datetime import date
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+ROLLING_WINDOWS = (3, 6, 12)
+
+_EMPTY_HISTORY = {
+    "monthly_avg_credits":      0.0, "monthly_avg_debits":      0.0,
+    "net_monthly_surplus":      0.0, "surplus_ratio":           0.0,
+    "positive_cash_flow_ratio": 0.0, "debit_to_credit_ratio": 999.0,
+    "spending_volatility":      1.0,
+}
+
+
+def _month_ordinal(day: date) -> int:
+    return (day.year - 1970) * 12 + day.month - 1
+
+
+def _rolling_names(window: int):
+    return (
+        f"avg_credits_{window}m", f"avg_debits_{window}m", f"avg_net_flow_{window}m",
+        f"spending_volatility_{window}m", f"credit_trend_{window}m",
+        f"net_flow_trend_{window}m", f"min_net_flow_{window}m", f"max_net_flow_{window}m",
+    )
+
+
+def monthly_cash_flow(
+    months: np.ndarray,
+    credits: np.ndarray,
+    debits: np.ndarray,
+    credit_count: np.ndarray,
+    debit_count: np.ndarray,
+    windows: Sequence[int] = ROLLING_WINDOWS,
+    evaluation_month: Optional[int] = None,
+) -> Dict[str, float]:
+    """
+    months are ascending month ordinals (months since 1970-01); the other
+    arrays are aligned totals. evaluation_month (same ordinal) defaults to
+    the current month.
+    """
+    if len(months) == 0:
+        out = dict(_EMPTY_HISTORY)
+        for w in windows:
+            out.update(dict.fromkeys(_rolling_names(w), 0.0))
+        return out
+
+    # ── All-history figures (sparse months) ─────────────────────────────────
+    has_credit  = credit_count > 0
+    has_debit   = debit_count > 0
+    avg_credits = float(credits[has_credit].mean()) if has_credit.any() else 0.0
+    avg_debits  = float(debits[has_debit].mean())   if has_debit.any()  else 0.0
+    net_surplus = avg_credits - avg_debits
+
+    debit_vals          = debits[has_debit]
+    spending_volatility = 0.0
+    if len(debit_vals) > 1 and avg_debits > 0:
+        spending_volatility = float(debit_vals.std(ddof=1)) / avg_debits
+
+    out: Dict[str, float] = {
+        "monthly_avg_credits":      avg_credits,
+        "monthly_avg_debits":       avg_debits,
+        "net_monthly_surplus":      net_surplus,
+        "surplus_ratio":            net_surplus / avg_credits if avg_credits > 0 else 0.0,
+        "positive_cash_flow_ratio": int(np.count_nonzero(credits > debits)) / len(months),
+        "debit_to_credit_ratio":    avg_debits / avg_credits if avg_credits > 0 else 999.0,
+        "spending_volatility":      spending_volatility,
+    }
+
+    # ── Rolling windows (dense calendar months) ─────────────────────────────
+    span   = max(windows)
+    if evaluation_month is None:
+        evaluation_month = _month_ordinal(date.today())
+    offset = months - months[0]
+    length = int(max(months[-1], evaluation_month) - months[0]) + 1
+    dense_c = np.bincount(offset, weights=credits, minlength=length)[-span:]
+    dense_d = np.bincount(offset, weights=debits,  minlength=length)[-span:]
+
+    pad     = span - len(dense_c)
+    series  = np.full((3, span), np.nan)
+    series[0, pad:] = dense_c
+    series[1, pad:] = dense_d
+    series[2, pad:] = dense_c - dense_d                       # net flow
+
+    w       = np.asarray(windows)[:, None]                    # (W, 1)
+    t       = np.arange(span)[None, :]                        # (1, span)
+    mask    = (t >= span - w) & ~np.isnan(series[0])[None, :]  # (W, span)
+    n       = mask.sum(axis=1)                                # months observed per window
+    vals    = np.where(mask[:, None, :], series[None, :, :], 0.0)   # (W, 3, span)
+
+    means   = vals.sum(axis=2) / n[:, None]                   # (W, 3)
+    dev     = np.where(mask[:, None, :], vals - means[:, :, None], 0.0)
+    var     = (dev ** 2).sum(axis=2) / np.maximum(n - 1, 1)[:, None]
+
+    t_mean  = (np.where(mask, t, 0)).sum(axis=1) / n          # (W,)
+    t_dev   = np.where(mask, t - t_mean[:, None], 0.0)        # (W, span)
+    sxx     = (t_dev ** 2).sum(axis=1)
+    sxy     = (dev * t_dev[:, None, :]).sum(axis=2)           # (W, 3)
+    slope   = np.where(sxx[:, None] > 0, sxy / np.where(sxx > 0, sxx, 1.0)[:, None], 0.0)
+
+    net_min = np.where(mask, series[2][None, :],  np.inf).min(axis=1)
+    net_max = np.where(mask, series[2][None, :], -np.inf).max(axis=1)
+
+    for i, window in enumerate(windows):
+        mean_d = means[i, 1]
+        vol    = float(np.sqrt(var[i, 1]) / mean_d) if n[i] > 1 and mean_d > 0 else 0.0
+        names  = _rolling_names(window)
+        out.update(zip(names, (
+            float(means[i, 0]), float(mean_d), float(means[i, 2]),
+            vol, float(slope[i, 0]), float(slope[i, 2]),
+            float(net_min[i]), float(net_max[i]),
+        )))
+    return out
@@ -0,0 +1,338 @@
+"""
+`brain` — offline bulk scoring.
+
+Rescoring archived applications used to mean running the service locally
+and replaying them over HTTP. This runs AnalysisEngine directly, across all
+cores, over a file of AnalyzeRequest documents:
+
+    python -m app.cli score applications.jsonl decisions.jsonl
+    python -m app.cli score applications.parquet decisions.parquet --workers 8
+
+Input formats (chosen by suffix, or --input-format):
+  jsonl    one AnalyzeRequest JSON object per line (the gateway's shape)
+  parquet  one row per application; accounts is a list of structs with
+           nested transactions. Fields a struct column fills with null are
+           dropped, so model defaults apply as they would for JSON.
+
+Output (by suffix, or --output-format): one record per input row, in input
+order — index, applicant_id, decision, score, score_band, score_breakdown,
+primary_reason, and error (set instead of the decision fields when a row
+fails validation or scoring). --full writes the whole AnalyzeResponse
+(JSONL only). --scorecard rescores with a given scorecard version instead
+of the active one (app.scorecard).
+
+Memory is bounded: rows are read in chunks, at most --max-inflight chunks
+are queued to the process pool, and results are written as soon as the
+oldest chunk completes. Progress and throughput go to stderr.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+
+
+FORMATS = ("jsonl", "parquet")
+
+Record = Tuple[int, Any]   # (input index, raw JSON bytes or a decoded dict)
+
+# Response sections the summary output needs; the rest are not computed.
+SUMMARY_SECTIONS = ("score_band", "score_breakdown", "explainability")
+
+OUTPUT_FIELDS = (
+    "index", "applicant_id", "decision", "score", "score_band",
+    "score_breakdown", "primary_reason", "error",
+)
+
+
+def detect_format(path: str, override: Optional[str]) -> str:
+    if override:
+        return override
+    suffix = Path(path).suffix.lower()
+    if suffix in (".parquet", ".pq"):
+        return "parquet"
+    if suffix in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise SystemExit(f"Cannot infer the format of {path}; pass --input-format/--output-format")
+
+
+# ── Input ────────────────────────────────────────────────────────────────────
+
+def _drop_nulls(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_drop_nulls(v) for v in value]
+    return value
+
+
+def read_chunks(path: str, fmt: str, chunk_size: int, limit: Optional[int] = None) -> Iterator[List[Record]]:
+    """Yield lists of (index, record) without ever holding the whole file."""
+    index = 0
+    chunk: List[Record] = []
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            for row in batch.to_pylist():
+                if limit is not None and index >= limit:
+                    break
+                chunk.append((index, _drop_nulls(row)))
+                index += 1
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    else:
+        with open(path, "rb") as fh:
+            for line in fh:
+                if limit is not None and index >= limit:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                chunk.append((index, line))
+                index += 1
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+
+    if chunk:
+        yield chunk
+
+
+# ── Worker side ──────────────────────────────────────────────────────────────
+
+def _init_worker(log_level: str, scorecard: Optional[str] = None) -> None:
+    from app.engine import AnalysisEngine
+    from app.logging_config import configure_logging
+    from app.scoring import CreditScorer
+
+    configure_logging(level=log_level)
+    AnalysisEngine.trace_sample_rate = 0.0
+    if scorecard:
+        AnalysisEngine._scorer = CreditScorer(version=scorecard)
+
+
+def score_record(index: int, record: Any, full: bool = False) -> Dict[str, Any]:
+    from app.engine import AnalysisEngine
+    from app.models import AnalyzeRequest
+
+    applicant_id = record.get("applicant_id") if isinstance(record, dict) else None
+    try:
+        if isinstance(record, (bytes, str)):
+            request = AnalyzeRequest.model_validate_json(record)
+        else:
+            request = AnalyzeRequest.model_validate(record)
+        applicant_id = request.applicant_id
+        if not full:
+            request.fields = list(SUMMARY_SECTIONS)
+        response     = AnalysisEngine.analyze(request)
+    except ValidationError as e:
+        return {"index": index, "applicant_id": applicant_id,
+                "error": f"validation: {e.error_count()} error(s): {e.errors()[0]['msg']}"}
+    except Exception as e:
+        return {"index": index, "applicant_id": applicant_id, "error": f"{type(e).__name__}: {e}"}
+
+    if full:
+        return {"index": index, **response.model_dump(mode="json")}
+    return {
+        "index":           index,
+        "applicant_id":    response.applicant_id,
+        "decision":        response.decision,
+        "score":           response.score,
+        "score_band":      response.score_band,
+        "score_breakdown": response.score_breakdown.model_dump(),
+        "primary_reason":  response.explainability.primary_reason,
+        "error":           None,
+    }
+
+
+def score_chunk(chunk: Sequence[Record], full: bool = False) -> List[Dict[str, Any]]:
+    return [score_record(index, record, full) for index, record in chunk]
+
+
+# ── Output ───────────────────────────────────────────────────────────────────
+
+class JSONLWriter:
+    def __init__(self, path: str):
+        self._fh: IO[str] = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._fh.write("".join(json.dumps(row, default=str) + "\n" for row in rows))
+
+    def close(self) -> None:
+        if self._fh is not sys.stdout:
+            self._fh.close()
+        else:
+            self._fh.flush()
+
+
+class ParquetWriter:
+    def __init__(self, path: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        breakdown = pa.struct([
+            ("credit_history",        pa.float64()),
+            ("income_stability",      pa.float64()),
+            ("cash_flow_health",      pa.float64()),
+            ("debt_service_capacity", pa.float64()),
+            ("account_behavior",      pa.float64()),
+            ("total",                 pa.int64()),
+            ("scorecard_version",     pa.string()),
+        ])
+        self._pa     = pa
+        self._schema = pa.schema([
+            ("index",           pa.int64()),
+            ("applicant_id",    pa.string()),
+            ("decision",        pa.string()),
+            ("score",           pa.int64()),
+            ("score_band",      pa.string()),
+            ("score_breakdown", breakdown),
+            ("primary_reason",  pa.string()),
+            ("error",           pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        columns = {name: [row.get(name) for row in rows] for name in OUTPUT_FIELDS}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+# ── Driver ───────────────────────────────────────────────────────────────────
+
+class Progress:
+    """Periodic progress/throughput line on stderr."""
+
+    def __init__(self, interval: float, stream: IO[str] = sys.stderr):
+        self.interval = interval
+        self.stream   = stream
+        self.started  = time.perf_counter()
+        self.last     = self.started
+        self.done     = 0
+        self.errors   = 0
+        self.decisions: Dict[str, int] = {}
+
+    def update(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.done += 1
+            if row.get("error"):
+                self.errors += 1
+            else:
+                self.decisions[row["decision"]] = self.decisions.get(row["decision"], 0) + 1
+        now = time.perf_counter()
+        if self.interval > 0 and now - self.last >= self.interval:
+            self.last = now
+            self._line()
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def _line(self) -> None:
+        print(
+            f"scored={self.done} errors={self.errors} "
+            f"rate={self.rate:.1f}/s elapsed={time.perf_counter() - self.started:.1f}s",
+            file=self.stream, flush=True,
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "scored":    self.done,
+            "errors":    self.errors,
+            "decisions": dict(sorted(self.decisions.items())),
+            "elapsed_s": round(time.perf_counter() - self.started, 2),
+            "rate_per_s": round(self.rate, 1),
+        }
+
+
+def run_score(args: argparse.Namespace) -> int:
+    in_fmt  = detect_format(args.input, args.input_format)
+    out_fmt = detect_format(args.output, args.output_format) if args.output != "-" else (args.output_format or "jsonl")
+    if args.full and out_fmt != "jsonl":
+        raise SystemExit("--full is only supported for JSONL output")
+    if args.scorecard:
+        from app.scorecard import default_registry
+        try:
+            default_registry().get(args.scorecard)
+        except ValueError as e:
+            raise SystemExit(str(e))
+
+    writer   = ParquetWriter(args.output) if out_fmt == "parquet" else JSONLWriter(args.output)
+    progress = Progress(args.progress_interval)
+    chunks   = read_chunks(args.input, in_fmt, args.chunk_size, args.limit)
+
+    def drain(rows: List[Dict[str, Any]]) -> None:
+        writer.write(rows)
+        progress.update(rows)
+
+    try:
+        if args.workers <= 1:
+            _init_worker(args.log_level, args.scorecard)
+            for chunk in chunks:
+                drain(score_chunk(chunk, args.full))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=(args.log_level, args.scorecard),
+            ) as pool:
+                inflight: Deque[Future] = deque()
+                for chunk in chunks:
+                    inflight.append(pool.submit(score_chunk, chunk, args.full))
+                    if len(inflight) >= args.max_inflight:
+                        drain(inflight.popleft().result())
+                while inflight:
+                    drain(inflight.popleft().result())
+    finally:
+        writer.close()
+
+    print(json.dumps(progress.summary()), file=sys.stderr, flush=True)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="brain", description="Brain offline tools.")
+    sub    = parser.add_subparsers(dest="command", required=True)
+
+    workers = os.cpu_count() or 1
+    score = sub.add_parser("score", help="Bulk-score archived AnalyzeRequests")
+    score.add_argument("input", help="JSONL or Parquet file of AnalyzeRequests")
+    score.add_argument("output", help="JSONL or Parquet file for results ('-' for JSONL on stdout)")
+    score.add_argument("--input-format", choices=FORMATS)
+    score.add_argument("--output-format", choices=FORMATS)
+    score.add_argument("--workers", type=int, default=workers, help=f"Worker processes (default {workers})")
+    score.add_argument("--chunk-size", type=int, default=64, help="Applications per task")
+    score.add_argument("--max-inflight", type=int, default=0,
+                       help="Chunks queued to the pool at once (default 2 × workers)")
+    score.add_argument("--limit", type=int, help="Stop after this many applications")
+    score.add_argument("--full", action="store_true", help="Write the whole AnalyzeResponse (JSONL only)")
+    score.add_argument("--scorecard", help="Scorecard version to score with (default: the active one)")
+    score.add_argument("--progress-interval", type=float, default=5.0,
+                       help="Seconds between progress lines (0 disables)")
+    score.add_argument("--log-level", default="WARNING")
+    score.set_defaults(handler=run_score)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if getattr(args, "max_inflight", 1) <= 0:
+        args.max_inflight = 2 * max(args.workers, 1)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
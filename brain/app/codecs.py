@@ -0,0 +1,425 @@
+"""
+Wire formats for /analyze.
+
+JSON stays the default. Two binary request encodings are negotiated through
+Content-Type:
+
+  application/msgpack                 the same document as the JSON body,
+  (application/x-msgpack)             MessagePack-encoded. Cheaper to parse
+                                      for transaction-heavy requests.
+
+  application/vnd.apache.arrow.stream an Arrow IPC stream with one row per
+                                      transaction and columns
+                                      account_id, date, amount, type, balance,
+                                      narration. The rest of the request
+                                      (applicant, accounts without their
+                                      transactions, credit history, policy)
+                                      is JSON in the schema metadata under
+                                      the key "analyze_request".
+
+Arrow requests never materialise per-transaction dicts: the table is turned
+straight into the request's TransactionColumns (app.columns).
+
+Responses are JSON unless the Accept header asks for MessagePack.
+
+msgpack and pyarrow are optional (extras "msgpack" and "arrow"); a request
+in a format whose codec is not installed gets 415.
+
+Staged decoding (decode_staged): the transactions are most of every body,
+but the knockouts that reject most applicants read only identity, insights,
+credit history and income. decode_staged() validates the request with every
+accounts[].transactions left out and returns a StagedRequest; complete()
+decodes the transactions afterwards, only if the request gets that far.
+
+  JSON     a structural scan (unescaped quotes and brackets, located with
+           NumPy) finds the byte span of each account-level "transactions"
+           array without parsing it. The head is validated with each span
+           replaced by a placeholder; complete() validates the spans.
+  msgpack  the top-level map and each account map are walked with a
+           streaming Unpacker, which skips the transactions without building
+           them and reports their offsets.
+  Arrow    the request already travels in the schema metadata; complete()
+           builds the TransactionColumns.
+
+A body the scan cannot make sense of is decoded in full, so errors and 422s
+are the same as with decode_request().
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+from app.columns import TransactionColumns, parse_timestamp, request_window_start
+from app.models import AnalyzeRequest
+
+try:
+    import msgpack
+except ImportError:  # optional — pip install brain[msgpack]
+    msgpack = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # optional — pip install brain[arrow]
+    pa = None
+    pa_ipc = None
+
+
+JSON_MEDIA_TYPE    = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE   = "application/vnd.apache.arrow.stream"
+
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+ARROW_METADATA_KEY = b"analyze_request"
+ARROW_COLUMNS      = ("account_id", "date", "amount", "type", "balance", "narration")
+
+_TRANSACTIONS     = TypeAdapter(List[Dict[str, Any]])
+_TRANSACTIONS_KEY = b'"transactions"'
+_DEFERRED_KEY     = "__deferred__"
+_JSON_WHITESPACE  = b" \t\r\n"
+_ACCOUNT_DEPTH    = 3     # root object → accounts array → account object
+
+Span = Tuple[int, int]
+
+
+class UnsupportedMediaType(Exception):
+    """The request body's Content-Type is unknown or its codec is not installed."""
+
+
+def media_type(header: Optional[str]) -> str:
+    """'application/msgpack; charset=binary' → 'application/msgpack'; empty → JSON."""
+    if not header:
+        return JSON_MEDIA_TYPE
+    return header.split(";", 1)[0].strip().lower() or JSON_MEDIA_TYPE
+
+
+def _validation_error(exc: ValidationError, loc: Tuple[Any, ...] = ()) -> RequestValidationError:
+    """Re-raise pydantic errors with FastAPI's body-prefixed locations, so 422s look the same."""
+    errors = []
+    for err in exc.errors(include_url=False):
+        err = dict(err)
+        err["loc"] = ("body", *loc, *err.get("loc", ()))
+        if err["type"] == "json_invalid":
+            err["input"] = {}   # the raw bytes; FastAPI's own JSON errors omit them too
+        errors.append(err)
+    return RequestValidationError(errors)
+
+
+def decode_request(body: bytes, content_type: Optional[str]) -> AnalyzeRequest:
+    kind = media_type(content_type)
+    try:
+        if kind == JSON_MEDIA_TYPE or kind.endswith("+json"):
+            return AnalyzeRequest.model_validate_json(body)
+        if kind in MSGPACK_MEDIA_TYPES:
+            return _decode_msgpack(body)
+        if kind == ARROW_MEDIA_TYPE:
+            return _decode_arrow(body)
+    except ValidationError as e:
+        raise _validation_error(e) from e
+    raise UnsupportedMediaType(f"Unsupported Content-Type '{kind}'")
+
+
+def _decode_msgpack(body: bytes) -> AnalyzeRequest:
+    if msgpack is None:
+        raise UnsupportedMediaType("MessagePack support is not installed (brain[msgpack])")
+    try:
+        payload = msgpack.unpackb(body, raw=False)
+    except ValueError as e:
+        raise RequestValidationError([{
+            "type": "msgpack_invalid", "loc": ("body",), "msg": f"Invalid MessagePack: {e}", "input": None,
+        }]) from e
+    return AnalyzeRequest.model_validate(payload)
+
+
+def _decode_arrow(body: bytes) -> AnalyzeRequest:
+    request, table = _read_arrow(body)
+    _attach_arrow_columns(request, table)
+    return request
+
+
+def _read_arrow(body: bytes) -> Tuple[AnalyzeRequest, Any]:
+    if pa is None:
+        raise UnsupportedMediaType("Arrow support is not installed (brain[arrow])")
+    try:
+        table = pa_ipc.open_stream(pa.py_buffer(body)).read_all()
+    except (pa.ArrowInvalid, OSError) as e:
+        raise RequestValidationError([{
+            "type": "arrow_invalid", "loc": ("body",), "msg": f"Invalid Arrow IPC stream: {e}", "input": None,
+        }]) from e
+
+    metadata = table.schema.metadata or {}
+    if ARROW_METADATA_KEY not in metadata:
+        raise RequestValidationError([{
+            "type": "missing", "loc": ("body", "schema.metadata", ARROW_METADATA_KEY.decode()),
+            "msg": "Arrow stream carries no analyze_request metadata", "input": None,
+        }])
+
+    request = AnalyzeRequest.model_validate_json(metadata[ARROW_METADATA_KEY])
+    missing = [c for c in ("account_id", "date", "amount", "type") if c not in table.column_names]
+    if missing:
+        raise RequestValidationError([{
+            "type": "missing", "loc": ("body", "transactions", col),
+            "msg": "Field required", "input": None,
+        } for col in missing])
+    return request, table
+
+
+def _attach_arrow_columns(request: AnalyzeRequest, table: Any) -> None:
+    try:
+        request._columns = TransactionColumns.from_arrow(
+            table, [a.account_id for a in request.accounts], request_window_start(request),
+        )
+    except ValueError as e:
+        raise RequestValidationError([{
+            "type": "value_error", "loc": ("body", "transactions", "account_id"),
+            "msg": str(e), "input": None,
+        }]) from e
+
+
+# ── Staged decoding ──────────────────────────────────────────────────────────
+
+@dataclass
+class StagedRequest:
+    """
+    A request decoded without its transactions. Until complete() is called
+    every account's transactions list is empty (or holds a placeholder), so
+    only the transaction-free knockouts may look at `request`.
+    """
+    request: AnalyzeRequest
+    _attach: Optional[Callable[[AnalyzeRequest], None]] = None
+
+    @property
+    def deferred(self) -> bool:
+        return self._attach is not None
+
+    def complete(self) -> AnalyzeRequest:
+        """Decode the deferred transactions into the request (once) and return it."""
+        if self._attach is not None:
+            attach, self._attach = self._attach, None
+            attach(self.request)
+        return self.request
+
+
+def decode_staged(body: bytes, content_type: Optional[str]) -> StagedRequest:
+    kind = media_type(content_type)
+    try:
+        if kind == JSON_MEDIA_TYPE or kind.endswith("+json"):
+            return _stage_json(body)
+        if kind in MSGPACK_MEDIA_TYPES:
+            return _stage_msgpack(body)
+        if kind == ARROW_MEDIA_TYPE:
+            request, table = _read_arrow(body)
+            return StagedRequest(request, lambda r: _attach_arrow_columns(r, table))
+    except ValidationError as e:
+        raise _validation_error(e) from e
+    raise UnsupportedMediaType(f"Unsupported Content-Type '{kind}'")
+
+
+def _attach_spans(body: bytes, spans: Dict[int, Span], decode: Callable[[bytes], List[Dict[str, Any]]]):
+    """Attach function for StagedRequest: decode each account's span into its transactions."""
+    def attach(request: AnalyzeRequest) -> None:
+        errors = []
+        for index, (start, end) in sorted(spans.items()):
+            try:
+                request.accounts[index].transactions = decode(body[start:end])
+            except ValidationError as e:
+                errors.extend(_validation_error(e, ("accounts", index, "transactions")).errors())
+        if errors:
+            raise RequestValidationError(errors)
+    return attach
+
+
+def _escaped(body: bytes, quote: int) -> bool:
+    """A quote is escaped when an odd number of backslashes precede it."""
+    run = quote
+    while run > 0 and body[run - 1] == 0x5C:
+        run -= 1
+    return (quote - run) % 2 == 1
+
+
+def _transaction_spans(body: bytes) -> Optional[List[Span]]:
+    """
+    Byte spans of every account-level "transactions" array in a JSON body.
+
+    Quotes are located first (dropping escaped ones); brackets inside strings
+    are discarded by quote parity, and a running depth over the remaining
+    brackets gives each key's nesting level and each array's matching close.
+    None when the body does not scan as well-formed JSON.
+    """
+    if _TRANSACTIONS_KEY not in body:
+        return []
+
+    buf        = np.frombuffer(body, dtype=np.uint8)
+    structural = np.flatnonzero(
+        (buf == 0x22) | (buf == 0x5B) | (buf == 0x5D) | (buf == 0x7B) | (buf == 0x7D)
+    )
+    chars  = buf[structural]
+    quotes = structural[chars == 0x22]
+    if b"\\" in body:
+        candidates = quotes[(quotes > 0) & (buf[quotes - 1] == 0x5C)]
+        escaped    = [q for q in candidates.tolist() if _escaped(body, q)]
+        if escaped:
+            quotes = np.setdiff1d(quotes, escaped, assume_unique=True)
+    if len(quotes) % 2:
+        return None
+
+    is_bracket = chars != 0x22
+    brackets   = structural[is_bracket]
+    outside    = np.searchsorted(quotes, brackets) % 2 == 0
+    brackets   = brackets[outside]
+    kinds      = chars[is_bracket][outside]
+    depth      = np.cumsum(np.where((kinds == 0x5B) | (kinds == 0x7B), 1, -1))   # depth after each bracket
+
+    spans: List[Span] = []
+    pos = body.find(_TRANSACTIONS_KEY)
+    while pos >= 0:
+        after = pos + len(_TRANSACTIONS_KEY)
+        q     = int(np.searchsorted(quotes, pos))
+        b     = int(np.searchsorted(brackets, pos))
+        if q < len(quotes) and quotes[q] == pos and q % 2 == 0 and b > 0 and depth[b - 1] == _ACCOUNT_DEPTH:
+            start = after
+            while start < len(body) and body[start] in _JSON_WHITESPACE:
+                start += 1
+            if start >= len(body) or body[start] != 0x3A:   # not a key after all
+                return None
+            start += 1
+            while start < len(body) and body[start] in _JSON_WHITESPACE:
+                start += 1
+            if start < len(body) and body[start] == 0x5B:
+                if b >= len(brackets) or brackets[b] != start:
+                    return None
+                closes = np.flatnonzero(depth[b:] == depth[b] - 1)
+                if not len(closes):
+                    return None
+                end = int(brackets[b + closes[0]]) + 1
+                spans.append((start, end))
+                after = end
+        pos = body.find(_TRANSACTIONS_KEY, after)
+    return spans
+
+
+def _stage_json(body: bytes) -> StagedRequest:
+    spans = _transaction_spans(body)
+    if not spans:
+        return StagedRequest(AnalyzeRequest.model_validate_json(body))
+
+    parts, prev = [], 0
+    for k, (start, end) in enumerate(spans):
+        parts.append(body[prev:start])
+        parts.append(b'[{"%s":%d}]' % (_DEFERRED_KEY.encode(), k))
+        prev = end
+    parts.append(body[prev:])
+    try:
+        request = AnalyzeRequest.model_validate_json(b"".join(parts))
+    except ValidationError:
+        # Report errors against the real body, transactions included.
+        return StagedRequest(AnalyzeRequest.model_validate_json(body))
+
+    owned: Dict[int, Span] = {}
+    for index, account in enumerate(request.accounts):
+        txns = account.transactions
+        if len(txns) == 1 and _DEFERRED_KEY in txns[0]:
+            owned[index] = spans[txns[0][_DEFERRED_KEY]]
+            account.transactions = []
+    return StagedRequest(request, _attach_spans(body, owned, _TRANSACTIONS.validate_json))
+
+
+def _stage_msgpack(body: bytes) -> StagedRequest:
+    if msgpack is None:
+        raise UnsupportedMediaType("MessagePack support is not installed (brain[msgpack])")
+
+    unpacker = msgpack.Unpacker(raw=False, max_buffer_size=len(body))
+    unpacker.feed(body)
+    payload: Dict[str, Any] = {}
+    spans:   Dict[int, Span] = {}
+    try:
+        for _ in range(unpacker.read_map_header()):
+            key = unpacker.unpack()
+            if key != "accounts":
+                payload[key] = unpacker.unpack()
+                continue
+            accounts = []
+            for index in range(unpacker.read_array_header()):
+                account = {}
+                for _ in range(unpacker.read_map_header()):
+                    name = unpacker.unpack()
+                    if name == "transactions":
+                        start = unpacker.tell()
+                        unpacker.skip()
+                        spans[index] = (start, unpacker.tell())
+                        account[name] = []
+                    else:
+                        account[name] = unpacker.unpack()
+                accounts.append(account)
+            payload[key] = accounts
+        if unpacker.tell() != len(body):
+            raise ValueError("trailing data")
+    except (ValueError, TypeError, msgpack.OutOfData):
+        # Not the shape the walk expects (or not MessagePack at all) — the
+        # full decoder reports the error, or validates whatever it is.
+        return StagedRequest(_decode_msgpack(body))
+
+    def decode(raw: bytes) -> List[Dict[str, Any]]:
+        return _TRANSACTIONS.validate_python(msgpack.unpackb(raw, raw=False))
+
+    try:
+        request = AnalyzeRequest.model_validate(payload)
+    except ValidationError:
+        return StagedRequest(_decode_msgpack(body))
+    return StagedRequest(request, _attach_spans(body, spans, decode))
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    if msgpack is None or not accept:
+        return False
+    return any(media_type(part) in MSGPACK_MEDIA_TYPES for part in accept.split(","))
+
+
+def encode_msgpack(payload: Any) -> bytes:
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def encode_arrow_request(payload: Dict[str, Any]) -> bytes:
+    """
+    Client-side helper: turn a gateway-shaped JSON request into the Arrow
+    stream /analyze accepts. Used by the load-test harness and as the
+    reference for the gateway's encoder.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed (brain[arrow])")
+
+    columns: Dict[str, List[Any]] = {name: [] for name in ARROW_COLUMNS}
+    envelope = dict(payload)
+    envelope["accounts"] = []
+    for account in payload.get("accounts", []):
+        for txn in account.get("transactions", []):
+            columns["account_id"].append(account["account_id"])
+            columns["date"].append(parse_timestamp(txn.get("date")))
+            columns["amount"].append(txn.get("amount"))
+            columns["type"].append(txn.get("type"))
+            columns["balance"].append(txn.get("balance"))
+            columns["narration"].append(txn.get("narration"))
+        envelope["accounts"].append({k: v for k, v in account.items() if k != "transactions"})
+
+    schema = pa.schema(
+        [
+            ("account_id", pa.string()),
+            ("date",       pa.timestamp("s", tz="UTC")),
+            ("amount",     pa.float64()),
+            ("type",       pa.string()),
+            ("balance",    pa.float64()),
+            ("narration",  pa.string()),
+        ],
+        metadata={ARROW_METADATA_KEY: json.dumps(envelope).encode()},
+    )
+    table = pa.Table.from_pydict(columns, schema=schema)
+
+    sink = pa.BufferOutputStream()
+    with pa_ipc.new_stream(sink, schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
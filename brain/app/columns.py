@@ -0,0 +1,315 @@
+"""
+Columnar view of an application's transactions.
+
+Every transaction-level consumer in the pipeline (income fallback, cash flow,
+account behaviour, account-health knockouts, review triggers) reads from one
+TransactionColumns object instead of re-walking the per-account lists of
+dicts and re-parsing every ISO date string.
+
+Two builders:
+  from_accounts()  one pass over the JSON/MessagePack-decoded dicts.
+  from_arrow()     straight from an Arrow table (see app.codecs); no
+                   per-row Python objects — dates, amounts and balances map
+                   onto NumPy buffers and keyword flags are computed with
+                   pyarrow.compute.
+
+Narrations are not retained: the keyword scans the pipeline needs are
+evaluated once at build time and stored as boolean columns.
+
+Dates are held as datetime64[s] in UTC; NaT marks a missing or unparseable
+date (such rows are skipped by the month-bucketed features, exactly as the
+dict-based code skipped them).
+
+Analysis window: when the request's RiskPolicy sets analysis_window_months,
+both builders drop rows dated before the window (the current calendar month
+and the N-1 before it) as soon as their date is known, before any narration
+is lowered or scanned. Only the count of dropped rows and each account's
+earliest dropped date are kept (AnalysisWindow), so account age still
+reaches back to the first transaction. Undated rows are kept.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+
+GAMBLING_KEYWORDS = ("bet", "betway", "sporty", "sportpesa", "nairabet",
+                     "lotto", "stake", "casino", "1xbet", "22bet", "winning")
+LOANAPP_KEYWORDS  = ("carbon", "fairmoney", "branch", "palmcredit", "aella",
+                     "quickcheck", "migo", "okash", "lcredit", "renmoney")
+SALARY_KEYWORDS   = ("salary", "payroll", "wages", "stipend", "allowance",
+                     "monthly pay", "staff pay")
+BOUNCE_KEYWORDS   = ("insufficient", "bounced", "returned", "unable to process", "failed debit")
+KNOCKOUT_BOUNCE_KEYWORDS = ("insufficient", "bounced", "returned", "unable to process")
+HIGH_RISK_KEYWORDS = GAMBLING_KEYWORDS + LOANAPP_KEYWORDS
+
+KIND_DEBIT  = -1
+KIND_OTHER  = 0
+KIND_CREDIT = 1
+
+NAT_INT = np.iinfo(np.int64).min   # bit pattern of datetime64 NaT
+
+
+def parse_timestamp(value: Any) -> Optional[int]:
+    """ISO-8601 string (Mono format, 'Z' suffix allowed) → UTC epoch seconds."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def window_start(months: Optional[int], now: Optional[np.datetime64] = None) -> Optional[np.datetime64]:
+    """First instant of an N-month analysis window ending in the current month; None for no window."""
+    if not months or months <= 0:
+        return None
+    if now is None:
+        now = np.datetime64(int(datetime.now().timestamp()), "s")
+    return (now.astype("datetime64[M]") - (months - 1)).astype("datetime64[s]")
+
+
+def request_window_start(request: Any) -> Optional[np.datetime64]:
+    policy = request.risk_policy
+    return window_start(policy.analysis_window_months if policy is not None else None)
+
+
+def _contains_any(text: str, keywords: Sequence[str]) -> bool:
+    return any(kw in text for kw in keywords)
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass
+class AnalysisWindow:
+    """What the analysis window dropped at ingestion."""
+    since:    np.datetime64   # rows dated before this were dropped
+    dropped:  int             # exact number of dropped rows
+    first_at: np.ndarray      # datetime64[s] per account — earliest dropped row, NaT if none
+
+    @classmethod
+    def build(cls, since: np.datetime64, account: np.ndarray, ts: np.ndarray, n_accounts: int) -> "AnalysisWindow":
+        """account/ts are the dropped rows (all dated)."""
+        first = np.full(n_accounts, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, account, ts.astype("datetime64[s]").astype(np.int64))
+        first[first == np.iinfo(np.int64).max] = NAT_INT
+        return cls(since=since, dropped=int(len(ts)), first_at=first.view("datetime64[s]"))
+
+    def first_dropped(self, indexes: Sequence[int]) -> Optional[int]:
+        """Earliest dropped date (epoch seconds) across the given account indexes."""
+        first = self.first_at[list(indexes)]
+        first = first[~np.isnat(first)]
+        return int(first.min().astype(np.int64)) if len(first) else None
+
+
+@dataclass
+class TransactionColumns:
+    account:         np.ndarray   # int32 — index into request.accounts
+    ts:              np.ndarray   # datetime64[s], NaT when missing/unparseable
+    amount:          np.ndarray   # float64
+    balance:         np.ndarray   # float64
+    kind:            np.ndarray   # int8 — KIND_CREDIT / KIND_DEBIT / KIND_OTHER
+    salary_kw:       np.ndarray   # bool — narration matches SALARY_KEYWORDS
+    bounce_kw:       np.ndarray   # bool — narration matches BOUNCE_KEYWORDS
+    ko_bounce_kw:    np.ndarray   # bool — narration matches KNOCKOUT_BOUNCE_KEYWORDS
+    high_risk_kw:    np.ndarray   # bool — gambling or loan-app narration
+    source:          str = "records"
+    window:          Optional[AnalysisWindow] = None
+
+    def __len__(self) -> int:
+        return int(self.amount.shape[0])
+
+    @property
+    def is_credit(self) -> np.ndarray:
+        return self.kind == KIND_CREDIT
+
+    @property
+    def is_debit(self) -> np.ndarray:
+        return self.kind == KIND_DEBIT
+
+    @property
+    def has_date(self) -> np.ndarray:
+        return ~np.isnat(self.ts)
+
+    def months(self) -> np.ndarray:
+        """Month ordinal per row (months since 1970-01); meaningless where ts is NaT."""
+        return self.ts.astype("datetime64[M]").astype(np.int64)
+
+    def count_for_account(self, index: int) -> int:
+        return int(np.count_nonzero(self.account == index))
+
+    @classmethod
+    def empty(cls) -> "TransactionColumns":
+        return cls._from_lists([], [], [], [], [], [], [], [], [])
+
+    @classmethod
+    def from_accounts(
+        cls, accounts: Sequence[Any], since: Optional[np.datetime64] = None,
+    ) -> "TransactionColumns":
+        """Build from AccountData objects whose .transactions are Mono dicts."""
+        account, ts, amount, balance, kind = [], [], [], [], []
+        salary, bounce, ko_bounce, high_risk = [], [], [], []
+        cutoff = None if since is None else int(since.astype("datetime64[s]").astype(np.int64))
+        dropped_account, dropped_ts = [], []
+
+        for idx, acct in enumerate(accounts):
+            for txn in acct.transactions:
+                t = parse_timestamp(txn.get("date"))
+                if cutoff is not None and t is not None and t < cutoff:
+                    dropped_account.append(idx)
+                    dropped_ts.append(t)
+                    continue
+                t_type    = txn.get("type")
+                narration = (txn.get("narration") or "").lower()
+                account.append(idx)
+                ts.append(t)
+                amount.append(_to_float(txn.get("amount", 0)))
+                balance.append(_to_float(txn.get("balance", 0)))
+                kind.append(KIND_CREDIT if t_type == "credit"
+                            else KIND_DEBIT if t_type == "debit" else KIND_OTHER)
+                salary.append(_contains_any(narration, SALARY_KEYWORDS))
+                bounce.append(_contains_any(narration, BOUNCE_KEYWORDS))
+                ko_bounce.append(_contains_any(narration, KNOCKOUT_BOUNCE_KEYWORDS))
+                high_risk.append(_contains_any(narration, HIGH_RISK_KEYWORDS))
+
+        cols = cls._from_lists(account, ts, amount, balance, kind,
+                               salary, bounce, ko_bounce, high_risk)
+        if since is not None:
+            cols.window = AnalysisWindow.build(
+                since,
+                np.asarray(dropped_account, dtype=np.int32),
+                np.asarray(dropped_ts, dtype=np.int64).view("datetime64[s]"),
+                len(accounts),
+            )
+        return cols
+
+    @classmethod
+    def _from_lists(cls, account, ts, amount, balance, kind,
+                    salary, bounce, ko_bounce, high_risk) -> "TransactionColumns":
+        ts_arr = np.array(
+            [NAT_INT if t is None else t for t in ts], dtype=np.int64,
+        ).view("datetime64[s]")
+        return cls(
+            account=np.asarray(account, dtype=np.int32),
+            ts=ts_arr,
+            amount=np.asarray(amount, dtype=np.float64),
+            balance=np.asarray(balance, dtype=np.float64),
+            kind=np.asarray(kind, dtype=np.int8),
+            salary_kw=np.asarray(salary, dtype=bool),
+            bounce_kw=np.asarray(bounce, dtype=bool),
+            ko_bounce_kw=np.asarray(ko_bounce, dtype=bool),
+            high_risk_kw=np.asarray(high_risk, dtype=bool),
+        )
+
+    @classmethod
+    def from_arrow(
+        cls, table: Any, account_ids: List[str], since: Optional[np.datetime64] = None,
+    ) -> "TransactionColumns":
+        """
+        Build from a pyarrow.Table with columns account_id, date, amount,
+        type, balance and (optionally) narration. `date` should be a
+        timestamp column; ISO-8601 strings are accepted as a slower fallback.
+        With `since`, rows dated before it are filtered out of the table
+        before the numeric and narration columns are converted.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        n = table.num_rows
+        index_of = {acct_id: i for i, acct_id in enumerate(account_ids)}
+
+        acct_col = table.column("account_id").cast(pa.string())
+        unknown  = set(pc.unique(acct_col).to_pylist()) - set(index_of)
+        if unknown:
+            raise ValueError(f"transactions reference unknown account_id(s): {sorted(map(str, unknown))}")
+        account = pc.index_in(acct_col, value_set=pa.array(account_ids, pa.string()))
+        account = account.to_numpy(zero_copy_only=False).astype(np.int32)
+
+        ts = cls._arrow_timestamps(table.column("date"), pa, pc)
+
+        window = None
+        if since is not None:
+            old    = ts < since          # NaT compares False: undated rows are kept
+            window = AnalysisWindow.build(since, account[old], ts[old], len(account_ids))
+            if window.dropped:
+                keep    = ~old
+                table   = table.filter(pa.array(keep))
+                account = account[keep]
+                ts      = ts[keep]
+                n       = table.num_rows
+
+        def numeric(name: str) -> np.ndarray:
+            if name not in table.column_names:
+                return np.zeros(n, dtype=np.float64)
+            col = pc.fill_null(table.column(name).cast(pa.float64()), 0.0)
+            return col.to_numpy(zero_copy_only=False)
+
+        t_type = table.column("type").cast(pa.string())
+        kind   = np.zeros(n, dtype=np.int8)
+        kind[pc.fill_null(pc.equal(t_type, "credit"), False).to_numpy(zero_copy_only=False)] = KIND_CREDIT
+        kind[pc.fill_null(pc.equal(t_type, "debit"), False).to_numpy(zero_copy_only=False)]  = KIND_DEBIT
+
+        if "narration" in table.column_names:
+            lowered = pc.utf8_lower(pc.fill_null(table.column("narration").cast(pa.string()), ""))
+
+            def flags(keywords: Sequence[str]) -> np.ndarray:
+                hit = None
+                for kw in keywords:
+                    m   = pc.match_substring(lowered, kw)
+                    hit = m if hit is None else pc.or_(hit, m)
+                return hit.to_numpy(zero_copy_only=False).astype(bool)
+        else:
+            def flags(keywords: Sequence[str]) -> np.ndarray:
+                return np.zeros(n, dtype=bool)
+
+        return cls(
+            account=account,
+            ts=ts,
+            amount=numeric("amount"),
+            balance=numeric("balance"),
+            kind=kind,
+            salary_kw=flags(SALARY_KEYWORDS),
+            bounce_kw=flags(BOUNCE_KEYWORDS),
+            ko_bounce_kw=flags(KNOCKOUT_BOUNCE_KEYWORDS),
+            high_risk_kw=flags(HIGH_RISK_KEYWORDS),
+            source="arrow",
+            window=window,
+        )
+
+    @staticmethod
+    def _arrow_timestamps(col: Any, pa, pc) -> np.ndarray:
+        if pa.types.is_timestamp(col.type):
+            if col.type.tz is None:
+                col = pc.assume_timezone(col, "UTC")
+            secs = pc.cast(col, pa.timestamp("s", tz="UTC"), safe=False)
+            return secs.to_numpy(zero_copy_only=False).astype("datetime64[s]")
+        try:
+            secs = pc.cast(col.cast(pa.string()), pa.timestamp("s", tz="UTC"), safe=False)
+            return secs.to_numpy(zero_copy_only=False).astype("datetime64[s]")
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            parsed = [parse_timestamp(v) for v in col.to_pylist()]
+            return np.array([NAT_INT if t is None else t for t in parsed],
+                            dtype=np.int64).view("datetime64[s]")
+
+
+def transaction_columns(request: Any) -> TransactionColumns:
+    """
+    Return the request's TransactionColumns, building them from the account
+    dicts on first use. Arrow-decoded requests arrive with columns attached.
+    Either way the policy's analysis window is applied while building.
+    """
+    cols: Optional[TransactionColumns] = request._columns
+    if cols is None:
+        cols = TransactionColumns.from_accounts(request.accounts, request_window_start(request))
+        request._columns = cols
+    return cols
@@ -0,0 +1,76 @@
+"""
+Request deadlines.
+
+The gateway gives up on the brain after a fixed timeout. Without a
+deadline the brain would keep scoring for a caller that has already gone.
+The route reads the remaining budget from the X-Brain-Deadline-Ms header
+(or DEADLINE_DEFAULT_MS) and builds a Deadline counted from when the
+request arrived, so time spent queued for admission and decoding is
+charged against it.
+
+  check(stage)   raises DeadlineExceeded once the budget is spent; the
+                 engine calls it between stages, so an expired request
+                 stops at the next stage boundary.
+  near()         less than `degrade_ms` left. The engine then skips the
+                 optional response sections (DEGRADABLE_SECTIONS) and
+                 flags the response as degraded. The decision and score
+                 are unchanged.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+# Response sections dropped near the deadline. None of them feeds the decision.
+DEGRADABLE_SECTIONS = (
+    "eligible_tenors", "explainability", "regulatory_compliance", "risk_factors",
+)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str, budget_ms: float, elapsed_ms: float):
+        super().__init__(f"deadline of {budget_ms:.0f} ms exceeded before {stage} ({elapsed_ms:.0f} ms elapsed)")
+        self.stage      = stage
+        self.budget_ms  = budget_ms
+        self.elapsed_ms = elapsed_ms
+
+
+@dataclass
+class Deadline:
+    started_at: float          # time.perf_counter() when the request arrived
+    budget_ms:  float
+    degrade_ms: float = 0.0
+
+    @classmethod
+    def from_header(
+        cls,
+        value: Optional[str],
+        started_at: float,
+        default_ms: float = 0.0,
+        degrade_ms: float = 0.0,
+    ) -> Optional["Deadline"]:
+        """None when neither the header nor a default sets a budget; ValueError if malformed."""
+        if value is None or value.strip() == "":
+            budget = default_ms
+        else:
+            try:
+                budget = float(value)
+            except ValueError:
+                raise ValueError(f"X-Brain-Deadline-Ms must be a number of milliseconds, got '{value}'")
+        if budget <= 0:
+            return None
+        return cls(started_at=started_at, budget_ms=budget, degrade_ms=degrade_ms)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def remaining_ms(self) -> float:
+        return self.budget_ms - self.elapsed_ms()
+
+    def check(self, stage: str) -> None:
+        elapsed = self.elapsed_ms()
+        if elapsed >= self.budget_ms:
+            raise DeadlineExceeded(stage, self.budget_ms, elapsed)
+
+    def near(self) -> bool:
+        return self.remaining_ms() < self.degrade_ms
@@ -2,11 +2,15 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime
 import logging
 
+import numpy as np
+
 from app.models import (
     AnalyzeRequest, AnalyzeResponse, ScoreBreakdown, RiskFactor,
     ApprovalDetails, CounterOffer, EligibleTenor, Explainability,
-    RegulatoryCompliance, RiskPolicy,
+    RegulatoryCompliance, RiskPolicy, DecisionTrace, TraceAffordability,
+    TraceCap, TraceGate, TraceTrigger,
 )
+from app.state import transaction_aggregates
 from app.scoring import CreditScorer
 
 logger = logging.getLogger(__name__)
@@ -27,6 +31,14 @@ class DecisionEngine:
     6. Stage 5 manual review triggers (borderline score, high value, conflicting signals).
     7. Build explainability and regulatory compliance fields.
     8. Return fully assembled AnalyzeResponse.
+
+    Sections the request's `fields` projection leaves out (risk factors,
+    eligible tenors, explainability, regulatory compliance, ...) are skipped
+    rather than built and dropped; the decision itself is unaffected.
+
+    Every gate, cap, affordability figure and trigger is recorded on the
+    DecisionTrace passed in by the orchestrator rather than logged line by
+    line; AnalysisEngine emits the trace as a single record.
     """
 
     def __init__(self):
@@ -39,24 +51,26 @@ class DecisionEngine:
         score: int,
         score_breakdown: Dict[str, float],
         policy: RiskPolicy,
+        trace: Optional[DecisionTrace] = None,
     ) -> AnalyzeResponse:
 
-        aid = request.applicant_id
+        if trace is None:
+            trace = DecisionTrace(applicant_id=request.applicant_id)
         is_thin_file = features.get("is_thin_file", True)
+        with_risks   = request.wants("risk_factors")
 
         monthly_income = features.get("total_monthly_income", 0.0)
         avg_credits    = features.get("monthly_avg_credits", 0.0)
         safe_income    = min(monthly_income, avg_credits) if monthly_income > 0 else avg_credits
-        max_monthly_payment = safe_income * AFFORDABILITY_CAP
-
-        logger.info(
-            f"[INCOME] applicant={aid} "
-            f"webhook_income=₦{monthly_income:,.0f} "
-            f"avg_credits=₦{avg_credits:,.0f} "
-            f"safe_income=₦{safe_income:,.0f} "
-            f"affordability_cap=₦{max_monthly_payment:,.0f} "
-            f"({policy.affordability_cap * 100:.0f}% of income)"
+        max_monthly_payment = safe_income * policy.affordability_cap
+
+        affordability = TraceAffordability(
+            webhook_income=monthly_income,
+            avg_credits=avg_credits,
+            safe_income=safe_income,
+            max_monthly_payment=max_monthly_payment,
         )
+        trace.affordability = affordability
 
         risk_factors:          List[RiskFactor] = []
         manual_review_reasons: List[str]        = []
@@ -64,16 +78,16 @@ class DecisionEngine:
         approval_details: Optional[ApprovalDetails] = None
         counter_offer:    Optional[CounterOffer]    = None
 
-        self._collect_risk_factors(features, risk_factors)
+        if with_risks:
+            self._collect_risk_factors(features, risk_factors)
 
 
         if score < policy.score_reject_floor:
             decision = "REJECTED"
-            logger.warning(
-                f"[SCORE GATE] applicant={aid} score={score} "
-                f"threshold={policy.score_reject_floor} outcome=REJECTED "
-                f"reason=score_below_floor"
-            )
+            trace.gates.append(TraceGate(
+                gate="score_reject_floor", value=score,
+                threshold=policy.score_reject_floor, outcome=decision,
+            ))
         elif score < policy.score_manual_floor:
             decision = "MANUAL_REVIEW"
             reason = (
@@ -82,34 +96,33 @@ class DecisionEngine:
                 "Requires human assessment."
             )
             manual_review_reasons.append(reason)
-            logger.warning(
-                f"[SCORE GATE] applicant={aid} score={score} "
-                f"band=HIGH_RISK outcome=MANUAL_REVIEW"
-            )
+            trace.gates.append(TraceGate(
+                gate="score_manual_floor", value=score,
+                threshold=policy.score_manual_floor, outcome=decision,
+            ))
         elif score < policy.score_approve_floor:
             decision = "COUNTER_OFFER"
-            logger.info(
-                f"[SCORE GATE] applicant={aid} score={score} "
-                f"band=MEDIUM_RISK outcome=COUNTER_OFFER_ELIGIBLE"
-            )
+            trace.gates.append(TraceGate(
+                gate="score_approve_floor", value=score,
+                threshold=policy.score_approve_floor, outcome="COUNTER_OFFER_ELIGIBLE",
+            ))
         else:
-            logger.info(
-                f"[SCORE GATE] applicant={aid} score={score} "
-                f"outcome=APPROVED_ELIGIBLE"
-            )
+            trace.gates.append(TraceGate(
+                gate="score_approve_floor", value=score,
+                threshold=policy.score_approve_floor, outcome="APPROVED_ELIGIBLE",
+            ))
 
         if safe_income <= 0:
             decision = "REJECTED"
-            logger.error(
-                f"[INCOME FAIL] applicant={aid} "
-                f"safe_income=0 outcome=REJECTED "
-                f"reason=no_verifiable_income"
-            )
-            risk_factors.append(RiskFactor(
-                factor="No verifiable income",
-                severity="HIGH",
-                detail="Could not establish a positive monthly income from available data",
+            trace.gates.append(TraceGate(
+                gate="safe_income", value=safe_income, threshold=0.0, outcome=decision,
             ))
+            if with_risks:
+                risk_factors.append(RiskFactor(
+                    factor="No verifiable income",
+                    severity="HIGH",
+                    detail="Could not establish a positive monthly income from available data",
+                ))
 
 
         effective_amount = request.loan_amount
@@ -123,105 +136,87 @@ class DecisionEngine:
                 effective_amount = thin_file_max
                 if decision == "APPROVED":
                     decision = "COUNTER_OFFER"
-                logger.warning(
-                    f"[THIN FILE CAP] applicant={aid} "
-                    f"amount_before=₦{old_amount:,.0f} "
-                    f"amount_after=₦{effective_amount:,.0f} "
-                    f"cap={policy.thin_file_income_multiple}x_monthly_income "
-                    f"decision_updated={decision}"
-                )
-                risk_factors.append(RiskFactor(
-                    factor="Thin credit file — loan amount capped",
-                    severity="MEDIUM",
-                    detail=(
-                        f"No credit history. Amount capped at "
-                        f"{policy.thin_file_income_multiple}× monthly income "
-                        f"(₦{thin_file_max:,.0f})"
-                    ),
+                trace.caps.append(TraceCap(
+                    cap="thin_file_amount", before=old_amount, after=effective_amount,
                 ))
+                if with_risks:
+                    risk_factors.append(RiskFactor(
+                        factor="Thin credit file — loan amount capped",
+                        severity="MEDIUM",
+                        detail=(
+                            f"No credit history. Amount capped at "
+                            f"{policy.thin_file_income_multiple}× monthly income "
+                            f"(₦{thin_file_max:,.0f})"
+                        ),
+                    ))
 
             if effective_tenor > policy.thin_file_max_tenor:
                 old_tenor       = effective_tenor
                 effective_tenor = policy.thin_file_max_tenor
                 if decision == "APPROVED":
                     decision = "COUNTER_OFFER"
-                logger.warning(
-                    f"[THIN FILE CAP] applicant={aid} "
-                    f"tenor_before={old_tenor}m "
-                    f"tenor_after={effective_tenor}m "
-                    f"cap={policy.thin_file_max_tenor}m decision_updated={decision}"
-                )
-                risk_factors.append(RiskFactor(
-                    factor="Thin credit file — tenor capped",
-                    severity="MEDIUM",
-                    detail=(
-                        f"No credit history. Tenor capped at "
-                        f"{policy.thin_file_max_tenor} months"
-                    ),
+                trace.caps.append(TraceCap(
+                    cap="thin_file_tenor", before=old_tenor, after=effective_tenor,
                 ))
+                if with_risks:
+                    risk_factors.append(RiskFactor(
+                        factor="Thin credit file — tenor capped",
+                        severity="MEDIUM",
+                        detail=(
+                            f"No credit history. Tenor capped at "
+                            f"{policy.thin_file_max_tenor} months"
+                        ),
+                    ))
 
         if decision not in ("REJECTED",) and safe_income > 0:
             effective_payment = self._scorer._amortize(
                 effective_amount, effective_tenor, request.interest_rate
             )
 
-            logger.info(
-                f"[AFFORDABILITY] applicant={aid} "
-                f"amount=₦{effective_amount:,.0f} tenor={effective_tenor}m "
-                f"monthly_payment=₦{effective_payment:,.0f} "
-                f"cap=₦{max_monthly_payment:,.0f} "
-                f"utilisation={effective_payment / max_monthly_payment * 100:.1f}% "
-                f"result={'PASS' if effective_payment <= max_monthly_payment else 'FAIL'}"
-            )
+            affordability.amount          = effective_amount
+            affordability.tenor_months    = effective_tenor
+            affordability.monthly_payment = effective_payment
+            affordability.passed          = effective_payment <= max_monthly_payment
 
             if effective_payment > max_monthly_payment:
-                max_affordable = self._max_affordable_amount(
-                    max_monthly_payment, effective_tenor, request.interest_rate
-                )
                 min_viable = request.loan_amount * policy.min_viable_offer_ratio
-
-                logger.info(
-                    f"[COUNTER OFFER CALC] applicant={aid} "
-                    f"max_affordable=₦{max_affordable:,.0f} "
-                    f"min_viable=₦{min_viable:,.0f} "
-                    f"viable={max_affordable >= min_viable}"
+                amount_cap = effective_amount
+                tenor_cap  = (
+                    policy.thin_file_max_tenor if is_thin_file
+                    else max(STANDARD_TENORS[-1], effective_tenor)
                 )
+                offer, max_affordable = self._optimise_counter_offer(
+                    max_monthly_payment, request.interest_rate, min_viable,
+                    amount_cap, tenor_cap, effective_tenor, policy.counter_offer_objective,
+                )
+                affordability.max_affordable = max_affordable
+                affordability.min_viable     = min_viable
+                affordability.objective      = policy.counter_offer_objective
 
-                if max_affordable < min_viable:
+                if offer is None:
                     decision = "REJECTED"
-                    logger.warning(
-                        f"[AFFORDABILITY FAIL] applicant={aid} "
-                        f"max_affordable=₦{max_affordable:,.0f} "
-                        f"min_viable=₦{min_viable:,.0f} "
-                        f"outcome=REJECTED reason=counter_offer_below_minimum"
-                    )
-                    risk_factors.append(RiskFactor(
-                        factor="Insufficient repayment capacity",
-                        severity="HIGH",
-                        detail=(
-                            f"Monthly payment would be ₦{effective_payment:,.0f} "
-                            f"but capacity is ₦{max_monthly_payment:,.0f}"
-                        ),
+                    trace.gates.append(TraceGate(
+                        gate="min_viable_offer", value=max_affordable,
+                        threshold=min_viable, outcome=decision,
                     ))
+                    if with_risks:
+                        risk_factors.append(RiskFactor(
+                            factor="Insufficient repayment capacity",
+                            severity="HIGH",
+                            detail=(
+                                f"Monthly payment would be ₦{effective_payment:,.0f} "
+                                f"but capacity is ₦{max_monthly_payment:,.0f}"
+                            ),
+                        ))
                 else:
                     decision = "COUNTER_OFFER"
-                    co_payment = self._scorer._amortize(
-                        max_affordable, effective_tenor, request.interest_rate
-                    )
+                    offered_amount, offered_tenor, co_payment = offer
+                    affordability.offered_tenor = offered_tenor
                     counter_offer = CounterOffer(
-                        offered_amount=round(max_affordable, 2),
-                        offered_tenor=effective_tenor,
+                        offered_amount=round(offered_amount, 2),
+                        offered_tenor=offered_tenor,
                         monthly_payment=round(co_payment, 2),
-                        reason=(
-                            f"Requested amount exceeds repayment capacity. "
-                            f"Maximum affordable at current income: ₦{max_affordable:,.0f}"
-                        ),
-                    )
-                    logger.info(
-                        f"[COUNTER OFFER] applicant={aid} "
-                        f"offered_amount=₦{max_affordable:,.0f} "
-                        f"offered_tenor={effective_tenor}m "
-                        f"monthly_payment=₦{co_payment:,.0f}"
+                        reason=self._counter_offer_reason(request, offered_amount, offered_tenor),
                     )
             else:
                 if decision in ("APPROVED", "COUNTER_OFFER") and not counter_offer:
@@ -253,10 +248,9 @@ class DecisionEngine:
                         f"decision threshold ({threshold})"
                     )
                     manual_review_reasons.append(reason)
-                    logger.info(
-                        f"[MANUAL TRIGGER] applicant={aid} "
-                        f"trigger=borderline_score score={score} threshold={threshold}"
-                    )
+                    trace.triggers.append(TraceTrigger(
+                        trigger="borderline_score", value=score, threshold=threshold,
+                    ))
                     break
 
             if request.loan_amount > policy.high_value_threshold:
@@ -265,60 +259,55 @@ class DecisionEngine:
                     f"high-value threshold of ₦{policy.high_value_threshold:,.0f}"
                 )
                 manual_review_reasons.append(reason)
-                logger.info(
-                    f"[MANUAL TRIGGER] applicant={aid} "
-                    f"trigger=high_value "
-                    f"amount=₦{request.loan_amount:,.0f} "
-                    f"threshold=₦{policy.high_value_threshold:,.0f}"
-                )
+                trace.triggers.append(TraceTrigger(
+                    trigger="high_value", value=request.loan_amount,
+                    threshold=policy.high_value_threshold,
+                ))
 
-            total_txns = sum(len(a.transactions) for a in request.accounts)
+            total_txns = transaction_aggregates(request).transaction_count
             if total_txns < 20:
                 reason = (
                     f"Limited transaction history ({total_txns} transactions). "
                     "Assessment may not be fully reliable."
                 )
                 manual_review_reasons.append(reason)
-                logger.warning(
-                    f"[MANUAL TRIGGER] applicant={aid} "
-                    f"trigger=limited_transactions count={total_txns}"
-                )
+                trace.triggers.append(TraceTrigger(
+                    trigger="limited_transactions", value=total_txns, threshold=20,
+                ))
 
             if manual_review_reasons and decision == "APPROVED":
                 decision = "MANUAL_REVIEW"
-                logger.info(
-                    f"[ESCALATION] applicant={aid} "
-                    f"approved→MANUAL_REVIEW triggers={len(manual_review_reasons)}"
-                )
 
-        logger.info(
-            f"[DECISION] applicant={aid} "
-            f"decision={decision} score={score} "
-            f"thin_file={is_thin_file} "
-            f"risk_factors={len(risk_factors)} "
-            f"manual_triggers={len(manual_review_reasons)}"
-        )
-
-        regulatory = RegulatoryCompliance(
-            identity_verified=any(a.identity is not None for a in request.accounts),
-            credit_bureau_checked=request.credit_history is not None,
-            affordability_assessed=safe_income > 0,
-            thin_file=is_thin_file,
-        )
+        trace.decision  = decision
+        trace.score     = score
+        trace.thin_file = is_thin_file
+
+        regulatory = None
+        if request.wants("regulatory_compliance"):
+            regulatory = RegulatoryCompliance(
+                identity_verified=any(a.identity is not None for a in request.accounts),
+                credit_bureau_checked=request.credit_history is not None,
+                affordability_assessed=safe_income > 0,
+                thin_file=is_thin_file,
+            )
 
-        eligible_tenors = self._compute_eligible_tenors(
-            max_monthly_payment, request.interest_rate, is_thin_file, policy
-        )
+        eligible_tenors = []
+        if request.wants("eligible_tenors"):
+            eligible_tenors = self._compute_eligible_tenors(
+                max_monthly_payment, request.interest_rate, is_thin_file, policy
+            )
 
-        explainability = self._build_explainability(
-            features, score, score_breakdown, decision, is_thin_file, policy
-        )
+        explainability = None
+        if request.wants("explainability"):
+            explainability = self._build_explainability(
+                features, score, score_breakdown, decision, is_thin_file, policy
+            )
 
         return AnalyzeResponse(
             applicant_id=request.applicant_id,
             decision=decision,
             score=score,
-            score_band=self._scorer.get_score_band(score),
+            score_band=self._scorer.get_score_band(score) if request.wants("score_band") else None,
             score_breakdown=ScoreBreakdown(
                 credit_history=score_breakdown.get("credit_history", 0.0),
                 income_stability=score_breakdown.get("income_stability", 0.0),
@@ -326,7 +315,7 @@ class DecisionEngine:
                 debt_service_capacity=score_breakdown.get("debt_service_capacity", 0.0),
                 account_behavior=score_breakdown.get("account_behavior", 0.0),
                 total=score,
-            ),
+            ) if request.wants("score_breakdown") else None,
             risk_factors=risk_factors,
             approval_details=approval_details,
             counter_offer=counter_offer,
@@ -334,7 +323,7 @@ class DecisionEngine:
             manual_review_reasons=manual_review_reasons,
             regulatory_compliance=regulatory,
             explainability=explainability,
-            timestamp=datetime.utcnow().isoformat() + "Z",
+            timestamp=datetime.utcnow().isoformat() + "Z" if request.wants("timestamp") else None,
         )
 
 
@@ -348,6 +337,75 @@ class DecisionEngine:
         r = (annual_rate_pct / 100.0) / 12.0
         return max_payment * ((1 + r) ** tenor - 1) / (r * (1 + r) ** tenor)
 
+    def _optimise_counter_offer(
+        self,
+        max_payment: float,
+        rate: float,
+        min_viable: float,
+        amount_cap: float,
+        tenor_cap: int,
+        requested_tenor: int,
+        objective: str,
+    ):
+        """
+        Best (amount, tenor, payment) within the caps, or None, plus the
+        largest affordable amount at any candidate tenor.
+
+        Candidate tenors are the standard ones up to `tenor_cap` and the
+        requested one. The candidate amounts are each tenor's affordable
+        maximum (clipped to `amount_cap`) and, for lowest_payment, the
+        smallest viable amount. The whole amount × tenor grid is priced in
+        one pass; an offer is feasible when its payment is within
+        `max_payment` and its amount is between `min_viable` and `amount_cap`.
+
+          closest_amount  largest amount, then the tenor nearest the request
+          lowest_payment  lowest monthly payment, then the largest amount
+          closest_tenor   the tenor nearest the request, then the largest amount
+        """
+        tenors = np.array(
+            sorted({t for t in STANDARD_TENORS if t <= tenor_cap} | {requested_tenor}),
+            dtype=np.int64,
+        )
+        frontier = np.minimum(
+            _max_affordable_amounts(max_payment, tenors, rate), amount_cap
+        )
+        max_affordable = float(frontier.max(initial=0.0))
+
+        candidates = frontier
+        if objective == "lowest_payment" and 0 < min_viable <= amount_cap:
+            candidates = np.append(frontier, min_viable)
+        amounts, grid_tenors = np.meshgrid(np.unique(candidates), tenors, indexing="ij")
+        amounts, grid_tenors = amounts.ravel(), grid_tenors.ravel()
+        payments = self._scorer._amortize_batch(amounts, grid_tenors, np.full(len(amounts), rate))
+        feasible = (
+            (payments <= max_payment * (1 + 1e-9))
+            & (amounts >= min_viable)
+            & (amounts > 0)
+        )
+        if not feasible.any():
+            return None, max_affordable
+
+        amounts, grid_tenors, payments = amounts[feasible], grid_tenors[feasible], payments[feasible]
+        distance = np.abs(grid_tenors - requested_tenor)
+        if objective == "lowest_payment":
+            keys = (-amounts, payments)
+        elif objective == "closest_tenor":
+            keys = (payments, -amounts, distance)
+        else:
+            keys = (payments, distance, -amounts)
+        best = np.lexsort(keys)[0]
+        return (float(amounts[best]), int(grid_tenors[best]), float(payments[best])), max_affordable
+
+    @staticmethod
+    def _counter_offer_reason(request: AnalyzeRequest, amount: float, tenor: int) -> str:
+        """Say what the counter-offer changed: the amount, the tenor or both."""
+        offer = f"₦{amount:,.0f} over {tenor} months"
+        if tenor != request.tenor_months:
+            offer += f" instead of {request.tenor_months}"
+        if round(amount, 2) >= request.loan_amount:
+            return f"Requested amount fits repayment capacity over a different tenor. Offer at current income: {offer}"
+        return f"Requested amount exceeds repayment capacity. Best affordable offer at current income: {offer}"
+
     def _compute_eligible_tenors(
         self, max_monthly_payment: float, rate: float, is_thin_file: bool,
         policy: RiskPolicy,
@@ -491,3 +549,17 @@ class DecisionEngine:
             key_strengths=strengths[:4],
             key_weaknesses=weaknesses[:4],
         )
+
+
+def _max_affordable_amounts(max_payment: float, tenors: np.ndarray, annual_rate_pct: float) -> np.ndarray:
+    """DecisionEngine._max_affordable_amount() for every tenor in `tenors`."""
+    tenors = np.asarray(tenors, dtype=np.float64)
+    if max_payment <= 0:
+        return np.zeros(len(tenors))
+    if annual_rate_pct == 0:
+        amounts = max_payment * tenors
+    else:
+        r       = (annual_rate_pct / 100.0) / 12.0
+        growth  = (1 + r) ** tenors
+        amounts = max_payment * (growth - 1) / (r * growth)
+    return np.where(tenors > 0, amounts, 0.0)
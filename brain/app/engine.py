@@ -1,15 +1,24 @@
 import logging
+import random
 import time
 from datetime import datetime
+from typing import List, Optional
 
+from app.deadline import DEGRADABLE_SECTIONS, Deadline
 from app.models import (
     AnalyzeRequest, AnalyzeResponse, ScoreBreakdown, RiskFactor,
-    Explainability, RegulatoryCompliance, RiskPolicy,
+    Explainability, RegulatoryCompliance, RiskPolicy, DecisionTrace, TraceKnockout,
+    TraceWindow, RESPONSE_SECTIONS,
 )
-from app.knockout import KnockoutEngine
+from app.knockout import KnockoutEngine, KnockoutResult
+from app.memory import RequestMemory
 from app.features import FeatureExtractor
 from app.scoring import CreditScorer
 from app.decision import DecisionEngine
+from app.sensitivity import policy_gates, score_sensitivity
+from app.shadow import ShadowRunner
+from app.state import feature_state
+from app.logging_config import fields
 
 
 logger = logging.getLogger(__name__)
@@ -28,6 +37,39 @@ class AnalysisEngine:
     Stages 4 and 5 are co-located inside DecisionEngine.decide() — they share the
     same data and are executed atomically so the review triggers can see the
     tentative decision before it is finalised.
+
+    Each run accumulates a DecisionTrace. It is logged as one "[DECISION TRACE]"
+    record for a `trace_sample_rate` fraction of requests and attached to the
+    response when the request sets include_trace.
+
+    Transaction aggregates are folded into a FeatureState (app.state); it is
+    returned when the request sets include_feature_state, so the caller can
+    send it back and have only new transactions folded in next time.
+
+    With a Deadline (app.deadline), analyze() checks the remaining budget
+    before each stage and raises DeadlineExceeded once it is spent; close to
+    the deadline it skips the optional response sections and marks the
+    response degraded. With a RequestMemory (app.memory), each stage's peak
+    allocation is recorded at the same boundaries and a stage above the
+    ceiling raises MemoryCeilingExceeded.
+
+    A RiskPolicy analysis window drops old transactions while the columns are
+    built (app.columns); the trace records how many.
+
+    With include_sensitivity, the explainability section also carries the
+    score's sensitivity to each tiered scorecard input (app.sensitivity),
+    scored in one batch after the decision.
+
+    Scoring uses the request's scorecard_version, or the active scorecard
+    (app.scorecard); the version is recorded in the trace and breakdown.
+
+    When `shadow` is set (app.shadow), every scored request is also handed
+    to the candidate scorer/decision engine in the background, reusing the
+    extracted features; the response never waits for it.
+
+    screen() runs only the knockouts that read no transactions. The API calls
+    it on a request decoded without them (codecs.decode_staged) and answers a
+    rejection straight away; otherwise analyze() runs the full pipeline.
     """
 
     _knockout  = KnockoutEngine()
@@ -35,48 +77,141 @@ class AnalysisEngine:
     _scorer    = CreditScorer()
     _decision  = DecisionEngine()
 
+    trace_sample_rate: float = 1.0
+    shadow: Optional[ShadowRunner] = None
+
     @classmethod
-    def analyze(cls, request: AnalyzeRequest) -> AnalyzeResponse:
+    def screen(cls, request: AnalyzeRequest) -> Optional[AnalyzeResponse]:
+        """The REJECTED response if a transaction-free knockout fires, else None."""
         t0 = time.perf_counter()
 
-        logger.info(
-            f"[PIPELINE START] applicant={request.applicant_id} "
-            f"loan=₦{request.loan_amount:,.0f} tenor={request.tenor_months}m "
-            f"rate={request.interest_rate}% accounts={len(request.accounts)}"
-        )
+        policy    = request.risk_policy or RiskPolicy()
+        ko_result = cls._knockout.screen(request, policy)
+        if not ko_result.knocked_out:
+            return None
+        return cls._knocked_out(request, ko_result, DecisionTrace(applicant_id=request.applicant_id), t0)
+
+    @classmethod
+    def analyze(
+        cls,
+        request: AnalyzeRequest,
+        deadline: Optional[Deadline] = None,
+        memory: Optional[RequestMemory] = None,
+    ) -> AnalyzeResponse:
+        t0 = time.perf_counter()
 
         policy = request.risk_policy or RiskPolicy()
+        trace  = DecisionTrace(applicant_id=request.applicant_id)
 
+        cls._stage("knockout", deadline, memory)
         ko_result = cls._knockout.run(request, policy)
         if ko_result.knocked_out:
-            duration_ms = (time.perf_counter() - t0) * 1000
-            logger.warning(
-                f"[PIPELINE END] applicant={request.applicant_id} "
-                f"outcome=KNOCKOUT reason={ko_result.reason} "
-                f"duration_ms={duration_ms:.1f}"
-            )
-            return cls._build_knockout_response(request, ko_result.reason, ko_result.detail)
+            return cls._knocked_out(request, ko_result, trace, t0)
 
+        cls._stage("features", deadline, memory)
         features = cls._extractor.extract(request)
+        trace.income_source = features.get("income_source")
 
+        cls._stage("scoring", deadline, memory)
+        scorecard = cls._scorer.scorecard(request.scorecard_version)
+        trace.scorecard_version = scorecard.version
         score, score_breakdown = cls._scorer.calculate(
             features,
             request.loan_amount,
             request.tenor_months,
             request.interest_rate,
+            scorecard=scorecard,
         )
 
-        response = cls._decision.decide(request, features, score, score_breakdown, policy)
+        trace.score_breakdown = score_breakdown
 
-        duration_ms = (time.perf_counter() - t0) * 1000
-        logger.info(
-            f"[PIPELINE END] applicant={request.applicant_id} "
-            f"decision={response.decision} score={response.score} "
-            f"band={response.score_band} "
-            f"manual_triggers={len(response.manual_review_reasons)} "
-            f"duration_ms={duration_ms:.1f}"
-        )
+        degraded = None
+        cls._stage("decision", deadline, memory)
+        if deadline is not None and deadline.near():
+            degraded = cls._degrade(request)
+            trace.degraded = degraded
+
+        response = cls._decision.decide(request, features, score, score_breakdown, policy, trace)
+        response.degraded = degraded
+        if request.include_sensitivity and response.explainability is not None:
+            response.explainability.sensitivity = score_sensitivity(
+                scorecard,
+                cls._scorer.scorecard_inputs(
+                    features, request.loan_amount, request.tenor_months, request.interest_rate,
+                ),
+                bool(features.get("is_thin_file", True)),
+                score,
+                policy_gates(policy),
+            )
+        if response.score_breakdown is not None:
+            response.score_breakdown.scorecard_version = scorecard.version
+        if cls.shadow is not None:
+            cls.shadow.submit(request, features, policy, response, score_breakdown)
+        return cls._finish(request, response, trace, t0, logging.INFO)
+
+    @staticmethod
+    def _stage(stage: str, deadline: Optional[Deadline], memory: Optional[RequestMemory]) -> None:
+        """Stage boundary: the deadline and the memory ceiling are checked here."""
+        if deadline is not None:
+            deadline.check(stage)
+        if memory is not None:
+            memory.enter(stage)
+
+    @staticmethod
+    def _degrade(request: AnalyzeRequest) -> Optional[List[str]]:
+        """Drop the optional sections still requested; returns the ones dropped, None if none were."""
+        wanted  = list(request.fields) if request.fields is not None else list(RESPONSE_SECTIONS)
+        dropped = [s for s in wanted if s in DEGRADABLE_SECTIONS]
+        if not dropped:
+            return None
+        request.fields = [s for s in wanted if s not in DEGRADABLE_SECTIONS]
+        return dropped
+
+    @classmethod
+    def _knocked_out(
+        cls,
+        request: AnalyzeRequest,
+        ko_result: KnockoutResult,
+        trace: DecisionTrace,
+        t0: float,
+    ) -> AnalyzeResponse:
+        response = cls._build_knockout_response(request, ko_result.reason, ko_result.detail)
+        trace.knockout = TraceKnockout(reason=ko_result.reason, detail=ko_result.detail)
+        trace.decision = response.decision
+        trace.score    = response.score
+        return cls._finish(request, response, trace, t0, logging.WARNING)
+
+    @classmethod
+    def _finish(
+        cls,
+        request: AnalyzeRequest,
+        response: AnalyzeResponse,
+        trace: DecisionTrace,
+        t0: float,
+        level: int,
+    ) -> AnalyzeResponse:
+        """Stamp the duration, emit the sampled trace record and attach it if requested."""
+        trace.duration_ms = round((time.perf_counter() - t0) * 1000, 1)
+        window = request._columns.window if request._columns is not None else None
+        if window is not None:
+            trace.window = TraceWindow(
+                months=request.risk_policy.analysis_window_months,
+                since=str(window.since.astype("datetime64[D]")),
+                dropped=window.dropped,
+            )
+
+        sampled = cls.trace_sample_rate >= 1.0 or random.random() < cls.trace_sample_rate
+        if sampled and logger.isEnabledFor(level):
+            logger.log(
+                level,
+                "[DECISION TRACE]",
+                extra=fields(**trace.model_dump(exclude_none=True)),
+            )
 
+        if request.include_trace:
+            response.trace = trace
+        if request.include_feature_state:
+            response.feature_state = feature_state(request)
         return response
 
     @classmethod
@@ -90,7 +225,7 @@ class AnalysisEngine:
             applicant_id=request.applicant_id,
             decision="REJECTED",
             score=350,
-            score_band="VERY_HIGH_RISK",
+            score_band="VERY_HIGH_RISK" if request.wants("score_band") else None,
             score_breakdown=ScoreBreakdown(
                 credit_history=0.0,
                 income_stability=0.0,
@@ -98,14 +233,14 @@ class AnalysisEngine:
                 debt_service_capacity=0.0,
                 account_behavior=0.0,
                 total=350,
-            ),
+            ) if request.wants("score_breakdown") else None,
             risk_factors=[
                 RiskFactor(
                     factor=reason,
                     severity="HIGH",
                     detail=detail or reason,
                 )
-            ],
+            ] if request.wants("risk_factors") else [],
             approval_details=None,
             counter_offer=None,
             eligible_tenors=[],
@@ -115,11 +250,11 @@ class AnalysisEngine:
                 credit_bureau_checked=request.credit_history is not None,
                 affordability_assessed=False,
                 thin_file=False,
-            ),
+            ) if request.wants("regulatory_compliance") else None,
             explainability=Explainability(
                 primary_reason=detail or reason,
                 key_strengths=[],
                 key_weaknesses=[detail or reason],
-            ),
-            timestamp=datetime.utcnow().isoformat() + "Z",
+            ) if request.wants("explainability") else None,
+            timestamp=datetime.utcnow().isoformat() + "Z" if request.wants("timestamp") else None,
         )
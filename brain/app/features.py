@@ -1,22 +1,19 @@
 from typing import Dict, List, Optional, Any
 from datetime import datetime, date
-from collections import defaultdict
-import statistics
 import logging
 
+import numpy as np
+
 from app.models import AnalyzeRequest, MonoIncomeData
+from app.balances import balance_features
+from app.bureau import BureauHistory, bureau_history
+from app.cashflow import monthly_cash_flow
+from app.columns import LOANAPP_KEYWORDS
+from app.state import TransactionAggregates, transaction_aggregates
 
 logger = logging.getLogger(__name__)
 
 
-GAMBLING_KEYWORDS = ("bet", "betway", "sporty", "sportpesa", "nairabet",
-                     "lotto", "stake", "casino", "1xbet", "22bet", "winning")
-LOANAPP_KEYWORDS  = ("carbon", "fairmoney", "branch", "palmcredit", "aella",
-                     "quickcheck", "migo", "okash", "lcredit", "renmoney")
-SALARY_KEYWORDS   = ("salary", "payroll", "wages", "stipend", "allowance",
-                     "monthly pay", "staff pay")
-
-
 class FeatureExtractor:
     """
     Stage 2: Transform all raw Mono data into a flat, normalised feature dictionary.
@@ -27,6 +24,11 @@ class FeatureExtractor:
        our own re-computation — Mono's ML is more accurate than our heuristics.
     3. Fall back to transaction-level computation when enrichments are absent.
     4. Amounts are in NGN as returned by Mono (integer kobo values like 505729).
+    5. Transaction-level features read the request's TransactionAggregates
+       (app.state): monthly sums and counters folded from the columnar
+       transactions (app.columns), incrementally when the caller sends back
+       a FeatureState.
+       Bureau features read the request's BureauHistory (app.bureau) likewise.
 
     Features produced (~30):
       Income:         total_monthly_income, salary_income, stable_income_ratio,
@@ -34,48 +36,36 @@ class FeatureExtractor:
                       income_is_growing, income_regular_ratio, income_source
       Cash flow:      monthly_avg_credits, monthly_avg_debits, net_monthly_surplus,
                       surplus_ratio, positive_cash_flow_ratio, debit_to_credit_ratio,
-                      spending_volatility
+                      spending_volatility, plus {avg_credits, avg_debits, avg_net_flow,
+                      spending_volatility, credit_trend, net_flow_trend, min_net_flow,
+                      max_net_flow}_{3,6,12}m
       Credit history: payment_success_rate, open_loan_count, closed_loan_count,
                       total_loan_count, credit_age_months, has_credit_history
       Debt:           total_existing_debt, recurring_debt_monthly
       Behaviour:      overdraft_count, bounced_payment_count, high_risk_transaction_count,
-                      account_age_months, min_balance_maintained, days_below_1000_ngn
+                      internal_transfer_count, account_age_months, min_balance_maintained, days_below_1000_ngn,
+                      avg_daily_balance, balance_days, balance_p10/p50/p90
       Insights:       balance_after_expense, average_balance_from_insights,
                       inflow_avg_last_12m, outflow_avg_last_12m
       Meta:           is_thin_file
     """
 
     def extract(self, request: AnalyzeRequest) -> Dict[str, Any]:
-        all_transactions = self._aggregate_transactions(request.accounts)
-        best_income      = self._best_income(request.accounts)
+        agg         = transaction_aggregates(request)
+        bureau      = bureau_history(request)
+        best_income = self._best_income(request.accounts)
 
         features: Dict[str, Any] = {}
-        features.update(self._income(request.accounts, best_income))
-        features.update(self._cash_flow(all_transactions, request.accounts))
-        features.update(self._credit_history(request.credit_history))
-        features.update(self._debt(request.accounts, request.credit_history))
-        features.update(self._account_behaviour(all_transactions, request.accounts))
+        features.update(self._income(agg, best_income))
+        features.update(self._cash_flow(agg, request.accounts))
+        features.update(self._credit_history(bureau))
+        features.update(self._debt(request.accounts, bureau))
+        features.update(self._account_behaviour(agg, request.accounts))
         features.update(self._insights(request.accounts))
-        features["is_thin_file"] = self._is_thin_file(request.credit_history)
-
-        logger.info(
-            f"Extracted {len(features)} features for applicant={request.applicant_id} "
-            f"thin_file={features['is_thin_file']} income_source={features.get('income_source')}"
-        )
+        features["is_thin_file"] = self._is_thin_file(bureau)
         return features
 
 
-    def _aggregate_transactions(self, accounts: list) -> List[Dict]:
-        """Merge transactions from all linked accounts, newest-first."""
-        all_txns = []
-        for account in accounts:
-            all_txns.extend(account.transactions)
-        try:
-            all_txns.sort(key=lambda t: t.get("date", ""), reverse=True)
-        except Exception:
-            pass
-        return all_txns
-
     def _best_income(self, accounts: list) -> Optional[MonoIncomeData]:
         """Return the income object with the highest monthly_income across accounts."""
         best, best_val = None, 0.0
@@ -86,7 +76,7 @@ class FeatureExtractor:
         return best
 
 
-    def _income(self, accounts: list, best_income: Optional[MonoIncomeData]) -> Dict:
+    def _income(self, agg: TransactionAggregates, best_income: Optional[MonoIncomeData]) -> Dict:
         """
         Primary source: mono.events.account_income webhook data.
         Fallback:       transaction narration scanning + monthly credit averaging.
@@ -100,7 +90,7 @@ class FeatureExtractor:
             "Income webhook data unavailable — falling back to transaction-based "
             "income estimation. Results will be less accurate."
         )
-        return self._income_from_transactions(accounts)
+        return self._income_from_transactions(agg)
 
     def _income_from_webhook(self, income: MonoIncomeData) -> Dict:
         salary_income = sum(
@@ -147,30 +137,14 @@ class FeatureExtractor:
             "income_source":        "webhook",
         }
 
-    def _income_from_transactions(self, accounts: list) -> Dict:
+    def _income_from_transactions(self, agg: TransactionAggregates) -> Dict:
         """
         Fallback: estimate income from narration keywords and monthly credit averages.
         Conservative — flags income_source so decision layer can require verification.
         """
-        monthly_credits: Dict[str, float] = defaultdict(float)
-        salary_credits: List[Dict]        = []
+        credit_months = agg.credit_count > 0
 
-        for account in accounts:
-            for txn in account.transactions:
-                if txn.get("type") != "credit":
-                    continue
-                amount    = float(txn.get("amount", 0))
-                narration = txn.get("narration", "").lower()
-                try:
-                    dt        = datetime.fromisoformat(txn["date"].replace("Z", "+00:00"))
-                    month_key = dt.strftime("%Y-%m")
-                    monthly_credits[month_key] += amount
-                    if any(kw in narration for kw in SALARY_KEYWORDS):
-                        salary_credits.append({"amount": amount, "date": dt})
-                except Exception:
-                    pass
-
-        if not monthly_credits:
+        if not credit_months.any():
             return {
                 "total_monthly_income": 0.0, "salary_income":        0.0,
                 "stable_income_ratio":  0.0, "income_stream_count":  0,
@@ -179,20 +153,20 @@ class FeatureExtractor:
                 "income_source":        "transaction_fallback",
             }
 
-        avg_monthly = statistics.mean(monthly_credits.values())
-        avg_salary  = statistics.mean(s["amount"] for s in salary_credits) if salary_credits else 0.0
+        avg_monthly = float(agg.credits[credit_months].mean())
+        has_salary  = agg.salary_count > 0
+        avg_salary  = agg.salary_total / agg.salary_count if has_salary else 0.0
 
         recency_days = 999
-        if salary_credits:
-            latest       = max(s["date"] for s in salary_credits)
-            recency_days = (datetime.now(latest.tzinfo) - latest).days
+        if agg.latest_salary_at is not None:
+            recency_days = int((_utc_now() - agg.latest_salary_at) // np.timedelta64(1, "D"))
 
         return {
             "total_monthly_income": avg_monthly,
             "salary_income":        avg_salary,
             "stable_income_ratio":  avg_salary / avg_monthly if avg_monthly > 0 else 0.0,
-            "income_stream_count":  1 if salary_credits else 0,
-            "avg_income_stability": 0.5 if salary_credits else 0.0,
+            "income_stream_count":  1 if has_salary else 0,
+            "avg_income_stability": 0.5 if has_salary else 0.0,
             "income_recency_days":  recency_days,
             "income_is_growing":    False,
             "income_regular_ratio": avg_salary / avg_monthly if avg_monthly > 0 else 0.0,
@@ -200,7 +174,7 @@ class FeatureExtractor:
         }
 
 
-    def _cash_flow(self, all_transactions: List[Dict], accounts: list) -> Dict:
+    def _cash_flow(self, agg: TransactionAggregates, accounts: list) -> Dict:
         """
         Monthly inflow/outflow analysis.
 
@@ -210,69 +184,30 @@ class FeatureExtractor:
 
         debit_to_credit_ratio: We prefer Mono's pre-computed value from statement
         insights (computed on the full statement) over our own slice-based calculation.
-        """
-        monthly_credits: Dict[str, float] = defaultdict(float)
-        monthly_debits:  Dict[str, float] = defaultdict(float)
 
-        for txn in all_transactions:
-            try:
-                dt        = datetime.fromisoformat(txn["date"].replace("Z", "+00:00"))
-                month_key = dt.strftime("%Y-%m")
-                amount    = float(txn.get("amount", 0))
-                if txn.get("type") == "credit":
-                    monthly_credits[month_key] += amount
-                elif txn.get("type") == "debit":
-                    monthly_debits[month_key]  += amount
-            except Exception:
-                pass
-
-        if not monthly_credits and not monthly_debits:
-            return {
-                "monthly_avg_credits":      0.0, "monthly_avg_debits":      0.0,
-                "net_monthly_surplus":      0.0, "surplus_ratio":           0.0,
-                "positive_cash_flow_ratio": 0.0, "debit_to_credit_ratio": 999.0,
-                "spending_volatility":      1.0,
-            }
-
-        all_months  = set(monthly_credits) | set(monthly_debits)
-        avg_credits = statistics.mean(monthly_credits.values()) if monthly_credits else 0.0
-        avg_debits  = statistics.mean(monthly_debits.values())  if monthly_debits  else 0.0
-        net_surplus = avg_credits - avg_debits
-
-        months_positive = sum(
-            1 for m in all_months
-            if monthly_credits.get(m, 0) > monthly_debits.get(m, 0)
+        The monthly figures, including the 3/6/12-month rolling means,
+        volatilities, trends and extremes, come from app.cashflow.
+        """
+        cash_flow = monthly_cash_flow(
+            agg.months, agg.credits, agg.debits, agg.credit_count, agg.debit_count,
         )
-        positive_ratio = months_positive / len(all_months) if all_months else 0.0
-        dtc_ratio      = avg_debits / avg_credits if avg_credits > 0 else 999.0
-
-        debit_vals          = list(monthly_debits.values())
-        spending_volatility = 0.0
-        if len(debit_vals) > 1 and avg_debits > 0:
-            spending_volatility = statistics.stdev(debit_vals) / avg_debits
+        if len(agg.months) == 0:
+            return cash_flow
 
         for account in accounts:
             si = account.statement_insights
             if si and si.account_summary:
                 raw = si.account_summary.get("debit_to_credit_ratio", "")
                 try:
-                    dtc_ratio = float(str(raw).split(":")[0])
+                    cash_flow["debit_to_credit_ratio"] = float(str(raw).split(":")[0])
                     break
                 except Exception:
                     pass
 
-        return {
-            "monthly_avg_credits":      avg_credits,
-            "monthly_avg_debits":       avg_debits,
-            "net_monthly_surplus":      net_surplus,
-            "surplus_ratio":            net_surplus / avg_credits if avg_credits > 0 else 0.0,
-            "positive_cash_flow_ratio": positive_ratio,
-            "debit_to_credit_ratio":    dtc_ratio,
-            "spending_volatility":      spending_volatility,
-        }
+        return cash_flow
 
 
-    def _credit_history(self, credit_history: Optional[Dict]) -> Dict:
+    def _credit_history(self, bureau: BureauHistory) -> Dict:
         """
         Parse getCreditHistory bureau response.
 
@@ -282,59 +217,25 @@ class FeatureExtractor:
         None (not 0) when loans exist but repayment schedules are empty —
         the scorer treats None as neutral, not as a failure.
         """
-        empty = {
-            "payment_success_rate": None,
-            "open_loan_count":      0,
-            "closed_loan_count":    0,
-            "total_loan_count":     0,
-            "credit_age_months":    0.0,
-            "has_credit_history":   False,
-        }
-        if not credit_history:
-            return empty
-
-        institutions = credit_history.get("credit_history", [])
-        if not institutions:
-            return empty
-
-        total_payments = 0
-        paid_payments  = 0
-        open_loans     = 0
-        closed_loans   = 0
-        oldest_date: Optional[date] = None
-
-        for entry in institutions:
-            for loan in entry.get("history", []):
-                if loan.get("loan_status", "").lower() == "open":
-                    open_loans  += 1
-                else:
-                    closed_loans += 1
-                try:
-                    opened = datetime.strptime(loan["date_opened"], "%d-%m-%Y").date()
-                    if oldest_date is None or opened < oldest_date:
-                        oldest_date = opened
-                except Exception:
-                    pass
-                for payment in loan.get("repayment_schedule", []):
-                    total_payments += 1
-                    if payment.get("status") == "paid":
-                        paid_payments += 1
+        total_payments = bureau.repayment_count
+        total_loans    = bureau.loan_count
+        open_loans     = len(bureau.open_loans)
+        oldest_date    = bureau.oldest_opened
 
-        psr               = paid_payments / total_payments if total_payments > 0 else None
+        psr               = bureau.paid_repayments / total_payments if total_payments > 0 else None
         credit_age_months = (date.today() - oldest_date).days / 30.0 if oldest_date else 0.0
-        total_loans       = open_loans + closed_loans
 
         return {
             "payment_success_rate": psr,
             "open_loan_count":      open_loans,
-            "closed_loan_count":    closed_loans,
+            "closed_loan_count":    total_loans - open_loans,
             "total_loan_count":     total_loans,
             "credit_age_months":    credit_age_months,
             "has_credit_history":   total_loans > 0,
         }
 
 
-    def _debt(self, accounts: list, credit_history: Optional[Dict]) -> Dict:
+    def _debt(self, accounts: list, bureau: BureauHistory) -> Dict:
         """
         Total outstanding debt and monthly recurring debt obligations.
 
@@ -346,13 +247,7 @@ class FeatureExtractor:
           with loan-related narrations = existing monthly repayment burden.
           This is the key input for DTI calculation alongside the new loan payment.
         """
-        total_debt = 0.0
-
-        if credit_history:
-            for entry in credit_history.get("credit_history", []):
-                for loan in entry.get("history", []):
-                    if loan.get("loan_status", "").lower() == "open":
-                        total_debt += float(loan.get("opening_balance", 0))
+        total_debt = bureau.open_balance
 
         recurring_debt_monthly = 0.0
         for account in accounts:
@@ -378,42 +273,23 @@ class FeatureExtractor:
         }
 
 
-    def _account_behaviour(self, all_transactions: List[Dict], accounts: list) -> Dict:
+    def _account_behaviour(self, agg: TransactionAggregates, accounts: list) -> Dict:
         """
         Discipline signals from raw transaction data.
 
         days_below_1000_ngn: proxy for "living on the edge". Someone whose
         balance regularly drops near zero cannot absorb a fixed loan repayment
-        without stress.
+        without stress. Counted in calendar days on the combined end-of-day
+        balance series (app.balances), as are min_balance_maintained,
+        avg_daily_balance and the balance percentiles.
 
         high_risk_transaction_count: gambling and unregulated lending apps.
         Both signal financial instability — gambling is self-evident; unregulated
         lending apps indicate the person is already borrowing from multiple sources.
-        """
-        overdrafts   = 0
-        bounced      = 0
-        high_risk    = 0
-        days_low_bal = 0
-        min_balance  = float("inf")
-
-        bounce_kws = ("insufficient", "bounced", "returned", "unable to process", "failed debit")
-
-        for txn in all_transactions:
-            balance   = float(txn.get("balance", 0))
-            narration = txn.get("narration", "").lower()
-
-            if balance < 0:
-                overdrafts += 1
-            if balance < 1000:
-                days_low_bal += 1
-            if balance < min_balance:
-                min_balance = balance
-            if any(w in narration for w in bounce_kws):
-                bounced += 1
-            if any(w in narration for w in GAMBLING_KEYWORDS + LOANAPP_KEYWORDS):
-                high_risk += 1
-
 
+        internal_transfer_count: legs of transfers between the applicant's own
+        accounts (app.transfers), which the cash-flow sums leave out.
+        """
         account_age_months = 0.0
         for account in accounts:
             si = account.statement_insights
@@ -425,25 +301,16 @@ class FeatureExtractor:
                 except Exception:
                     pass
 
-        if account_age_months == 0.0 and all_transactions:
-            try:
-                dates = [
-                    datetime.fromisoformat(t["date"].replace("Z", "+00:00"))
-                    for t in all_transactions if t.get("date")
-                ]
-                if dates:
-                    oldest = min(dates)
-                    account_age_months = (datetime.now(oldest.tzinfo) - oldest).days / 30.0
-            except Exception:
-                pass
+        if account_age_months == 0.0 and agg.oldest_at is not None:
+            account_age_months = int((_utc_now() - agg.oldest_at) // np.timedelta64(1, "D")) / 30.0
 
         return {
-            "overdraft_count":             overdrafts,
-            "bounced_payment_count":       bounced,
-            "high_risk_transaction_count": high_risk,
+            "overdraft_count":             agg.overdraft_count,
+            "bounced_payment_count":       agg.bounced_count,
+            "high_risk_transaction_count": agg.high_risk_count,
+            "internal_transfer_count":     agg.transfer_count,
             "account_age_months":          account_age_months,
-            "min_balance_maintained":      min_balance if min_balance != float("inf") else 0.0,
-            "days_below_1000_ngn":         days_low_bal,
+            **balance_features(agg.daily_balance),
         }
 
 
@@ -492,7 +359,7 @@ class FeatureExtractor:
             "outflow_avg_last_12m":          outflow_12m,
         }
 
-    def _is_thin_file(self, credit_history: Optional[Dict]) -> bool:
+    def _is_thin_file(self, bureau: BureauHistory) -> bool:
         """
         Thin-file: no meaningful credit bureau history (< 2 loan entries).
 
@@ -500,8 +367,10 @@ class FeatureExtractor:
         Credit History 30% → 0%, redistributed to Income/Cash Flow/DSC/Account.
         This is how serious African lenders handle first-time borrowers.
         """
-        if not credit_history:
+        if not bureau.present:
             return True
-        institutions = credit_history.get("credit_history", [])
-        total_loans  = sum(len(inst.get("history", [])) for inst in institutions)
-        return total_loans < 2
+        return bureau.loan_count < 2
+
+
+def _utc_now() -> np.datetime64:
+    return np.datetime64(int(datetime.now().timestamp()), "s")
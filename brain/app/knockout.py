@@ -3,6 +3,8 @@ from typing import Optional
 from datetime import datetime, date
 import logging
 
+from app.bureau import bureau_history
+from app.state import transaction_aggregates
 from app.models import AnalyzeRequest, RiskPolicy
 
 logger = logging.getLogger(__name__)
@@ -26,30 +28,38 @@ class KnockoutEngine:
 
     Rules run in order. The first rule that fires stops the pipeline.
     Order matters: identity first (cheapest), fraud signals second (requires insights),
-    credit defaults third (requires credit history), then account health, then income.
+    credit defaults third (requires credit history), then account age and income
+    (enrichments only), and last the overdraft/bounce counts — the only rule that
+    needs the transactions.
+
+    screen() runs everything but that last rule, so a request can be rejected
+    before its transactions are even decoded (see codecs.decode_staged).
 
     All thresholds come from the RiskPolicy passed at call time rather than
     module-level constants, so each fintech can tune them independently.
     """
 
-    def run(self, request: AnalyzeRequest, policy: RiskPolicy) -> KnockoutResult:
+    def screen(self, request: AnalyzeRequest, policy: RiskPolicy) -> KnockoutResult:
+        """The rules that read no transactions, in pipeline order."""
         checks = [
             self._check_identity,
             self._check_fraud_signals,
             self._check_active_defaults,
-            lambda r, p: self._check_account_health(r, p),
-            lambda r, p: self._check_income_disqualifiers(r, p),
+            self._check_account_age,
+            self._check_income_disqualifiers,
         ]
         for check in checks:
             result = check(request, policy)
             if result.knocked_out:
-                logger.warning(
-                    f"[KNOCKOUT] applicant={request.applicant_id} "
-                    f"reason={result.reason} detail={result.detail}"
-                )
                 return result
         return KnockoutResult(knocked_out=False)
 
+    def run(self, request: AnalyzeRequest, policy: RiskPolicy) -> KnockoutResult:
+        result = self.screen(request, policy)
+        if result.knocked_out:
+            return result
+        return self._check_account_health(request, policy)
+
 
     def _check_identity(self, request: AnalyzeRequest, policy: RiskPolicy) -> KnockoutResult:
         """
@@ -126,58 +136,42 @@ class KnockoutEngine:
         Credit bureau check: is the applicant currently defaulting on any loan?
         Uses policy.max_consecutive_failures as the consecutive missed payment threshold.
         """
-        if not request.credit_history:
-            return KnockoutResult(knocked_out=False)
+        bureau = bureau_history(request)
 
-        for institution_entry in request.credit_history.get("credit_history", []):
-            institution_name = institution_entry.get("institution", "unknown institution")
-            for loan in institution_entry.get("history", []):
-                status      = loan.get("performance_status", "").lower()
-                loan_status = loan.get("loan_status", "").lower()
+        for i in range(bureau.loan_count):
+            institution_name = bureau.institution[i]
 
-                if status == "non-performing":
-                    return KnockoutResult(
-                        knocked_out=True,
-                        reason="ACTIVE_DEFAULT",
-                        detail=f"Non-performing loan at {institution_name}",
-                    )
-                if loan_status == "written-off":
-                    return KnockoutResult(
-                        knocked_out=True,
-                        reason="WRITTEN_OFF_LOAN",
-                        detail=f"Written-off loan at {institution_name}",
-                    )
+            if bureau.performance_status[i] == "non-performing":
+                return KnockoutResult(
+                    knocked_out=True,
+                    reason="ACTIVE_DEFAULT",
+                    detail=f"Non-performing loan at {institution_name}",
+                )
+            if bureau.loan_status[i] == "written-off":
+                return KnockoutResult(
+                    knocked_out=True,
+                    reason="WRITTEN_OFF_LOAN",
+                    detail=f"Written-off loan at {institution_name}",
+                )
 
-                schedule    = loan.get("repayment_schedule", [])
-                consecutive = 0
-                max_consec  = 0
-                for payment in schedule:
-                    if payment.get("status") in ("failed", "missed"):
-                        consecutive += 1
-                        max_consec = max(max_consec, consecutive)
-                    else:
-                        consecutive = 0
-                if max_consec >= policy.max_consecutive_failures:
-                    return KnockoutResult(
-                        knocked_out=True,
-                        reason="CONSECUTIVE_PAYMENT_FAILURES",
-                        detail=(
-                            f"{max_consec} consecutive missed payments at {institution_name}"
-                        ),
-                    )
+            max_consec = int(bureau.max_failure_streak[i])
+            if max_consec >= policy.max_consecutive_failures:
+                return KnockoutResult(
+                    knocked_out=True,
+                    reason="CONSECUTIVE_PAYMENT_FAILURES",
+                    detail=(
+                        f"{max_consec} consecutive missed payments at {institution_name}"
+                    ),
+                )
 
         return KnockoutResult(knocked_out=False)
 
 
-    def _check_account_health(self, request: AnalyzeRequest, policy: RiskPolicy) -> KnockoutResult:
+    def _check_account_age(self, request: AnalyzeRequest, policy: RiskPolicy) -> KnockoutResult:
         """
-        Minimum account viability checks.
-        Thresholds come from policy: min_account_age_months, max_overdrafts,
-        max_bounced_payments.
+        Minimum statement history, from the statement insights' start_date.
+        Threshold from policy: min_account_age_months.
         """
-        total_overdrafts = 0
-        total_bounced    = 0
-
         for account in request.accounts:
             if account.statement_insights and account.statement_insights.start_date:
                 try:
@@ -197,15 +191,17 @@ class KnockoutEngine:
                 except ValueError:
                     pass
 
-            for txn in account.transactions:
-                balance   = txn.get("balance", 0)
-                narration = txn.get("narration", "").lower()
+        return KnockoutResult(knocked_out=False)
+
 
-                if balance < 0:
-                    total_overdrafts += 1
-                if any(w in narration for w in
-                       ("insufficient", "bounced", "returned", "unable to process")):
-                    total_bounced += 1
+    def _check_account_health(self, request: AnalyzeRequest, policy: RiskPolicy) -> KnockoutResult:
+        """
+        Overdraft and bounced-payment counts across all accounts' transactions.
+        Thresholds come from policy: max_overdrafts, max_bounced_payments.
+        """
+        agg              = transaction_aggregates(request)
+        total_overdrafts = agg.overdraft_count
+        total_bounced    = agg.knockout_bounced_count
 
         if total_overdrafts > policy.max_overdrafts:
             return KnockoutResult(
@@ -0,0 +1,417 @@
+"""
+End-to-end load harness for the Brain HTTP service.
+
+Starts the FastAPI app under uvicorn with N workers on localhost (or targets
+an already-running instance via --url), replays payloads against /analyze and
+reports throughput, p50/p95/p99 latency and error rate per payload-size bucket.
+
+The client mirrors the gateway's callBrainService: a JSON POST to /analyze
+with a 30 s timeout, treating transport failures and any non-2xx status as
+errors. It is a local stand-in for the gateway, not a replacement for it.
+
+Two load models:
+  closed loop (--concurrency N)   N clients, each sends its next request as
+                                  soon as the previous one completes.
+  open loop   (--rate R)          requests arrive as a Poisson process at R/s
+                                  regardless of how fast the server answers.
+                                  Latency is measured from the scheduled
+                                  arrival time, so queueing delay is included
+                                  (no coordinated omission).
+
+Payloads are either generated (--sizes 50,500,5000 — transaction counts,
+mixed uniformly) or captured (--payloads file.jsonl — one AnalyzeRequest per
+line — or --payloads DIR, a traffic capture directory from app.capture).
+--encoding msgpack|arrow re-encodes them in that wire format (see
+app.codecs); buckets are still assigned by the JSON size, so runs in
+different encodings compare like for like.
+
+Transport: --uds PATH serves and connects over a Unix domain socket instead
+of loopback TCP (how a co-located gateway would reach app.serve --uds).
+--fresh-connections disables client keep-alive so every request pays for
+connection setup; comparing the four combinations isolates the transport
+cost from scoring time.
+
+Usage:
+    python -m app.loadtest --workers 2 --concurrency 16 --duration 30
+    python -m app.loadtest --rate 50 --payloads captured.jsonl
+    python -m app.loadtest --url http://127.0.0.1:8000 --concurrency 8
+    python -m app.loadtest --encoding arrow --sizes 5000
+    python -m app.loadtest --uds /tmp/brain.sock --sizes 50
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from app.codecs import (
+    ARROW_MEDIA_TYPE, JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, encode_arrow_request, encode_msgpack,
+)
+from app.capture import read_captures
+from app.payloads import synthetic_request
+
+
+BRAIN_DIR       = Path(__file__).resolve().parent.parent
+REQUEST_TIMEOUT = 30.0
+
+SIZE_BUCKETS: Sequence[Tuple[int, str]] = (
+    (16 * 1024,        "<16KiB"),
+    (128 * 1024,       "16-128KiB"),
+    (1024 * 1024,      "128KiB-1MiB"),
+    (8 * 1024 * 1024,  "1-8MiB"),
+)
+OVERSIZE_BUCKET = ">8MiB"
+
+
+def size_bucket(n_bytes: int) -> str:
+    for limit, label in SIZE_BUCKETS:
+        if n_bytes < limit:
+            return label
+    return OVERSIZE_BUCKET
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already-sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@dataclass
+class Payload:
+    body: bytes
+    bucket: str
+    content_type: str = JSON_MEDIA_TYPE
+
+
+@dataclass
+class BucketStats:
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies_ms)
+
+
+class LoadReport:
+    """Collects per-request samples and renders the summary table."""
+
+    def __init__(self):
+        self.buckets: Dict[str, BucketStats] = defaultdict(BucketStats)
+        self.started  = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, bucket: str, latency_ms: float, status: str, ok: bool) -> None:
+        stats = self.buckets[bucket]
+        stats.latencies_ms.append(latency_ms)
+        stats.statuses[status] += 1
+        if not ok:
+            stats.errors += 1
+
+    def close(self) -> None:
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def rows(self) -> List[Dict]:
+        order  = [label for _, label in SIZE_BUCKETS] + [OVERSIZE_BUCKET]
+        rows   = []
+        merged = BucketStats()
+        for label in order:
+            stats = self.buckets.get(label)
+            if not stats or not stats.count:
+                continue
+            rows.append(self._row(label, stats))
+            merged.latencies_ms.extend(stats.latencies_ms)
+            merged.errors += stats.errors
+            for status, n in stats.statuses.items():
+                merged.statuses[status] += n
+        if merged.count:
+            rows.append(self._row("ALL", merged))
+        return rows
+
+    def _row(self, label: str, stats: BucketStats) -> Dict:
+        lat = sorted(stats.latencies_ms)
+        return {
+            "bucket":     label,
+            "requests":   stats.count,
+            "rps":        round(stats.count / self.elapsed, 2) if self.elapsed > 0 else 0.0,
+            "p50_ms":     round(percentile(lat, 50), 1),
+            "p95_ms":     round(percentile(lat, 95), 1),
+            "p99_ms":     round(percentile(lat, 99), 1),
+            "error_rate": round(stats.errors / stats.count, 4),
+            "statuses":   dict(stats.statuses),
+        }
+
+    def render(self) -> str:
+        header = f"{'bucket':<14}{'requests':>9}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+        lines  = [header, "-" * len(header)]
+        for r in self.rows():
+            lines.append(
+                f"{r['bucket']:<14}{r['requests']:>9}{r['rps']:>9.1f}"
+                f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+                f"{r['error_rate'] * 100:>8.2f}%"
+            )
+        lines.append(f"elapsed={self.elapsed:.1f}s")
+        return "\n".join(lines)
+
+
+ENCODINGS = ("json", "msgpack", "arrow")
+
+
+def encode_payload(body: bytes, encoding: str) -> Payload:
+    bucket = size_bucket(len(body))
+    if encoding == "msgpack":
+        return Payload(encode_msgpack(json.loads(body)), bucket, MSGPACK_MEDIA_TYPE)
+    if encoding == "arrow":
+        return Payload(encode_arrow_request(json.loads(body)), bucket, ARROW_MEDIA_TYPE)
+    return Payload(body, bucket)
+
+
+def load_payloads(
+    path: Optional[str],
+    sizes: Sequence[int],
+    variants: int,
+    seed: int,
+    encoding: str = "json",
+) -> List[Payload]:
+    """
+    Captured payloads: one AnalyzeRequest JSON object per line, or a
+    capture directory (app.capture).
+    Generated payloads: `variants` distinct requests per transaction count.
+    """
+    if path and Path(path).is_dir():
+        payloads = [
+            encode_payload(json.dumps(document["request"]).encode(), encoding)
+            for document in read_captures(path)
+        ]
+        if not payloads:
+            raise SystemExit(f"No captures found in {path}")
+        return payloads
+    if path:
+        payloads = []
+        with open(path, "rb") as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    payloads.append(encode_payload(line, encoding))
+        if not payloads:
+            raise SystemExit(f"No payloads found in {path}")
+        return payloads
+
+    payloads = []
+    for size in sizes:
+        for v in range(variants):
+            body = json.dumps(synthetic_request(size, seed=seed + size * 1000 + v)).encode()
+            payloads.append(encode_payload(body, encoding))
+    return payloads
+
+
+async def _send(client: httpx.AsyncClient, payload: Payload) -> Tuple[str, bool]:
+    try:
+        resp = await client.post(
+            "/analyze",
+            content=payload.body,
+            headers={"Content-Type": payload.content_type},
+        )
+        await resp.aread()
+        return str(resp.status_code), resp.is_success
+    except httpx.TimeoutException:
+        return "timeout", False
+    except httpx.HTTPError as e:
+        return type(e).__name__, False
+
+
+async def run_closed_loop(
+    client: httpx.AsyncClient,
+    payloads: List[Payload],
+    concurrency: int,
+    deadline: float,
+    report: LoadReport,
+    rng: random.Random,
+) -> None:
+    async def worker():
+        while time.perf_counter() < deadline:
+            payload = rng.choice(payloads)
+            t0 = time.perf_counter()
+            status, ok = await _send(client, payload)
+            report.record(payload.bucket, (time.perf_counter() - t0) * 1000, status, ok)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run_open_loop(
+    client: httpx.AsyncClient,
+    payloads: List[Payload],
+    rate: float,
+    deadline: float,
+    report: LoadReport,
+    rng: random.Random,
+) -> None:
+    async def one(payload: Payload, scheduled: float):
+        status, ok = await _send(client, payload)
+        report.record(payload.bucket, (time.perf_counter() - scheduled) * 1000, status, ok)
+
+    tasks: List[asyncio.Task] = []
+    next_at = time.perf_counter()
+    while next_at < deadline:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(rng.choice(payloads), next_at)))
+        next_at += rng.expovariate(rate)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+def start_server(
+    port: int,
+    workers: int,
+    extra_args: Sequence[str] = (),
+    uds: Optional[str] = None,
+) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("LOG_LEVEL", "WARNING")
+    # The payload pool is small and replayed repeatedly; leave the response
+    # cache off unless explicitly configured so every request is scored.
+    env.setdefault("RESPONSE_CACHE_SIZE", "0")
+    bind = ["--uds", uds] if uds else ["--host", "127.0.0.1", "--port", str(port)]
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app", *bind,
+        "--workers", str(workers), "--log-level", "warning",
+        *extra_args,
+    ]
+    return subprocess.Popen(cmd, cwd=BRAIN_DIR, env=env)
+
+
+def wait_until_healthy(
+    url: str,
+    proc: Optional[subprocess.Popen],
+    timeout: float = 30.0,
+    uds: Optional[str] = None,
+) -> None:
+    deadline = time.monotonic() + timeout
+    with httpx.Client(transport=httpx.HTTPTransport(uds=uds), timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise SystemExit(f"Server exited during startup (code {proc.returncode})")
+            try:
+                if client.get(f"{url}/health").is_success:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+    raise SystemExit(f"Server at {uds or url} did not become healthy within {timeout:.0f}s")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+async def run_load(
+    url: str,
+    payloads: List[Payload],
+    duration: float,
+    concurrency: int,
+    rate: Optional[float],
+    warmup: float,
+    seed: int,
+    uds: Optional[str] = None,
+    fresh_connections: bool = False,
+) -> LoadReport:
+    rng       = random.Random(seed)
+    keepalive = 0 if fresh_connections else max(concurrency, 64)
+    limits    = httpx.Limits(max_connections=None, max_keepalive_connections=keepalive)
+    transport = httpx.AsyncHTTPTransport(uds=uds, limits=limits)
+    async with httpx.AsyncClient(base_url=url, timeout=REQUEST_TIMEOUT, transport=transport) as client:
+        if warmup > 0:
+            await run_closed_loop(client, payloads, concurrency, time.perf_counter() + warmup,
+                                  LoadReport(), rng)
+
+        report   = LoadReport()
+        deadline = time.perf_counter() + duration
+        if rate:
+            await run_open_loop(client, payloads, rate, deadline, report, rng)
+        else:
+            await run_closed_loop(client, payloads, concurrency, deadline, report, rng)
+        report.close()
+        return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.loadtest",
+        description="Replay /analyze payloads against a local Brain service and report latency.",
+    )
+    parser.add_argument("--url", help="Target an already-running service instead of starting one")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the spawned server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Closed-loop client count")
+    parser.add_argument("--rate", type=float, help="Open-loop arrival rate (requests/s)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured run length (s)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured warm-up (s)")
+    parser.add_argument("--payloads", help="JSONL file of AnalyzeRequest bodies, or a capture directory")
+    parser.add_argument("--sizes", default="50,500,5000",
+                        help="Transaction counts for generated payloads (comma-separated)")
+    parser.add_argument("--variants", type=int, default=4, help="Generated payloads per size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json",
+                        help="Request body wire format")
+    parser.add_argument("--uds", help="Unix domain socket path to serve on / connect through")
+    parser.add_argument("--fresh-connections", action="store_true",
+                        help="Disable client keep-alive: one connection per request")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args     = build_parser().parse_args(argv)
+    sizes    = [int(s) for s in args.sizes.split(",") if s.strip()]
+    payloads = load_payloads(args.payloads, sizes, args.variants, args.seed, args.encoding)
+
+    proc = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        url  = "http://brain" if args.uds else f"http://127.0.0.1:{args.port}"
+        proc = start_server(args.port, args.workers, uds=args.uds)
+    try:
+        wait_until_healthy(url, proc, uds=args.uds)
+        report = asyncio.run(run_load(
+            url, payloads, args.duration, args.concurrency, args.rate, args.warmup, args.seed,
+            uds=args.uds, fresh_connections=args.fresh_connections,
+        ))
+    finally:
+        if proc is not None:
+            stop_server(proc)
+
+    if args.json:
+        print(json.dumps({"elapsed_s": round(report.elapsed, 2), "buckets": report.rows()}, indent=2))
+    else:
+        print(report.render())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
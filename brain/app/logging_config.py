@@ -7,15 +7,49 @@ log aggregator that understands newline-delimited JSON.
 
 Usage (in each module):
     import logging
+    from app.logging_config import fields
     logger = logging.getLogger(__name__)
 
+    logger.info("[INCOME]", extra=fields(applicant=aid, safe_income=safe_income))
+
+Pass values as structured fields rather than pre-formatting them into an
+f-string: the logger's level check runs before the record is built, and the
+JSON encoding happens only for records that are actually emitted — on the
+background writer thread when the queue handler is enabled.
+
 Call configure_logging() once at app startup in main.py.
 """
 
+import atexit
 import json
 import logging
-import traceback as tb
-from datetime import datetime, timezone
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Mapping, Optional
+
+try:
+    import orjson
+except ImportError:  # optional — stdlib json is used when orjson is not installed
+    orjson = None
+
+
+FIELDS_ATTR = "fields"
+
+
+def fields(**values: Any) -> Dict[str, Dict[str, Any]]:
+    """Build the `extra=` mapping that attaches structured fields to a record."""
+    return {FIELDS_ATTR: values}
+
+
+if orjson is not None:
+    def _dumps(entry: dict) -> str:
+        return orjson.dumps(entry, default=str).decode()
+else:
+    def _dumps(entry: dict) -> str:
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
 
 class JSONFormatter(logging.Formatter):
@@ -23,35 +57,173 @@ class JSONFormatter(logging.Formatter):
     Formats each log record as a single JSON object on one line.
 
     Fields:
-      ts      — ISO-8601 UTC timestamp with milliseconds
+      ts      — ISO-8601 UTC timestamp with milliseconds (from record.created)
       level   — DEBUG / INFO / WARNING / ERROR / CRITICAL
       logger  — module name (last segment only, e.g. "decision" not "app.decision")
       msg     — the log message
       exc     — formatted exception traceback, only present when an exception is attached
+      ...     — any structured fields passed via extra=fields(...), merged at top level
+                (they never overwrite the keys above)
+
+    The second-resolution part of the timestamp is cached, so consecutive
+    records within the same second only pay for the millisecond suffix.
     """
 
+    def __init__(self):
+        super().__init__()
+        self._ts_second = -1
+        self._ts_prefix = ""
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._ts_second:
+            self._ts_prefix = time.strftime("%Y-%m-%dT%H:%M:%S.", time.gmtime(second))
+            self._ts_second = second
+        return f"{self._ts_prefix}{int((created - second) * 1000):03d}Z"
+
     def format(self, record: logging.LogRecord) -> str:
         entry: dict = {
-            "ts":     datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") +
-                      f"{record.msecs:03.0f}Z",
+            "ts":     self._timestamp(record.created),
             "level":  record.levelname,
-            "logger": record.name.split(".")[-1],
+            "logger": record.name.rpartition(".")[2],
             "msg":    record.getMessage(),
         }
+        extra = getattr(record, FIELDS_ATTR, None)
+        if extra:
+            for key, value in extra.items():
+                entry.setdefault(key, value)
         if record.exc_info:
             entry["exc"] = self.formatException(record.exc_info)
         elif record.exc_text:
             entry["exc"] = record.exc_text
-        return json.dumps(entry, ensure_ascii=False)
+        return _dumps(entry)
 
 
-def configure_logging(level: str = "INFO") -> None:
+class SamplingFilter(logging.Filter):
+    """
+    Per-logger sampling for chatty INFO/DEBUG records.
+
+    rates maps a logger name prefix (e.g. "app.decision") to the fraction of
+    records to keep. The longest matching prefix wins. WARNING and above are
+    never sampled out.
+    """
+
+    def __init__(self, rates: Mapping[str, float]):
+        super().__init__()
+        self._rates = sorted(rates.items(), key=lambda kv: len(kv[0]), reverse=True)
+        self._cache: Dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            for prefix, r in self._rates:
+                if name == prefix or name.startswith(prefix + "."):
+                    rate = r
+                    break
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that enqueues the record untouched.
+
+    The stdlib implementation formats the message on the calling thread in
+    prepare(); here formatting and JSON encoding happen on the listener thread.
+    Records only cross threads within this process, so nothing needs pickling.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def _stop_listener() -> None:
+    """Flush and stop the background writer (registered with atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def _restart_listener_after_fork() -> None:
+    """
+    The listener thread does not survive fork(); give the child its own
+    queue and writer thread so preforked workers keep logging.
+    """
+    global _listener
+    if _listener is None:
+        return
+    handlers  = _listener.handlers
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DeferredQueueHandler):
+            handler.queue = log_queue
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+def parse_sample_rates(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "app.decision=0.1,app.features=0.5" into a rates mapping."""
+    rates: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, sep, value = part.strip().partition("=")
+        if not sep:
+            continue
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+def configure_logging(
+    level: str = "INFO",
+    use_queue: bool = False,
+    sample_rates: Optional[Mapping[str, float]] = None,
+) -> None:
     """
     Replace the root logger's handlers with a single stdout JSON handler.
     Call this once at application startup before any loggers are used.
+
+    use_queue:    put a DeferredQueueHandler on the root logger and write from
+                  a background QueueListener thread, so request threads only
+                  pay for building the record.
+    sample_rates: per-logger INFO/DEBUG sampling (see SamplingFilter).
     """
-    handler = logging.StreamHandler()
-    handler.setFormatter(JSONFormatter())
+    global _listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JSONFormatter())
+
+    _stop_listener()
+
+    if use_queue:
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        handler: logging.Handler = DeferredQueueHandler(log_queue)
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = stream_handler
+
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
 
     root = logging.getLogger()
     root.handlers.clear()
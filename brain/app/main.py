@@ -1,19 +1,80 @@
+import gc
 import logging
 import os
 import time
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Request
+# Imported before anything heavy so STARTUP.started_at marks the cold start.
+from app.warmup import STATE as STARTUP, mark_ready, warm_up
+
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
 
-from app.logging_config import configure_logging
-from app.models import AnalyzeRequest, AnalyzeResponse
+from app.logging_config import configure_logging, fields, parse_sample_rates
+from app.models import AnalyzeRequest, AnalyzeResponse, response_fields
 from app.engine import AnalysisEngine
+from app.cache import ResponseCache, request_key
+from app.admission import AdmissionController, Overloaded
+from app.deadline import Deadline, DeadlineExceeded
+from app.memory import MB, MemoryCeilingExceeded, MemoryProfiler, RequestMemory
+from app.readiness import Readiness
+from app.scorecard import default_registry
+from app.capture import CaptureWriter
+from app.shadow import ShadowRunner
+from app.codecs import (
+    ARROW_MEDIA_TYPE, JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, UnsupportedMediaType,
+    decode_request, decode_staged, encode_msgpack, wants_msgpack,
+)
 
 
-configure_logging(level=os.getenv("LOG_LEVEL", "INFO"))
+configure_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    use_queue=os.getenv("LOG_QUEUE", "true").lower() in ("1", "true", "yes"),
+    sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE_RATES")),
+)
 logger = logging.getLogger(__name__)
 
+AnalysisEngine.trace_sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+# Decode transactions only after the transaction-free knockouts pass (app.codecs).
+STAGED_DECODE = os.getenv("STAGED_DECODE", "true").lower() in ("1", "true", "yes")
+
+# Candidate scorer/decision engine run alongside production (app.shadow); off by default.
+AnalysisEngine.shadow = ShadowRunner.from_env()
+
+# Weighted in-flight budget with realtime/batch lanes (app.admission); ADMISSION=false disables.
+admission = AdmissionController.from_env()
+PRIORITY_HEADER = "x-brain-priority"
+TENANT_HEADER   = "x-tenant-id"
+
+# Remaining time budget sent by the caller (app.deadline); DEADLINE_DEFAULT_MS applies
+# when the header is absent (0 = no deadline). Within DEADLINE_DEGRADE_MS of the
+# deadline the optional response sections are skipped.
+DEADLINE_HEADER     = "x-brain-deadline-ms"
+DEADLINE_DEFAULT_MS = float(os.getenv("DEADLINE_DEFAULT_MS", "0"))
+DEADLINE_DEGRADE_MS = float(os.getenv("DEADLINE_DEGRADE_MS", "2000"))
+
+# Per-stage allocation peaks and a per-request ceiling (app.memory); off unless
+# MEMORY_PROFILE or MEMORY_CEILING_MB is set.
+memory_profiler = MemoryProfiler.from_env()
+
+# Sampled, scrubbed request/response capture into a replay corpus (app.capture);
+# off unless CAPTURE_DIR is set.
+capture = CaptureWriter.from_env()
+
+# Loop lag, admission load and recent latency behind /ready (app.readiness).
+readiness = Readiness.from_env()
+
+# Versioned scorecards, hot-reloaded from SCORECARD_DIR (app.scorecard).
+scorecards = default_registry()
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "600")),
+)
+
 app = FastAPI(
     title="Mono-Parser Brain API",
     description="Credit scoring and decision engine",
@@ -21,9 +82,73 @@ app = FastAPI(
 )
 
 
+# /analyze reads its body itself (app.codecs), so FastAPI cannot infer the
+# request schema. Publish it — and its nested models — explicitly.
+_REQUEST_SCHEMA = AnalyzeRequest.model_json_schema(ref_template="#/components/schemas/{model}")
+_REQUEST_DEFS   = _REQUEST_SCHEMA.pop("$defs", {})
+_REQUEST_REF    = {"$ref": "#/components/schemas/AnalyzeRequest"}
+
+ANALYZE_OPENAPI = {
+    "parameters": [{
+        "name": "fields", "in": "query", "required": False,
+        "schema": {"type": "string"},
+        "description": (
+            "Comma-separated response sections to return besides applicant_id, decision "
+            "and score (e.g. score_breakdown). Sections left out are not computed."
+        ),
+    }],
+    "requestBody": {
+        "required": True,
+        "content": {
+            JSON_MEDIA_TYPE:    {"schema": _REQUEST_REF},
+            MSGPACK_MEDIA_TYPE: {"schema": _REQUEST_REF},
+            ARROW_MEDIA_TYPE:   {"schema": {"type": "string", "format": "binary"}},
+        },
+    },
+}
+
+
+def _openapi() -> dict:
+    if app.openapi_schema is None:
+        schema     = FastAPI.openapi(app)
+        components = schema.setdefault("components", {}).setdefault("schemas", {})
+        for name, definition in _REQUEST_DEFS.items():
+            components.setdefault(name, definition)
+        components.setdefault("AnalyzeRequest", _REQUEST_SCHEMA)
+    return app.openapi_schema
+
+
+app.openapi = _openapi
+
+
 @app.on_event("startup")
 async def on_startup():
-    logger.info("Brain service started — ready to accept requests")
+    if os.getenv("WARMUP", "true").lower() in ("1", "true", "yes"):
+        warm_up(app)
+        gc.collect()
+        gc.freeze()
+    if memory_profiler is not None:
+        memory_profiler.start()
+    readiness.start()
+    ready_ms = mark_ready()
+    logger.info(
+        "Brain service started — ready to accept requests",
+        extra=fields(
+            pid=os.getpid(),
+            cold_start_ms=ready_ms,
+            warmup_ms=STARTUP.warmup_ms,
+            warmed_up=STARTUP.warmed_up,
+        ),
+    )
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    readiness.stop()
+    if AnalysisEngine.shadow is not None:
+        AnalysisEngine.shadow.shutdown()
+    if capture is not None:
+        capture.shutdown()
 
 
 @app.get("/")
@@ -43,24 +168,31 @@ def health_check():
     }
 
 
+@app.get("/ready")
+async def readiness_check():
+    # async, so the answer never waits for a threadpool slot.
+    ready, report = readiness.check(admission)
+    return JSONResponse(status_code=200 if ready else 503, content=report)
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
 
     logger.error(
-        f"Request validation failed path={request.url.path} "
-        f"errors={exc.errors()}"
+        "Request validation failed",
+        extra=fields(path=request.url.path, errors=exc.errors()),
     )
     return JSONResponse(
         status_code=422,
-        content={"detail": exc.errors()},
+        content={"detail": jsonable_encoder(exc.errors())},
     )
 
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(
-        f"Unhandled exception path={request.url.path} "
-        f"error={type(exc).__name__}: {exc}",
+        "Unhandled exception",
+        extra=fields(path=request.url.path, error_type=type(exc).__name__, error=str(exc)),
         exc_info=True,
     )
     return JSONResponse(
@@ -72,32 +204,243 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_applicant(request: AnalyzeRequest):
+@app.get("/metrics")
+def metrics():
+    body = {
+        "response_cache": response_cache.stats(),
+        "scorecards":     scorecards.stats(),
+    }
+    if admission is not None:
+        body["admission"] = admission.stats()
+    if AnalysisEngine.shadow is not None:
+        body["shadow"] = AnalysisEngine.shadow.stats()
+    if memory_profiler is not None:
+        body["memory"] = memory_profiler.stats()
+    if capture is not None:
+        body["capture"] = capture.stats()
+    return body
+
+
+def _render(
+    response: AnalyzeResponse,
+    request: AnalyzeRequest,
+    http_request: Request,
+    cache_status: Optional[str],
+):
+    """JSON by default; MessagePack when the caller's Accept header asks for it."""
+    headers = {"X-Brain-Cache": cache_status} if cache_status else None
+    include = request.response_include()
+    if include is not None and response.degraded:
+        include.add("degraded")
+    content = response.model_dump(mode="json", include=include)
+    if wants_msgpack(http_request.headers.get("accept")):
+        return Response(
+            content=encode_msgpack(content),
+            media_type=MSGPACK_MEDIA_TYPE,
+            headers=headers,
+        )
+    return JSONResponse(content=content, headers=headers)
+
+
+def _apply_fields_param(request: AnalyzeRequest, value: Optional[str]) -> None:
+    """?fields=decision,score,score_breakdown overrides the body's fields."""
+    if value is None:
+        return
+    try:
+        request.fields = response_fields(value)
+    except ValueError as e:
+        raise RequestValidationError([{
+            "type": "value_error", "loc": ("query", "fields"), "msg": str(e), "input": value,
+        }])
+
+
+@app.post("/analyze", response_model=AnalyzeResponse, openapi_extra=ANALYZE_OPENAPI)
+async def analyze_applicant(http_request: Request):
     start = time.perf_counter()
+    try:
+        deadline = Deadline.from_header(
+            http_request.headers.get(DEADLINE_HEADER), start, DEADLINE_DEFAULT_MS, DEADLINE_DEGRADE_MS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if admission is None:
+        return await _analyze(http_request, start, 0.0, deadline)
+
+    # Admitted before the body is read, so a rejected request costs nothing.
+    lane   = admission.lane(http_request.headers.get(PRIORITY_HEADER))
+    tenant = http_request.headers.get(TENANT_HEADER) or "default"
+    weight = admission.weight(http_request.headers.get("content-length"))
+    max_wait = deadline.remaining_ms() / 1000 if deadline is not None else None
+    try:
+        async with admission.slot(lane, tenant, weight, max_wait) as slot:
+            return await _analyze(http_request, start, slot.waited_s, deadline)
+    except Overloaded as e:
+        logger.warning(
+            "[OVERLOADED]",
+            extra=fields(lane=lane, tenant=tenant, weight=weight, reason=e.reason,
+                         retry_after=e.retry_after,
+                         duration_ms=round((time.perf_counter() - start) * 1000, 1)),
+        )
+        return JSONResponse(
+            status_code=429,
+            content={"error": "Overloaded", "message": str(e), "lane": lane},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+async def _analyze(http_request: Request, start: float, queued_s: float, deadline: Optional[Deadline]):
+    body         = await http_request.body()
+    # Nothing below awaits, so this is the last point at which a caller that
+    # gave up (typically while queued for admission) can be noticed.
+    if await http_request.is_disconnected():
+        logger.warning(
+            "[CANCELLED]",
+            extra=fields(queued_ms=round(queued_s * 1000, 1),
+                         duration_ms=round((time.perf_counter() - start) * 1000, 1)),
+        )
+        return Response(status_code=499)
+
+    memory = memory_profiler.begin() if memory_profiler is not None else None
+    try:
+        return _process(http_request, body, start, queued_s, deadline, memory)
+    finally:
+        if memory is not None:
+            memory_profiler.finish(memory, len(body))
+        readiness.observe(time.perf_counter() - start)
+
+
+def _process(
+    http_request: Request,
+    body: bytes,
+    start: float,
+    queued_s: float,
+    deadline: Optional[Deadline],
+    memory: Optional[RequestMemory],
+):
+    """Decode and analyse; runs to completion on the event loop without awaiting."""
+    content_type = http_request.headers.get("content-type")
+    try:
+        if STAGED_DECODE:
+            staged  = decode_staged(body, content_type)
+            request = staged.request
+        else:
+            staged  = None
+            request = decode_request(body, content_type)
+    except UnsupportedMediaType as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    if memory is not None:
+        memory.request = request
+    _apply_fields_param(request, http_request.query_params.get("fields"))
 
     logger.info(
-        f"[REQUEST] applicant={request.applicant_id} "
-        f"amount=₦{request.loan_amount:,.0f} tenor={request.tenor_months}m "
-        f"rate={request.interest_rate}% accounts={len(request.accounts)}"
+        "[REQUEST]",
+        extra=fields(
+            applicant=request.applicant_id,
+            amount=request.loan_amount,
+            tenor_months=request.tenor_months,
+            rate=request.interest_rate,
+            accounts=len(request.accounts),
+            queued_ms=round(queued_s * 1000, 1),
+        ),
     )
 
     try:
-        response = AnalysisEngine.analyze(request)
+        # Pin the scorecard before the cache key is taken: a cached response
+        # is only reused for the scorecard version that produced it. The key
+        # needs only the raw body, so a hit returns before the deferred
+        # transactions are decoded.
+        request.scorecard_version = scorecards.get(request.scorecard_version).version
+
+        cache_key = request_key(
+            body, content_type, http_request.query_params.get("fields"), request.scorecard_version,
+        ) if response_cache.enabled else None
+        cached    = response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            logger.info(
+                "[RESPONSE]",
+                extra=fields(
+                    applicant=request.applicant_id,
+                    decision=cached.decision,
+                    score=cached.score,
+                    cache="hit",
+                    duration_ms=round((time.perf_counter() - start) * 1000, 1),
+                ),
+            )
+            return _render(cached, request, http_request, "hit")
+
+        if staged is not None and staged.deferred:
+            # A feature_state response needs the transactions folded in, so
+            # those requests always take the full path.
+            rejected = None if request.include_feature_state else AnalysisEngine.screen(request)
+            if rejected is not None:
+                logger.info(
+                    "[RESPONSE]",
+                    extra=fields(
+                        applicant=request.applicant_id,
+                        decision=rejected.decision,
+                        score=rejected.score,
+                        stage="screen",
+                        duration_ms=round((time.perf_counter() - start) * 1000, 1),
+                    ),
+                )
+                if capture is not None:
+                    capture.submit(request, rejected, staged, content_type)
+                return _render(rejected, request, http_request, None)
+            if deadline is not None:
+                deadline.check("decode")
+            request = staged.complete()
+
+        response = AnalysisEngine.analyze(request, deadline, memory)
+        if cache_key and not response.degraded:
+            response_cache.put(cache_key, response)
+        if capture is not None:
+            capture.submit(request, response, content_type=content_type)
 
         duration_ms = (time.perf_counter() - start) * 1000
         logger.info(
-            f"[RESPONSE] applicant={request.applicant_id} "
-            f"decision={response.decision} score={response.score} "
-            f"duration_ms={duration_ms:.1f}"
+            "[RESPONSE]",
+            extra=fields(
+                applicant=request.applicant_id,
+                decision=response.decision,
+                score=response.score,
+                duration_ms=round(duration_ms, 1),
+                **({"degraded": response.degraded} if response.degraded else {}),
+            ),
+        )
+        return _render(response, request, http_request, "miss" if cache_key else None)
+
+    except RequestValidationError:
+        raise
+
+    except DeadlineExceeded as e:
+        logger.warning(
+            "[DEADLINE]",
+            extra=fields(applicant=request.applicant_id, stage=e.stage, budget_ms=e.budget_ms,
+                         duration_ms=round(e.elapsed_ms, 1)),
+        )
+        return JSONResponse(
+            status_code=504,
+            content={"error": "DeadlineExceeded", "message": str(e), "stage": e.stage},
+        )
+
+    except MemoryCeilingExceeded as e:
+        logger.error(
+            "[MEMORY CEILING]",
+            extra=fields(applicant=request.applicant_id, stage=e.stage,
+                         peak_mb=round(e.peak_bytes / MB, 1), ceiling_mb=round(e.ceiling_bytes / MB, 1),
+                         duration_ms=round((time.perf_counter() - start) * 1000, 1)),
+        )
+        return JSONResponse(
+            status_code=413,
+            content={"error": "MemoryCeilingExceeded", "message": str(e), "stage": e.stage},
         )
-        return response
 
     except ValueError as e:
         duration_ms = (time.perf_counter() - start) * 1000
         logger.error(
-            f"[ERROR] applicant={request.applicant_id} "
-            f"type=validation error={e} duration_ms={duration_ms:.1f}",
+            "[ERROR]",
+            extra=fields(applicant=request.applicant_id, type="validation",
+                         error=str(e), duration_ms=round(duration_ms, 1)),
             exc_info=True,
         )
         raise HTTPException(status_code=400, detail=f"Invalid input data: {e}")
@@ -105,8 +448,9 @@ async def analyze_applicant(request: AnalyzeRequest):
     except ZeroDivisionError as e:
         duration_ms = (time.perf_counter() - start) * 1000
         logger.error(
-            f"[ERROR] applicant={request.applicant_id} "
-            f"type=calculation error={e} duration_ms={duration_ms:.1f}",
+            "[ERROR]",
+            extra=fields(applicant=request.applicant_id, type="calculation",
+                         error=str(e), duration_ms=round(duration_ms, 1)),
             exc_info=True,
         )
         raise HTTPException(status_code=500, detail="Calculation error occurred")
@@ -114,8 +458,9 @@ async def analyze_applicant(request: AnalyzeRequest):
     except Exception as e:
         duration_ms = (time.perf_counter() - start) * 1000
         logger.error(
-            f"[ERROR] applicant={request.applicant_id} "
-            f"type={type(e).__name__} error={e} duration_ms={duration_ms:.1f}",
+            "[ERROR]",
+            extra=fields(applicant=request.applicant_id, type=type(e).__name__,
+                         error=str(e), duration_ms=round(duration_ms, 1)),
             exc_info=True,
         )
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
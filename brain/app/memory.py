@@ -0,0 +1,205 @@
+"""
+Per-request memory accounting.
+
+Workers have been OOM-killed with no record of which requests were
+allocating. With MEMORY_PROFILE on, each worker runs tracemalloc and every
+/analyze request gets a RequestMemory that follows it through the stages:
+
+  decode    body → AnalyzeRequest (staged decoding, the transaction-free
+            knockouts, then the deferred transactions)
+  knockout  including the transaction columns and aggregates it builds
+  features, scoring, decision
+
+For each stage it records the peak traced memory above what the worker held
+when the request started, so the figures are what this request added. It
+also records what the parsed request holds: accounts, transaction rows,
+transaction dicts still held by the model, bureau loans, and body bytes.
+
+  ceiling   with MEMORY_CEILING_MB set, a stage whose peak exceeds it ends
+            the request at the next stage boundary with MemoryCeilingExceeded
+            (the API answers 413) and its memory is released, instead of the
+            worker growing until it is killed. A single stage can still
+            allocate past the ceiling before it is checked.
+  top N     the MEMORY_TOP_N largest requests seen by the worker are kept
+            for /metrics and each is logged as "[MEMORY]" when it enters
+            the list.
+
+Everything after the body read runs on the event loop without awaiting, so
+one request is measured at a time. Threads that allocate in the meantime
+(the shadow pool, the log queue) are counted in. tracemalloc slows
+allocation-heavy code noticeably, so the mode is off by default; setting a
+ceiling turns it on.
+
+    MEMORY_PROFILE=false       trace allocations per request
+    MEMORY_CEILING_MB=0        abort a request above this peak (0 = none)
+    MEMORY_TOP_N=10            largest requests kept and logged
+"""
+
+import heapq
+import logging
+import os
+import threading
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.logging_config import fields
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("decode", "knockout", "features", "scoring", "decision")
+MB     = 1024 * 1024
+
+
+class MemoryCeilingExceeded(Exception):
+    def __init__(self, stage: str, peak_bytes: int, ceiling_bytes: int):
+        super().__init__(
+            f"request used {peak_bytes / MB:.1f} MB during {stage}, "
+            f"above the {ceiling_bytes / MB:.0f} MB per-request ceiling"
+        )
+        self.stage         = stage
+        self.peak_bytes    = peak_bytes
+        self.ceiling_bytes = ceiling_bytes
+
+
+@dataclass
+class RequestMemory:
+    """Stage-by-stage peaks of one request, in bytes above the worker's baseline."""
+    ceiling_bytes: int = 0
+    stages:        Dict[str, int] = field(default_factory=dict)
+    counts:        Dict[str, int] = field(default_factory=dict)
+    request:       Optional[Any] = None     # the decoded AnalyzeRequest, counted at the end
+    aborted:       bool = False
+    _stage:        Optional[str] = None
+    _baseline:     int = 0
+
+    def start(self, stage: str) -> None:
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self._stage = stage
+
+    def enter(self, stage: str) -> None:
+        """Close the current stage, check it against the ceiling, and start `stage`."""
+        self.close()
+        tracemalloc.reset_peak()
+        self._stage = stage
+
+    def close(self, check: bool = True) -> None:
+        """Record the current stage's peak; with `check`, raise if it broke the ceiling."""
+        if self._stage is None:
+            return
+        stage, self._stage = self._stage, None
+        peak = max(0, tracemalloc.get_traced_memory()[1] - self._baseline)
+        self.stages[stage] = max(self.stages.get(stage, 0), peak)
+        if check and self.ceiling_bytes and peak > self.ceiling_bytes:
+            self.aborted = True
+            raise MemoryCeilingExceeded(stage, peak, self.ceiling_bytes)
+
+    @property
+    def peak_bytes(self) -> int:
+        return max(self.stages.values(), default=0)
+
+    def count(self, body_bytes: int) -> None:
+        """Record the size of the parsed request (as far as the pipeline got with it)."""
+        self.counts = {"body_bytes": body_bytes}
+        request, self.request = self.request, None
+        if request is None:
+            return
+        columns = request._columns
+        bureau  = request._bureau
+        self.counts.update(
+            accounts=len(request.accounts),
+            transaction_dicts=sum(len(a.transactions) for a in request.accounts),
+            transaction_rows=len(columns) if columns is not None else 0,
+            bureau_loans=bureau.loan_count if bureau is not None else 0,
+        )
+
+
+class MemoryProfiler:
+    """Per-worker aggregate of RequestMemory records, for /metrics and the top-N log."""
+
+    def __init__(self, ceiling_mb: float = 0.0, top_n: int = 10, frames: int = 1):
+        self.ceiling_bytes = int(ceiling_mb * MB)
+        self.top_n         = top_n
+        self.frames        = frames
+
+        self._lock  = threading.Lock()
+        self._peaks: Dict[str, Deque[int]] = {s: deque(maxlen=1024) for s in STAGES}
+        self._max:   Dict[str, int]        = {s: 0 for s in STAGES}
+        self._top:   List[Tuple[int, int, Dict[str, Any]]] = []     # min-heap of (peak, seq, record)
+        self._seq    = 0
+        self.requests = 0
+        self.aborted  = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["MemoryProfiler"]:
+        ceiling = float(os.getenv("MEMORY_CEILING_MB", "0"))
+        enabled = os.getenv("MEMORY_PROFILE", "false").lower() in ("1", "true", "yes")
+        if not enabled and ceiling <= 0:
+            return None
+        return cls(ceiling_mb=ceiling, top_n=int(os.getenv("MEMORY_TOP_N", "10")))
+
+    def start(self) -> None:
+        """Begin tracing in this process (call in each worker, after the fork)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def begin(self) -> Optional[RequestMemory]:
+        if not tracemalloc.is_tracing():
+            return None
+        memory = RequestMemory(ceiling_bytes=self.ceiling_bytes)
+        memory.start(STAGES[0])
+        return memory
+
+    def finish(self, memory: RequestMemory, body_bytes: int) -> None:
+        """Fold a finished request into the aggregates; logs it if it enters the top N."""
+        memory.close(check=False)        # the work is done; record the last stage only
+        applicant = memory.request.applicant_id if memory.request is not None else None
+        memory.count(body_bytes)
+        record = {
+            "applicant":  applicant,
+            "peak_mb":    round(memory.peak_bytes / MB, 2),
+            "stages_mb":  {s: round(b / MB, 2) for s, b in memory.stages.items()},
+            **memory.counts,
+        }
+        with self._lock:
+            self.requests += 1
+            self.aborted  += int(memory.aborted)
+            for stage, peak in memory.stages.items():
+                self._peaks[stage].append(peak)
+                self._max[stage] = max(self._max[stage], peak)
+            self._seq += 1
+            entry  = (memory.peak_bytes, self._seq, record)
+            is_top = self.top_n > 0 and (len(self._top) < self.top_n or entry[0] > self._top[0][0])
+            if is_top:
+                if len(self._top) < self.top_n:
+                    heapq.heappush(self._top, entry)
+                else:
+                    heapq.heapreplace(self._top, entry)
+        if is_top:
+            logger.info("[MEMORY]", extra=fields(aborted=memory.aborted, **record))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for stage in STAGES:
+                peaks = np.fromiter(self._peaks[stage], dtype=np.float64, count=len(self._peaks[stage]))
+                p50, p99 = np.percentile(peaks, (50, 99)) if len(peaks) else (0.0, 0.0)
+                stages[stage] = {
+                    "peak_mb_p50": round(float(p50) / MB, 2),
+                    "peak_mb_p99": round(float(p99) / MB, 2),
+                    "peak_mb_max": round(self._max[stage] / MB, 2),
+                }
+            top = [record for _, _, record in sorted(self._top, reverse=True)]
+            return {
+                "tracing":         tracemalloc.is_tracing(),
+                "traced_mb":       round(tracemalloc.get_traced_memory()[0] / MB, 2),
+                "ceiling_mb":      round(self.ceiling_bytes / MB, 1),
+                "requests":        self.requests,
+                "aborted":         self.aborted,
+                "stages":          stages,
+                "top":             top,
+            }
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from pydantic import BaseModel, PrivateAttr, field_validator
+from typing import List, Dict, Optional, Any, Set
 
 
 
@@ -85,6 +85,10 @@ class AccountData(BaseModel):
     statement_insights: Optional[MonoStatementInsights] = None
 
 
+# RiskPolicy.counter_offer_objective → how app.decision ranks affordable offers.
+COUNTER_OFFER_OBJECTIVES = ("closest_amount", "lowest_payment", "closest_tenor")
+
+
 class RiskPolicy(BaseModel):
     """
     Per-fintech risk parameters sent by the gateway at analysis time.
@@ -117,6 +121,91 @@ class RiskPolicy(BaseModel):
     max_bounced_payments:     int   = 3
     max_consecutive_failures: int   = 3
 
+    # Transactions dated before the current calendar month and the N-1
+    # before it are dropped at ingestion (app.columns). None: whole history.
+    analysis_window_months: Optional[int] = None
+
+    # Debit/credit legs of one amount on two of the applicant's accounts within
+    # this many minutes are an own-account transfer and leave the cash-flow
+    # sums (app.transfers). 0 disables matching.
+    transfer_match_minutes: int = 60
+
+    # How a counter-offer is picked among the affordable (amount, tenor)
+    # pairs: closest_amount, lowest_payment or closest_tenor (app.decision).
+    counter_offer_objective: str = "closest_amount"
+
+    @field_validator("counter_offer_objective")
+    @classmethod
+    def _check_objective(cls, value: str) -> str:
+        if value not in COUNTER_OFFER_OBJECTIVES:
+            raise ValueError(f"counter_offer_objective must be one of {', '.join(COUNTER_OFFER_OBJECTIVES)}")
+        return value
+
+
+class MonthTotals(BaseModel):
+    credits: float = 0.0
+    debits: float = 0.0
+    credit_count: int = 0
+    debit_count: int = 0
+
+
+class AccountFeatureState(BaseModel):
+    """
+    Transaction aggregates for one account, folded up to `through`.
+
+    through is the latest transaction timestamp (UTC epoch seconds) already
+    folded in; on the next analysis only transactions after it are added.
+    months is keyed "YYYY-MM"; daily_balance holds the end-of-day balance
+    for each active day, keyed "YYYY-MM-DD".
+    """
+    through: Optional[int] = None
+    transaction_count: int = 0
+    months: Dict[str, MonthTotals] = {}
+    daily_balance: Dict[str, float] = {}
+    overdraft_count: int = 0
+    bounced_count: int = 0
+    knockout_bounced_count: int = 0
+    high_risk_count: int = 0
+    transfer_count: int = 0
+    salary_count: int = 0
+    salary_total: float = 0.0
+    latest_salary_at: Optional[int] = None
+    oldest_at: Optional[int] = None
+
+
+class FeatureState(BaseModel):
+    """
+    Serialisable transaction aggregates a caller can persist and send back
+    with the next /analyze for the same accounts (see app.state).
+    """
+    version: int = 3
+    accounts: Dict[str, AccountFeatureState] = {}
+
+
+# Response projection (AnalyzeRequest.fields). The core fields are always
+# returned; each section is built only when requested.
+CORE_RESPONSE_FIELDS = ("applicant_id", "decision", "score")
+RESPONSE_SECTIONS = (
+    "score_band", "score_breakdown", "risk_factors", "approval_details",
+    "counter_offer", "eligible_tenors", "manual_review_reasons",
+    "regulatory_compliance", "explainability", "timestamp",
+)
+
+
+def response_fields(value: Any) -> Optional[List[str]]:
+    """Normalise a fields list or comma-separated string; ValueError on unknown names."""
+    if value is None:
+        return None
+    names   = [n.strip() for n in value.split(",")] if isinstance(value, str) else list(value)
+    names   = [n for n in names if n]
+    unknown = [n for n in names if n not in CORE_RESPONSE_FIELDS and n not in RESPONSE_SECTIONS]
+    if unknown:
+        raise ValueError(
+            f"Unknown response field(s) {', '.join(unknown)}; "
+            f"choose from {', '.join(RESPONSE_SECTIONS)}"
+        )
+    return names
+
 
 class AnalyzeRequest(BaseModel):
     """
@@ -131,6 +220,25 @@ class AnalyzeRequest(BaseModel):
 
     risk_policy carries the fintech's saved thresholds. When absent the brain
     uses RiskPolicy defaults, which match the original hardcoded constants.
+
+    _columns holds the columnar transaction view (app.columns). It is built
+    lazily from accounts[].transactions, or attached directly by the Arrow
+    decoder, in which case the per-account transaction lists stay empty.
+    _bureau caches the parsed credit_history (app.bureau) the same way.
+
+    feature_state is the FeatureState returned by a previous analysis of the
+    same accounts; only transactions newer than it are folded in. Set
+    include_feature_state to get the updated state back in the response.
+
+    fields, when set, limits the response to the core fields plus the listed
+    RESPONSE_SECTIONS; sections not listed are neither built nor serialised.
+
+    include_sensitivity adds explainability.sensitivity (app.sensitivity):
+    how far each tiered scorecard input would move the score.
+
+    scorecard_version pins the scorecard (app.scorecard) to score with; when
+    absent the active version is used, and the API records it here before
+    scoring, so a hot-reload mid-request cannot change it.
     """
     applicant_id: str
     applicant_name: str
@@ -142,6 +250,36 @@ class AnalyzeRequest(BaseModel):
     accounts: List[AccountData]
     credit_history: Optional[Dict[str, Any]] = None
     risk_policy: Optional[RiskPolicy] = None
+    include_trace: bool = False
+    feature_state: Optional[FeatureState] = None
+    include_feature_state: bool = False
+    include_sensitivity: bool = False
+    fields: Optional[List[str]] = None
+    scorecard_version: Optional[str] = None
+
+    _columns: Optional[Any] = PrivateAttr(default=None)
+    _bureau: Optional[Any] = PrivateAttr(default=None)
+    _state: Optional[Any] = PrivateAttr(default=None)
+
+    @field_validator("fields", mode="before")
+    @classmethod
+    def _check_fields(cls, value: Any) -> Optional[List[str]]:
+        return response_fields(value)
+
+    def wants(self, section: str) -> bool:
+        """Whether the response should carry `section` (see fields)."""
+        return self.fields is None or section in self.fields
+
+    def response_include(self) -> Optional[Set[str]]:
+        """Field set for AnalyzeResponse.model_dump(include=...); None for everything."""
+        if self.fields is None:
+            return None
+        include = {*CORE_RESPONSE_FIELDS, *self.fields}
+        if self.include_trace:
+            include.add("trace")
+        if self.include_feature_state:
+            include.add("feature_state")
+        return include
 
 
 
@@ -154,6 +292,7 @@ class ScoreBreakdown(BaseModel):
     debt_service_capacity: float
     account_behavior: float
     total: int
+    scorecard_version: Optional[str] = None
 
 
 class RiskFactor(BaseModel):
@@ -185,10 +324,35 @@ class EligibleTenor(BaseModel):
     monthly_payment: float
 
 
+class SensitivityStep(BaseModel):
+    value: float
+    change: Optional[float] = None      # value minus the applicant's; None when theirs is unknown
+    score: int
+    delta: int
+
+
+class FeatureSensitivity(BaseModel):
+    """How one scorecard input moves the score (app.sensitivity)."""
+    input: str
+    component: str
+    value: Optional[float] = None
+    down: Optional[SensitivityStep] = None
+    up: Optional[SensitivityStep] = None
+    to_next_gate: Optional[SensitivityStep] = None
+
+
+class ScoreSensitivity(BaseModel):
+    score: int
+    next_gate: Optional[str] = None
+    next_gate_score: Optional[int] = None
+    features: List[FeatureSensitivity] = []
+
+
 class Explainability(BaseModel):
     primary_reason: str
     key_strengths: List[str]
     key_weaknesses: List[str]
+    sensitivity: Optional[ScoreSensitivity] = None
 
 
 class RegulatoryCompliance(BaseModel):
@@ -198,17 +362,98 @@ class RegulatoryCompliance(BaseModel):
     thin_file: bool
 
 
+class TraceKnockout(BaseModel):
+    reason: str
+    detail: Optional[str] = None
+
+
+class TraceGate(BaseModel):
+    """A threshold comparison that decided (or could have decided) the outcome."""
+    gate: str
+    value: float
+    threshold: float
+    outcome: str
+
+
+class TraceCap(BaseModel):
+    """A limit that reduced the requested terms (thin-file amount/tenor caps)."""
+    cap: str
+    before: float
+    after: float
+
+
+class TraceAffordability(BaseModel):
+    webhook_income: float
+    avg_credits: float
+    safe_income: float
+    max_monthly_payment: float
+    amount: Optional[float] = None
+    tenor_months: Optional[int] = None
+    monthly_payment: Optional[float] = None
+    passed: Optional[bool] = None
+    max_affordable: Optional[float] = None
+    min_viable: Optional[float] = None
+    objective: Optional[str] = None
+    offered_tenor: Optional[int] = None
+
+
+class TraceTrigger(BaseModel):
+    trigger: str
+    value: float
+    threshold: float
+
+
+class TraceWindow(BaseModel):
+    """Transactions dropped at ingestion by RiskPolicy.analysis_window_months."""
+    months: int
+    since: str
+    dropped: int
+
+
+class DecisionTrace(BaseModel):
+    """
+    Compact record of how a decision was reached, accumulated as the pipeline
+    runs and emitted as a single log record (and optionally returned in the
+    response when the request sets include_trace).
+    """
+    applicant_id: str
+    decision: Optional[str] = None
+    score: Optional[int] = None
+    thin_file: Optional[bool] = None
+    income_source: Optional[str] = None
+    scorecard_version: Optional[str] = None
+    knockout: Optional[TraceKnockout] = None
+    score_breakdown: Dict[str, float] = {}
+    gates: List[TraceGate] = []
+    caps: List[TraceCap] = []
+    affordability: Optional[TraceAffordability] = None
+    triggers: List[TraceTrigger] = []
+    window: Optional[TraceWindow] = None
+    degraded: Optional[List[str]] = None
+    duration_ms: Optional[float] = None
+
+
 class AnalyzeResponse(BaseModel):
+    """
+    Sections other than applicant_id, decision and score are None (or empty)
+    when the request's fields projection leaves them out.
+
+    degraded lists the sections skipped because the request's deadline was
+    close (app.deadline); None when the response is complete.
+    """
     applicant_id: str
     decision: str           
     score: int          
-    score_band: str        
-    score_breakdown: ScoreBreakdown
-    risk_factors: List[RiskFactor]
+    score_band: Optional[str] = None
+    score_breakdown: Optional[ScoreBreakdown] = None
+    risk_factors: List[RiskFactor] = []
     approval_details: Optional[ApprovalDetails] = None
     counter_offer: Optional[CounterOffer] = None
     eligible_tenors: List[EligibleTenor] = []
     manual_review_reasons: List[str] = []
-    regulatory_compliance: RegulatoryCompliance
-    explainability: Explainability
-    timestamp: str
+    regulatory_compliance: Optional[RegulatoryCompliance] = None
+    explainability: Optional[Explainability] = None
+    timestamp: Optional[str] = None
+    trace: Optional[DecisionTrace] = None
+    feature_state: Optional[FeatureState] = None
+    degraded: Optional[List[str]] = None
@@ -0,0 +1,189 @@
+"""
+Synthetic AnalyzeRequest payloads.
+
+Builds gateway-shaped request bodies (the same JSON the NestJS
+callBrainService posts to /analyze) with a configurable number of
+transactions, so load tests and local experiments can exercise the full
+pipeline without real Mono data.
+
+Every payload is internally consistent: the identity matches the submitted
+name and BVN, income is recent, and the account is old enough — so the
+request runs through scoring and decision rather than stopping at a knockout.
+"""
+
+import random
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+
+FIRST_NAMES = ("Adaeze", "Chinedu", "Funmilayo", "Ibrahim", "Ngozi", "Oluwaseun", "Tunde", "Zainab")
+LAST_NAMES  = ("Okafor", "Adeyemi", "Bello", "Eze", "Lawal", "Nwosu", "Ogunleye", "Usman")
+
+DEBIT_NARRATIONS = (
+    "POS purchase SHOPRITE IKEJA", "Transfer to mama", "DSTV subscription",
+    "Airtime purchase MTN", "Uber trip", "IKEDC prepaid token",
+    "Transfer to landlord", "Jumia order", "ATM withdrawal", "Chowdeck order",
+)
+CREDIT_NARRATIONS = ("Transfer from friend", "Refund", "POS reversal", "Side gig payment")
+
+
+def synthetic_request(
+    n_transactions: int = 200,
+    n_accounts: int = 1,
+    seed: Optional[int] = None,
+    months: int = 12,
+    with_credit_history: bool = True,
+) -> Dict[str, Any]:
+    """
+    Return one AnalyzeRequest-shaped dict.
+
+    n_transactions is the total across all accounts; transactions are spread
+    over the last `months` months with one salary credit per month
+    per account and random debits in between.
+    """
+    rng   = random.Random(seed)
+    first = rng.choice(FIRST_NAMES)
+    last  = rng.choice(LAST_NAMES)
+    name  = f"{first} {last}"
+    bvn   = "".join(rng.choice("0123456789") for _ in range(11))
+
+    salary  = float(rng.randrange(150_000, 900_000, 5_000))
+    today   = date.today()
+    n_accounts = max(1, n_accounts)
+    per_account = max(1, n_transactions // n_accounts)
+
+    accounts = [
+        _account(rng, f"acct_{i}_{rng.getrandbits(32):08x}", name, bvn,
+                 salary / n_accounts, per_account, months, today)
+        for i in range(n_accounts)
+    ]
+
+    return {
+        "applicant_id":   f"applicant_{rng.getrandbits(48):012x}",
+        "applicant_name": name,
+        "applicant_bvn":  bvn,
+        "loan_amount":    float(rng.randrange(50_000, 1_500_000, 10_000)),
+        "tenor_months":   rng.choice((3, 6, 9, 12, 18, 24)),
+        "interest_rate":  float(rng.choice((18, 24, 30, 36))),
+        "purpose":        rng.choice(("rent", "school fees", "business", None)),
+        "accounts":       accounts,
+        "credit_history": _credit_history(rng, today) if with_credit_history else None,
+        "risk_policy":    None,
+    }
+
+
+def _account(
+    rng: random.Random,
+    account_id: str,
+    name: str,
+    bvn: str,
+    salary: float,
+    n_transactions: int,
+    months: int,
+    today: date,
+) -> Dict[str, Any]:
+    start    = today - timedelta(days=30 * months)
+    payday   = rng.randint(24, 28)
+    balance  = float(rng.randrange(20_000, 200_000, 1_000))
+    txns: List[Dict[str, Any]] = []
+
+    salary_dates = []
+    for m in range(months):
+        d = start + timedelta(days=30 * m)
+        try:
+            salary_dates.append(d.replace(day=payday))
+        except ValueError:
+            salary_dates.append(d)
+
+    n_debits  = max(0, n_transactions - len(salary_dates))
+    avg_debit = 0.8 * salary * months / max(1, n_debits)
+    events   = [(d, "salary") for d in salary_dates]
+    span     = max(1, (today - start).days)
+    events  += [(start + timedelta(days=rng.randrange(span)), "other") for _ in range(n_debits)]
+    events.sort(key=lambda e: e[0])
+
+    for i, (d, kind) in enumerate(events[:n_transactions]):
+        if kind == "salary":
+            txn_type, amount, narration = "credit", salary, "SALARY PAYMENT ACME LTD"
+        elif rng.random() < 0.12 or balance < 1_500:
+            txn_type  = "credit"
+            amount    = round(avg_debit * rng.uniform(0.1, 0.5), 2)
+            narration = rng.choice(CREDIT_NARRATIONS)
+        else:
+            txn_type  = "debit"
+            amount    = round(min(avg_debit * rng.uniform(0.2, 1.8), balance - 1_000), 2)
+            narration = rng.choice(DEBIT_NARRATIONS)
+
+        balance += amount if txn_type == "credit" else -amount
+        ts = datetime(d.year, d.month, d.day, rng.randrange(24), rng.randrange(60),
+                      tzinfo=timezone.utc)
+        txns.append({
+            "id":        f"{account_id}_txn_{i}",
+            "narration": narration,
+            "amount":    amount,
+            "type":      txn_type,
+            "balance":   round(balance, 2),
+            "date":      ts.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "category":  "income" if kind == "salary" else "unknown",
+        })
+
+    last_salary = max((d for d in salary_dates if d <= today), default=today)
+
+    return {
+        "account_id":      account_id,
+        "account_details": {"name": name.upper(), "currency": "NGN", "type": "SAVINGS_ACCOUNT"},
+        "balance":         round(balance, 2),
+        "transactions":    txns,
+        "identity":        {"full_name": name.upper(), "bvn": bvn},
+        "income": {
+            "income_streams": [{
+                "income_type":             "SALARY",
+                "frequency":               "MONTHLY",
+                "monthly_average":         salary,
+                "average_income_amount":   salary,
+                "last_income_amount":      salary,
+                "last_income_date":        last_salary.isoformat(),
+                "last_income_description": "SALARY PAYMENT ACME LTD",
+                "stability":               round(rng.uniform(0.6, 1.0), 2),
+                "periods_with_income":     months,
+                "number_of_incomes":       months,
+            }],
+            "monthly_income":                     salary,
+            "annual_income":                      salary * 12,
+            "aggregated_monthly_average":         salary,
+            "aggregated_monthly_average_regular": salary,
+            "total_regular_income_amount":        salary * months,
+            "total_income":                       salary * months,
+            "number_of_income_streams":           1,
+        },
+        "statement_insights": {
+            "account":           account_id,
+            "start_date":        start.isoformat(),
+            "end_date":          today.isoformat(),
+            "transaction_count": len(txns),
+            "account_summary":   {"average_balance": round(balance, 2)},
+            "activity_insights": {"rare_findings": {}},
+            "recurring_transactions": [],
+        },
+    }
+
+
+def _credit_history(rng: random.Random, today: date) -> Dict[str, Any]:
+    institutions = []
+    for inst in range(rng.randint(1, 3)):
+        loans = []
+        for _ in range(rng.randint(1, 3)):
+            opened = today - timedelta(days=rng.randrange(90, 1500))
+            schedule = [
+                {"status": "paid" if rng.random() < 0.95 else "late"}
+                for _ in range(rng.randint(3, 12))
+            ]
+            loans.append({
+                "loan_status":        rng.choice(("open", "closed", "closed")),
+                "performance_status": "performing",
+                "date_opened":        opened.strftime("%d-%m-%Y"),
+                "opening_balance":    float(rng.randrange(20_000, 500_000, 5_000)),
+                "repayment_schedule": schedule,
+            })
+        institutions.append({"institution": f"Lender {inst + 1}", "history": loans})
+    return {"credit_history": institutions}
@@ -0,0 +1,200 @@
+"""
+Readiness.
+
+/health answers as long as the process is alive. A worker can be alive and
+still saturated: its event loop is busy with queued statements, and new
+requests wait behind them. /ready reports the worker's load and answers
+503 while the worker is overloaded, so the load balancer routes elsewhere
+until it recovers.
+
+The signals are all cheap to read:
+
+  loop lag      a probe task sleeps for READY_PROBE_MS and records how late
+                it woke up. Everything in /analyze after the body read runs
+                on the event loop, so the lag is roughly how long a new
+                request waits before it is looked at. A probe that is
+                overdue when /ready is served counts as a sample too.
+  saturation    admission units in flight / capacity (app.admission), and
+                the threadpool that runs the sync endpoints
+  queue depth   requests queued for admission, per lane
+  latency p99   /analyze latency over the last READY_WINDOW_S, including
+                time queued for admission
+  warm-up       whether startup (and the warm-up, app.warmup) finished
+
+The worker is not ready when any of these holds:
+
+  - startup has not finished;
+  - the median lag over the last READY_LAG_SAMPLES probes is above
+    READY_MAX_LOOP_LAG_MS;
+  - more than READY_MAX_QUEUED realtime requests are queued (the batch
+    lane is meant to queue, so it is reported but not counted);
+  - the latency p99 is above READY_MAX_P99_MS (0 = not checked);
+  - admission saturation is at or above READY_MAX_SATURATION (0 = not
+    checked).
+
+Each worker answers for itself; a probe reaches whichever worker accepts
+the connection. Thresholds have no hysteresis, so set the load balancer's
+failure and success thresholds to smooth out flapping.
+
+    READY_PROBE_MS=250          loop-lag probe interval
+    READY_LAG_SAMPLES=20        probes the lag median is taken over
+    READY_MAX_LOOP_LAG_MS=250
+    READY_MAX_QUEUED=32
+    READY_MAX_P99_MS=0
+    READY_MAX_SATURATION=0
+    READY_WINDOW_S=60           latency window
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.logging_config import fields
+from app.warmup import STATE as STARTUP
+
+if TYPE_CHECKING:
+    from app.admission import AdmissionController
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Per-worker load signals and the ready / not-ready verdict for /ready."""
+
+    def __init__(
+        self,
+        probe_ms: float = 250.0,
+        lag_samples: int = 20,
+        max_loop_lag_ms: float = 250.0,
+        max_queued: int = 32,
+        max_p99_ms: float = 0.0,
+        max_saturation: float = 0.0,
+        window_s: float = 60.0,
+    ):
+        self.probe_s         = probe_ms / 1000
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.max_queued      = max_queued
+        self.max_p99_ms      = max_p99_ms
+        self.max_saturation  = max_saturation
+        self.window_s        = window_s
+
+        self._lags:      Deque[float] = deque(maxlen=lag_samples)          # ms
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=4096)   # (monotonic s, ms)
+        self._task:      Optional[asyncio.Task] = None
+        self._next_due:  Optional[float] = None
+        self._ready:     Optional[bool] = None
+
+    @classmethod
+    def from_env(cls) -> "Readiness":
+        return cls(
+            probe_ms=float(os.getenv("READY_PROBE_MS", "250")),
+            lag_samples=int(os.getenv("READY_LAG_SAMPLES", "20")),
+            max_loop_lag_ms=float(os.getenv("READY_MAX_LOOP_LAG_MS", "250")),
+            max_queued=int(os.getenv("READY_MAX_QUEUED", "32")),
+            max_p99_ms=float(os.getenv("READY_MAX_P99_MS", "0")),
+            max_saturation=float(os.getenv("READY_MAX_SATURATION", "0")),
+            window_s=float(os.getenv("READY_WINDOW_S", "60")),
+        )
+
+    # ── Probe ───────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Start the loop-lag probe on the running loop (call in each worker)."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._probe())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._next_due = loop.time() + self.probe_s
+            await asyncio.sleep(self.probe_s)
+            self._lags.append(max(0.0, loop.time() - self._next_due) * 1000)
+
+    def observe(self, duration_s: float) -> None:
+        """Record one /analyze latency."""
+        self._latencies.append((time.monotonic(), duration_s * 1000))
+
+    # ── Verdict ─────────────────────────────────────────────────────────────
+
+    def _lag_stats(self) -> Dict[str, float]:
+        lags = list(self._lags)
+        if self._next_due is not None:
+            overdue = (asyncio.get_running_loop().time() - self._next_due) * 1000
+            if overdue > 0:
+                lags.append(overdue)
+        if not lags:
+            return {"last": 0.0, "p50": 0.0, "max": 0.0}
+        return {
+            "last": round(lags[-1], 1),
+            "p50":  round(float(np.median(lags)), 1),
+            "max":  round(max(lags), 1),
+        }
+
+    def _latency_stats(self) -> Dict[str, Any]:
+        horizon = time.monotonic() - self.window_s
+        while self._latencies and self._latencies[0][0] < horizon:
+            self._latencies.popleft()
+        ms = np.fromiter((d for _, d in self._latencies), dtype=np.float64, count=len(self._latencies))
+        p50, p99 = np.percentile(ms, (50, 99)) if len(ms) else (0.0, 0.0)
+        return {"requests": len(ms), "p50": round(float(p50), 1), "p99": round(float(p99), 1)}
+
+    @staticmethod
+    def _threadpool() -> Dict[str, Any]:
+        try:
+            from anyio import to_thread
+            limiter = to_thread.current_default_thread_limiter()
+        except Exception:                                  # no anyio backend on this loop
+            return {}
+        return {"in_use": limiter.borrowed_tokens, "size": int(limiter.total_tokens)}
+
+    def check(self, admission: Optional["AdmissionController"]) -> Tuple[bool, Dict[str, Any]]:
+        """(ready, report); must be called on the event loop."""
+        reasons: List[str] = []
+        lag     = self._lag_stats()
+        latency = self._latency_stats()
+
+        if STARTUP.ready_ms is None:
+            reasons.append("starting")
+        if lag["p50"] > self.max_loop_lag_ms:
+            reasons.append("loop_lag")
+        if self.max_p99_ms > 0 and latency["p99"] > self.max_p99_ms:
+            reasons.append("latency_p99")
+
+        report: Dict[str, Any] = {
+            "warmed_up":   STARTUP.warmed_up,
+            "loop_lag_ms": lag,
+            "latency_ms":  {**latency, "window_s": self.window_s},
+            "threadpool":  self._threadpool(),
+        }
+        if admission is not None:
+            queued     = admission.queued()
+            saturation = admission.in_flight / admission.capacity
+            report["admission"] = {
+                "in_flight_units": admission.in_flight,
+                "capacity_units":  admission.capacity,
+                "saturation":      round(saturation, 3),
+                "queued":          queued,
+            }
+            if queued["realtime"] > self.max_queued:
+                reasons.append("queue_depth")
+            if self.max_saturation > 0 and saturation >= self.max_saturation:
+                reasons.append("saturation")
+
+        ready = not reasons
+        if ready != self._ready:
+            if self._ready is not None:
+                log = logger.info if ready else logger.warning
+                log("[READINESS]", extra=fields(ready=ready, reasons=reasons, loop_lag_ms=lag["p50"],
+                                                 p99_ms=latency["p99"]))
+            self._ready = ready
+        return ready, {"status": "ready" if ready else "not_ready", "reasons": reasons, **report}
@@ -0,0 +1,425 @@
+"""
+Versioned scorecards.
+
+The scoring rules — per component, the bin edges and points of each tiered
+input, the linear terms, the gates and caps, and the normal / thin-file
+weights — are data: one JSON file per version in app/scorecards/
+(SCORECARD_DIR). CreditScorer (app.scoring) derives the inputs from the
+features and the loan terms; a Scorecard turns them into points.
+
+Each file is compiled once, when loaded, into sorted edge arrays and point
+arrays. A tiered input is looked up by binary search over its edges:
+
+  closed "lower" (default)   x >= edge moves up a bin   (x >= 0.95 → 70)
+  closed "upper"             x <= edge stays in the bin  (x <= 31 → 25)
+
+An input that is NaN (not available) gets the term's `missing` points. A
+linear term is intercept + Σ coef·input, clamped to min/max, and scores 0
+while its `unless` input is positive. A component scores 0 unless its
+`requires` input is positive, and is capped at `cap`.
+
+Scorecard.score() evaluates one application with bisect on the compiled
+edges; Scorecard.score_batch() evaluates input columns with np.searchsorted
+on the same arrays, so both paths read one set of tables and agree to the
+last bit.
+
+ScorecardRegistry holds every version in the directory; the active one is
+named by the ACTIVE file (or pinned with SCORECARD_VERSION). It re-stats the
+directory at most every SCORECARD_RELOAD_SECONDS and, when a file changed,
+compiles the whole directory before swapping it in with a single reference
+assignment — a request sees either the old set or the new one, never a mix.
+A file that fails to compile is logged and the previous set stays in
+service. Versions are immutable once published: change the scoring by
+adding a file and pointing ACTIVE at it. A request can pin any loaded
+version with `scorecard_version`.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from app.logging_config import fields
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = Path(__file__).resolve().parent / "scorecards"
+ACTIVE_FILE = "ACTIVE"
+
+
+@dataclass
+class Bins:
+    """A tiered input: points[i] for the i-th bin of the sorted edges."""
+    input:   str
+    edges:   np.ndarray          # float64, strictly ascending
+    points:  np.ndarray          # float64, len(edges) + 1
+    upper:   bool                # bins are closed on the upper edge (x <= edge)
+    missing: float
+    _edges:  List[float] = field(init=False, repr=False)    # the same tables as lists, for bisect
+    _points: List[float] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._edges  = self.edges.tolist()
+        self._points = self.points.tolist()
+
+    def value(self, inputs: Mapping[str, float]) -> float:
+        x = inputs[self.input]
+        if x != x:
+            return self.missing
+        i = bisect_left(self._edges, x) if self.upper else bisect_right(self._edges, x)
+        return self._points[i]
+
+    def values(self, inputs: Mapping[str, np.ndarray]) -> np.ndarray:
+        x   = inputs[self.input]
+        pts = self.points[np.searchsorted(self.edges, x, side="left" if self.upper else "right")]
+        return np.where(np.isnan(x), self.missing, pts)
+
+
+@dataclass
+class Linear:
+    """intercept + Σ coef·input, clamped; 0 while `unless` is positive."""
+    coefs:     Tuple[Tuple[str, float], ...]
+    intercept: float
+    low:       Optional[float]
+    high:      Optional[float]
+    unless:    Optional[str]
+
+    def value(self, inputs: Mapping[str, float]) -> float:
+        if self.unless is not None and inputs[self.unless] > 0:
+            return 0.0
+        v = self.intercept
+        for name, coef in self.coefs:
+            v += coef * inputs[name]
+        if self.high is not None:
+            v = min(v, self.high)
+        if self.low is not None:
+            v = max(self.low, v)
+        return v
+
+    def values(self, inputs: Mapping[str, np.ndarray]) -> np.ndarray:
+        v = self.intercept
+        for name, coef in self.coefs:
+            v = v + coef * inputs[name]
+        if self.high is not None:
+            v = np.minimum(v, self.high)
+        if self.low is not None:
+            v = np.maximum(self.low, v)
+        if self.unless is not None:
+            v = np.where(inputs[self.unless] > 0, 0.0, v)
+        return v
+
+
+@dataclass
+class Component:
+    name:     str
+    terms:    List[Any]          # Bins | Linear, summed in order
+    requires: Optional[str]
+    cap:      float
+
+    def raw(self, inputs: Mapping[str, float]) -> float:
+        if self.requires is not None and not inputs[self.requires] > 0:
+            return 0.0
+        score = 0.0
+        for term in self.terms:
+            score += term.value(inputs)
+        return min(score, self.cap)
+
+    def raws(self, inputs: Mapping[str, np.ndarray], n: int) -> np.ndarray:
+        score = np.zeros(n)
+        for term in self.terms:
+            score += term.values(inputs)
+        score = np.minimum(score, self.cap)
+        if self.requires is not None:
+            score = np.where(inputs[self.requires] > 0, score, 0.0)
+        return score
+
+
+@dataclass
+class ScoreBatch:
+    """score_batch() output; row i matches score() on row i exactly."""
+    scores:        np.ndarray               # int64
+    contributions: Dict[str, np.ndarray]    # earned points per component, unrounded
+    raw:           Dict[str, np.ndarray]    # 0–100 per component
+
+    def breakdown(self, i: int) -> Dict[str, float]:
+        return {name: round(float(c[i]), 2) for name, c in self.contributions.items()}
+
+
+@dataclass
+class Scorecard:
+    version:           str
+    digest:            str
+    baseline:          int
+    max_earned_points: float
+    max_score:         int
+    components:        List[Component]
+    weights:           Dict[str, np.ndarray]    # "normal" / "thin_file" → weight per component
+    description:       str = ""
+    _weights:          Dict[str, List[float]] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._weights = {profile: w.tolist() for profile, w in self.weights.items()}
+
+    @property
+    def inputs(self) -> List[str]:
+        names = []
+        for comp in self.components:
+            if comp.requires is not None:
+                names.append(comp.requires)
+            for term in comp.terms:
+                if isinstance(term, Bins):
+                    names.append(term.input)
+                else:
+                    names.extend(name for name, _ in term.coefs)
+                    if term.unless is not None:
+                        names.append(term.unless)
+        return list(dict.fromkeys(names))
+
+    def score(self, inputs: Mapping[str, float], thin_file: bool) -> Tuple[int, Dict[str, float]]:
+        """(final score, earned points per component rounded to 2 dp)."""
+        weights = self._weights["thin_file" if thin_file else "normal"]
+
+        breakdown: Dict[str, float] = {}
+        total_earned = 0.0
+        for comp, weight in zip(self.components, weights):
+            max_points   = weight * self.max_earned_points
+            contribution = (comp.raw(inputs) / 100.0) * max_points
+            breakdown[comp.name] = round(contribution, 2)
+            total_earned        += contribution
+
+        final_score = int(self.baseline + total_earned)
+        return max(self.baseline, min(self.max_score, final_score)), breakdown
+
+    def score_batch(self, inputs: Mapping[str, np.ndarray], thin_file: np.ndarray) -> ScoreBatch:
+        """Vectorised score() over aligned input columns (and a thin_file flag per row)."""
+        thin_file = np.asarray(thin_file, dtype=bool)
+        n         = len(thin_file)
+        weights   = np.where(thin_file[:, None], self.weights["thin_file"], self.weights["normal"])
+
+        raw: Dict[str, np.ndarray] = {}
+        contributions: Dict[str, np.ndarray] = {}
+        total_earned = np.zeros(n)
+        for j, comp in enumerate(self.components):
+            raw[comp.name] = comp.raws(inputs, n)
+            max_points     = weights[:, j] * self.max_earned_points
+            contributions[comp.name] = (raw[comp.name] / 100.0) * max_points
+            total_earned  += contributions[comp.name]
+
+        scores = (self.baseline + total_earned).astype(np.int64)
+        return ScoreBatch(
+            scores=np.clip(scores, self.baseline, self.max_score),
+            contributions=contributions,
+            raw=raw,
+        )
+
+
+def _compile_term(spec: Dict[str, Any], where: str) -> Any:
+    if "linear" in spec:
+        return Linear(
+            coefs=tuple((name, float(c)) for name, c in spec["linear"].items()),
+            intercept=float(spec.get("intercept", 0.0)),
+            low=None if spec.get("min") is None else float(spec["min"]),
+            high=None if spec.get("max") is None else float(spec["max"]),
+            unless=spec.get("unless"),
+        )
+
+    edges  = np.asarray(spec["edges"], dtype=np.float64)
+    points = np.asarray(spec["points"], dtype=np.float64)
+    closed = spec.get("closed", "lower")
+    if closed not in ("lower", "upper"):
+        raise ValueError(f"{where}: closed must be 'lower' or 'upper', got '{closed}'")
+    if edges.ndim != 1 or (len(edges) > 1 and not np.all(np.diff(edges) > 0)):
+        raise ValueError(f"{where}: edges must be strictly ascending")
+    if len(points) != len(edges) + 1:
+        raise ValueError(f"{where}: expected {len(edges) + 1} points for {len(edges)} edges, got {len(points)}")
+    return Bins(
+        input=spec["input"],
+        edges=edges,
+        points=points,
+        upper=closed == "upper",
+        missing=float(spec.get("missing", 0.0)),
+    )
+
+
+def compile_scorecard(spec: Dict[str, Any], digest: str = "") -> Scorecard:
+    """Validate a scorecard document and compile it to lookup tables."""
+    version = spec.get("version")
+    if not version:
+        raise ValueError("scorecard has no version")
+
+    components = []
+    for name, comp in spec["components"].items():
+        terms = [
+            _compile_term(term, f"{version}.{name}.terms[{i}]")
+            for i, term in enumerate(comp["terms"])
+        ]
+        components.append(Component(
+            name=name, terms=terms, requires=comp.get("requires"), cap=float(comp.get("cap", 100.0)),
+        ))
+
+    names   = [c.name for c in components]
+    weights = {}
+    for profile in ("normal", "thin_file"):
+        table = spec["weights"][profile]
+        if set(table) != set(names):
+            raise ValueError(f"{version}: {profile} weights must cover exactly {names}")
+        weights[profile] = np.array([float(table[n]) for n in names])
+
+    return Scorecard(
+        version=str(version),
+        digest=digest,
+        baseline=int(spec["baseline"]),
+        max_earned_points=float(spec["max_earned_points"]),
+        max_score=int(spec["max_score"]),
+        components=components,
+        weights=weights,
+        description=spec.get("description", ""),
+    )
+
+
+def load_scorecard(path: Path) -> Scorecard:
+    raw = Path(path).read_bytes()
+    try:
+        return compile_scorecard(json.loads(raw), hashlib.blake2b(raw, digest_size=8).hexdigest())
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"{Path(path).name}: {e}") from e
+
+
+@dataclass
+class _Tables:
+    active:    str
+    versions:  Dict[str, Scorecard]
+    signature: Tuple
+    loaded_at: str
+
+
+class ScorecardRegistry:
+    """Every scorecard version in a directory, with the active one and polled hot-reload."""
+
+    def __init__(self, directory: Path = DEFAULT_DIR, version: Optional[str] = None, reload_seconds: float = 5.0):
+        self.directory      = Path(directory)
+        self.pinned         = version
+        self.reload_seconds = reload_seconds
+
+        self._lock       = threading.Lock()
+        self._next_check = time.monotonic() + reload_seconds
+        self._seen       = None
+        self.reloads       = 0
+        self.reload_errors = 0
+
+        self._tables = self._load(self._signature())
+        self._seen   = self._tables.signature
+
+    @classmethod
+    def from_env(cls) -> "ScorecardRegistry":
+        return cls(
+            directory=Path(os.getenv("SCORECARD_DIR") or DEFAULT_DIR),
+            version=os.getenv("SCORECARD_VERSION") or None,
+            reload_seconds=float(os.getenv("SCORECARD_RELOAD_SECONDS", "5")),
+        )
+
+    def _signature(self) -> Tuple:
+        entries = []
+        for path in sorted(self.directory.iterdir()):
+            if path.suffix == ".json" or path.name == ACTIVE_FILE:
+                st = path.stat()
+                entries.append((path.name, st.st_mtime_ns, st.st_size))
+        return tuple(entries)
+
+    def _load(self, signature: Tuple) -> _Tables:
+        versions: Dict[str, Scorecard] = {}
+        for path in sorted(self.directory.glob("*.json")):
+            card = load_scorecard(path)
+            if card.version in versions:
+                raise ValueError(f"{path.name}: duplicate scorecard version '{card.version}'")
+            versions[card.version] = card
+
+        active = self.pinned
+        if active is None:
+            marker = self.directory / ACTIVE_FILE
+            if marker.exists():
+                active = marker.read_text(encoding="utf-8").strip()
+            elif len(versions) == 1:
+                active = next(iter(versions))
+        if active not in versions:
+            raise ValueError(f"active scorecard '{active}' not found in {self.directory}")
+
+        return _Tables(
+            active=active,
+            versions=versions,
+            signature=signature,
+            loaded_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        )
+
+    def _maybe_reload(self) -> None:
+        if self.reload_seconds <= 0 or time.monotonic() < self._next_check:
+            return
+        if not self._lock.acquire(blocking=False):
+            return                                  # another thread is already checking
+        try:
+            self._next_check = time.monotonic() + self.reload_seconds
+            signature = self._signature()
+            if signature == self._seen:
+                return
+            self._seen = signature                  # a broken file is retried only once it changes again
+            previous   = self._tables.active
+            self._tables = self._load(signature)
+            self.reloads += 1
+            logger.info(
+                "Scorecards reloaded",
+                extra=fields(active=self._tables.active, previous=previous,
+                             versions=sorted(self._tables.versions)),
+            )
+        except Exception as e:
+            self.reload_errors += 1
+            logger.error(
+                "Scorecard reload failed; keeping the loaded scorecards",
+                extra=fields(directory=str(self.directory), error_type=type(e).__name__, error=str(e)),
+            )
+        finally:
+            self._lock.release()
+
+    @property
+    def active_version(self) -> str:
+        self._maybe_reload()
+        return self._tables.active
+
+    def get(self, version: Optional[str] = None) -> Scorecard:
+        """The scorecard for `version` (the active one when None); ValueError if unknown."""
+        self._maybe_reload()
+        tables = self._tables
+        key    = version or tables.active
+        card   = tables.versions.get(key)
+        if card is None:
+            raise ValueError(f"Unknown scorecard version '{key}' (loaded: {', '.join(sorted(tables.versions))})")
+        return card
+
+    def stats(self) -> Dict[str, Any]:
+        tables = self._tables
+        return {
+            "active":        tables.active,
+            "versions":      {v: c.digest for v, c in sorted(tables.versions.items())},
+            "loaded_at":     tables.loaded_at,
+            "reloads":       self.reloads,
+            "reload_errors": self.reload_errors,
+        }
+
+
+_default: Optional[ScorecardRegistry] = None
+
+
+def default_registry() -> ScorecardRegistry:
+    """The process-wide registry, configured from the environment on first use."""
+    global _default
+    if _default is None:
+        _default = ScorecardRegistry.from_env()
+    return _default
+
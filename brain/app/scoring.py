@@ -1,5 +1,10 @@
-from typing import Dict, Any, Tuple
+from typing import Any, Dict, Optional, Sequence, Tuple
 import logging
+import math
+
+import numpy as np
+
+from app.scorecard import ScoreBatch, Scorecard, ScorecardRegistry, default_registry
 
 logger = logging.getLogger(__name__)
 
@@ -24,25 +29,10 @@ logger = logging.getLogger(__name__)
 #   Cash Flow Health    30% → max 150 pts
 #   Debt Service Cap.   20% → max 100 pts
 #   Account Behavior    15% → max  75 pts
-
-BASELINE_SCORE    = 350
-MAX_EARNED_POINTS = 500
-
-NORMAL_WEIGHTS = {
-    "credit_history":       0.30,
-    "income_stability":     0.25,
-    "cash_flow_health":     0.20,
-    "debt_service_capacity": 0.15,
-    "account_behavior":     0.10,
-}
-
-THIN_FILE_WEIGHTS = {
-    "credit_history":       0.00,
-    "income_stability":     0.35,
-    "cash_flow_health":     0.30,
-    "debt_service_capacity": 0.20,
-    "account_behavior":     0.15,
-}
+#
+# The tiers, points, weights and the baseline live in the versioned scorecard
+# files under app/scorecards/ (see app.scorecard); v1.json holds the figures
+# above. This module turns features and loan terms into the scorecard's inputs.
 
 SCORE_BANDS = [
     (800, 850, "VERY_LOW_RISK"),
@@ -57,360 +47,148 @@ class CreditScorer:
     """
     Stage 3: Calculate a 350–850 credit score.
 
-    Each component scorer returns a raw 0–100 score.
-    The orchestrator multiplies each by its weight to get earned points,
-    adds the 350 baseline, and clamps to [350, 850].
+    scorecard_inputs() derives the scorecard inputs from the features and the
+    loan terms; the scorecard (app.scorecard) turns them into a raw 0–100 score
+    per component, weights them into earned points, adds the baseline, and
+    clamps to [baseline, max_score].
 
     Thin-file detection comes from features["is_thin_file"] set by FeatureExtractor.
-    When thin-file=True, the credit history component contributes 0 points and
-    the remaining 30% is redistributed across the other four components.
+    When thin-file=True, the scorecard's thin_file weights apply: the credit
+    history component contributes 0 points and its weight is redistributed
+    across the other four components.
+
+    calculate() scores one application; calculate_batch() scores many (or one
+    application under many loan terms) on the same compiled tables.
     """
 
+    def __init__(self, registry: Optional[ScorecardRegistry] = None, version: Optional[str] = None):
+        self.registry = registry or default_registry()
+        self.version  = version
+
+    def scorecard(self, version: Optional[str] = None) -> Scorecard:
+        """The scorecard for `version`, else this scorer's own, else the active one."""
+        return self.registry.get(version or self.version)
+
     def calculate(
         self,
         features: Dict[str, Any],
         loan_amount: float,
         tenor_months: int,
         interest_rate: float,
+        scorecard: Optional[Scorecard] = None,
     ) -> Tuple[int, Dict[str, float]]:
         """
         Returns (final_score, breakdown_dict).
         breakdown_dict values are the actual earned points per component (not raw 0-100).
         """
-        is_thin_file = features.get("is_thin_file", True)
-        weights      = THIN_FILE_WEIGHTS if is_thin_file else NORMAL_WEIGHTS
-
-        raw_scores = {
-            "credit_history":        self._score_credit_history(features),
-            "income_stability":      self._score_income_stability(features),
-            "cash_flow_health":      self._score_cash_flow_health(features),
-            "debt_service_capacity": self._score_debt_service_capacity(
-                                         features, loan_amount, tenor_months, interest_rate
-                                     ),
-            "account_behavior":      self._score_account_behavior(features),
-        }
-
-        breakdown: Dict[str, float] = {}
-        total_earned = 0.0
-        for component, raw in raw_scores.items():
-            max_points   = weights[component] * MAX_EARNED_POINTS
-            contribution = (raw / 100.0) * max_points
-            breakdown[component] = round(contribution, 2)
-            total_earned        += contribution
-
-        final_score = int(BASELINE_SCORE + total_earned)
-        final_score = max(BASELINE_SCORE, min(850, final_score))
-
-        logger.info(
-            f"[SCORE] score={final_score} thin_file={is_thin_file} "
-            f"credit_history={breakdown.get('credit_history', 0):.1f} "
-            f"income_stability={breakdown.get('income_stability', 0):.1f} "
-            f"cash_flow={breakdown.get('cash_flow_health', 0):.1f} "
-            f"dsc={breakdown.get('debt_service_capacity', 0):.1f} "
-            f"account_behavior={breakdown.get('account_behavior', 0):.1f}"
-        )
-        return final_score, breakdown
-
-    def get_score_band(self, score: int) -> str:
-        for low, high, band in SCORE_BANDS:
-            if low <= score <= high:
-                return band
-        return "VERY_HIGH_RISK"
-
-    def _score_credit_history(self, features: Dict) -> float:
-        """
-        Breakdown:
-          70 pts — repayment performance (payment_success_rate)
-          20 pts — credit age (older history = more reliable signal)
-          10 pts — loan closure rate (successfully repaid loans)
-
-        Returns 0 for thin-file applicants. Since thin-file weight is 0%,
-        this contributes 0 points regardless — but the raw score is still
-        logged so you can see how this component would have scored.
-        """
-        if not features.get("has_credit_history"):
-            return 0.0
-
-        score = 0.0
-
-
-        psr = features.get("payment_success_rate")
-        if psr is None:
-            score += 35.0   
-        elif psr >= 0.95:
-            score += 70.0
-        elif psr >= 0.90:
-            score += 55.0
-        elif psr >= 0.80:
-            score += 35.0
-        elif psr >= 0.70:
-            score += 15.0
-        else:
-            score += 0.0
-
-        age = features.get("credit_age_months", 0.0)
-        if age >= 36:
-            score += 20.0
-        elif age >= 24:
-            score += 15.0
-        elif age >= 12:
-            score += 10.0
-        else:
-            score += 5.0
-
-        total  = features.get("total_loan_count", 0)
-        closed = features.get("closed_loan_count", 0)
-        if total > 0:
-            closure_rate = closed / total
-            if closure_rate >= 0.70:
-                score += 10.0
-            elif closure_rate >= 0.50:
-                score += 6.0
-            else:
-                score += 2.0
-
-        return min(score, 100.0)
-
-
-    def _score_income_stability(self, features: Dict) -> float:
-        """
-        Breakdown:
-          35 pts — income type quality × frequency (stable_income_ratio as proxy)
-          25 pts — income recency (how recently was the last payment received?)
-          20 pts — Mono's stability score (0–1 from income webhook)
-          15 pts — income growth (growing > stable > declining)
-           5 pts — income diversity (multiple streams = resilience)
-
-        When income_source="transaction_fallback", avg_income_stability is
-        conservatively set to 0.5 by FeatureExtractor, which naturally lowers
-        this component's score without a special case here.
-        """
-        monthly_income = features.get("total_monthly_income", 0.0)
-        if monthly_income <= 0:
-            return 0.0
-
-        score = 0.0
-
-
-        stable_ratio = features.get("stable_income_ratio", 0.0)
-        if stable_ratio >= 0.80:
-            score += 35.0
-        elif stable_ratio >= 0.60:
-            score += 26.0
-        elif stable_ratio >= 0.40:
-            score += 18.0
-        elif stable_ratio >= 0.20:
-            score += 10.0
-        else:
-            score += 5.0    
-
-
-        recency = features.get("income_recency_days", 999)
-        if recency <= 31:
-            score += 25.0
-        elif recency <= 45:
-            score += 18.0
-        elif recency <= 60:
-            score += 10.0
-        elif recency <= 90:
-            score += 5.0
-        else:
-            score += 0.0
-
-
-        avg_stability = features.get("avg_income_stability", 0.0)
-        score += avg_stability * 20.0   
-
-       
-        if features.get("income_is_growing"):
-            score += 15.0
-        else:
-     
-            regular_ratio = features.get("income_regular_ratio", 0.0)
-            score += regular_ratio * 8.0   
-
-    
-        stream_count = features.get("income_stream_count", 0)
-        score += min(stream_count * 2.0, 5.0)
-
-        return min(score, 100.0)
-
+        card   = scorecard or self.scorecard()
+        inputs = self.scorecard_inputs(features, loan_amount, tenor_months, interest_rate)
+        return card.score(inputs, features.get("is_thin_file", True))
 
-
-    def _score_cash_flow_health(self, features: Dict) -> float:
+    def calculate_batch(
+        self,
+        features: Sequence[Dict[str, Any]],
+        loan_amounts: Any,
+        tenor_months: Any,
+        interest_rates: Any,
+        scorecard: Optional[Scorecard] = None,
+    ) -> ScoreBatch:
         """
-        Breakdown:
-          30 pts — surplus ratio (net cash flow / total inflow)
-          30 pts — positive cash flow months (% of months income > expenses)
-          20 pts — debit-to-credit ratio
-          20 pts — spending volatility (predictable spending = lower risk)
-
-        If Mono's statement insights are available, inflow_avg_last_12m and
-        outflow_avg_last_12m give us more accurate 12-month averages. These
-        inform surplus_ratio naturally through the features dict.
+        Vectorised calculate(). The feature rows and the loan-term arrays
+        broadcast against each other, so one features dict with arrays of
+        amounts and tenors scores every (amount, tenor) pair.
         """
-        score = 0.0
-
-     
-        surplus_ratio = features.get("surplus_ratio", 0.0)
-        if surplus_ratio >= 0.30:
-            score += 30.0
-        elif surplus_ratio >= 0.20:
-            score += 24.0
-        elif surplus_ratio >= 0.10:
-            score += 15.0
-        elif surplus_ratio >= 0.0:
-            score += 8.0
-        else:
-            score += 0.0    
-
-      
-        positive_ratio = features.get("positive_cash_flow_ratio", 0.0)
-        score += positive_ratio * 30.0
-
-        dtc = features.get("debit_to_credit_ratio", 999.0)
-        if dtc <= 0.70:
-            score += 20.0
-        elif dtc <= 0.90:
-            score += 16.0
-        elif dtc <= 1.00:
-            score += 10.0
-        elif dtc <= 1.20:
-            score += 5.0
-        else:
-            score += 0.0
-
-        
-        volatility = features.get("spending_volatility", 1.0)
-        if volatility <= 0.20:
-            score += 20.0
-        elif volatility <= 0.40:
-            score += 14.0
-        elif volatility <= 0.60:
-            score += 8.0
-        elif volatility <= 0.80:
-            score += 3.0
-        else:
-            score += 0.0
-
-        return min(score, 100.0)
-
-
-    def _score_debt_service_capacity(
+        card = scorecard or self.scorecard()
+        rows = [self._feature_inputs(f) for f in features]
+        cols = {name: np.array([r[name] for r in rows], dtype=np.float64) for name in rows[0]}
+
+        arrays = np.broadcast_arrays(
+            np.asarray(loan_amounts, dtype=np.float64),
+            np.asarray(tenor_months, dtype=np.int64),
+            np.asarray(interest_rates, dtype=np.float64),
+            *cols.values(),
+        )
+        amount, tenor, rate = (np.ravel(a) for a in arrays[:3])
+        inputs = {name: np.ravel(a) for name, a in zip(cols, arrays[3:])}
+
+        safe     = inputs["safe_income"]
+        existing = inputs["recurring_debt_monthly"]
+        payment  = self._amortize_batch(amount, tenor, rate)
+        has_safe = safe > 0
+        divisor  = np.where(has_safe, safe, 1.0)
+        inputs["total_dti"]    = np.where(has_safe, (payment + existing) / divisor, np.nan)
+        inputs["existing_dti"] = np.where(has_safe, existing / divisor, np.nan)
+        return card.score_batch(inputs, inputs["is_thin_file"] > 0)
+
+    def scorecard_inputs(
         self,
-        features: Dict,
+        features: Dict[str, Any],
         loan_amount: float,
         tenor_months: int,
         interest_rate: float,
-    ) -> float:
-        """
-        Can this person afford THIS loan given what they already owe?
-
-        Breakdown:
-          60 pts — DTI ratio including this loan's monthly payment
-          40 pts — existing debt burden ratio (before this loan)
-
-        safe_income: the more conservative of monthly income vs average monthly credits.
-        We use the conservative reading to avoid over-approving.
-
-        Amortization formula: P × [r(1+r)^n] / [(1+r)^n - 1]
-        where r = monthly rate, n = tenor months.
-        """
-        monthly_income = features.get("total_monthly_income", 0.0)
-        avg_credits    = features.get("monthly_avg_credits", 0.0)
-        safe_income    = min(monthly_income, avg_credits) if monthly_income > 0 else avg_credits
-
-        if safe_income <= 0:
-            return 0.0
-
-        monthly_payment     = self._amortize(loan_amount, tenor_months, interest_rate)
-        existing_obligation = features.get("recurring_debt_monthly", 0.0)
-        total_obligation    = monthly_payment + existing_obligation
-        total_dti           = total_obligation / safe_income
-
-
-        if total_dti < 0.30:
-            dti_score = 60.0
-        elif total_dti < 0.40:
-            dti_score = 45.0
-        elif total_dti < 0.50:
-            dti_score = 25.0
+    ) -> Dict[str, float]:
+        """Scorecard inputs for one application; NaN marks an input that is not available."""
+        inputs   = self._feature_inputs(features)
+        safe     = inputs["safe_income"]
+        existing = inputs["recurring_debt_monthly"]
+        if safe > 0:
+            payment = self._amortize(loan_amount, tenor_months, interest_rate)
+            inputs["total_dti"]    = (payment + existing) / safe
+            inputs["existing_dti"] = existing / safe
         else:
-            dti_score = 0.0
+            inputs["total_dti"]    = math.nan
+            inputs["existing_dti"] = math.nan
+        return inputs
 
-
-        existing_dti = existing_obligation / safe_income
-        if existing_dti < 0.20:
-            burden_score = 40.0
-        elif existing_dti < 0.30:
-            burden_score = 28.0
-        elif existing_dti < 0.40:
-            burden_score = 15.0
-        else:
-            burden_score = 0.0
-
-        return min(dti_score + burden_score, 100.0)
-
-
-
-    def _score_account_behavior(self, features: Dict) -> float:
+    def _feature_inputs(self, features: Dict[str, Any]) -> Dict[str, float]:
         """
-        Account discipline over time.
-
-        Breakdown:
-          40 pts — account age (more history = more data = more confidence)
-          30 pts — overdraft and bounce discipline
-          20 pts — minimum balance maintenance (days_below_1000 proxy)
-          10 pts — absence of high-risk transactions
+        The inputs that do not depend on the loan terms.
 
-        For thin-file applicants this component carries 15% weight (up from 10%)
-        because account behaviour is one of the strongest available signals
-        when credit history is absent.
+        payment_success_rate is NaN without bureau repayments and
+        loan_closure_rate without bureau loans (the scorecard's `missing`
+        points apply). safe_income is the more conservative of monthly income
+        and average monthly credits, so DTI is never measured against an
+        optimistic income.
         """
-        score = 0.0
-
-
-        age = features.get("account_age_months", 0.0)
-        if age >= 24:
-            score += 40.0
-        elif age >= 18:
-            score += 32.0
-        elif age >= 12:
-            score += 22.0
-        elif age >= 6:
-            score += 12.0
-        else:
-            score += 5.0
-
-        overdrafts = features.get("overdraft_count", 0)
-        bounced    = features.get("bounced_payment_count", 0)
-        penalty    = (overdrafts * 3) + (bounced * 5)
-        score     += max(0.0, 30.0 - penalty)
-
-
-        days_low = features.get("days_below_1000_ngn", 0)
-        if days_low == 0:
-            score += 20.0
-        elif days_low <= 3:
-            score += 14.0
-        elif days_low <= 7:
-            score += 8.0
-        elif days_low <= 14:
-            score += 3.0
-        else:
-            score += 0.0
+        psr    = features.get("payment_success_rate")
+        total  = features.get("total_loan_count", 0)
+        closed = features.get("closed_loan_count", 0)
 
-     
-        high_risk = features.get("high_risk_transaction_count", 0)
-        if high_risk == 0:
-            score += 10.0
-        elif high_risk <= 3:
-            score += 5.0
-        else:
-            score += 0.0
+        monthly_income = features.get("total_monthly_income", 0.0)
+        avg_credits    = features.get("monthly_avg_credits", 0.0)
+        safe_income    = min(monthly_income, avg_credits) if monthly_income > 0 else avg_credits
 
-        return min(score, 100.0)
+        return {
+            "is_thin_file":                float(bool(features.get("is_thin_file", True))),
+            "has_credit_history":          float(bool(features.get("has_credit_history"))),
+            "payment_success_rate":        math.nan if psr is None else float(psr),
+            "credit_age_months":           float(features.get("credit_age_months", 0.0)),
+            "loan_closure_rate":           closed / total if total > 0 else math.nan,
+            "total_monthly_income":        float(monthly_income),
+            "stable_income_ratio":         float(features.get("stable_income_ratio", 0.0)),
+            "income_recency_days":         float(features.get("income_recency_days", 999)),
+            "avg_income_stability":        float(features.get("avg_income_stability", 0.0)),
+            "income_is_growing":           float(bool(features.get("income_is_growing"))),
+            "income_regular_ratio":        float(features.get("income_regular_ratio", 0.0)),
+            "income_stream_count":         float(features.get("income_stream_count", 0)),
+            "surplus_ratio":               float(features.get("surplus_ratio", 0.0)),
+            "positive_cash_flow_ratio":    float(features.get("positive_cash_flow_ratio", 0.0)),
+            "debit_to_credit_ratio":       float(features.get("debit_to_credit_ratio", 999.0)),
+            "spending_volatility":         float(features.get("spending_volatility", 1.0)),
+            "safe_income":                 float(safe_income),
+            "recurring_debt_monthly":      float(features.get("recurring_debt_monthly", 0.0)),
+            "account_age_months":          float(features.get("account_age_months", 0.0)),
+            "overdraft_count":             float(features.get("overdraft_count", 0)),
+            "bounced_payment_count":       float(features.get("bounced_payment_count", 0)),
+            "days_below_1000_ngn":         float(features.get("days_below_1000_ngn", 0)),
+            "high_risk_transaction_count": float(features.get("high_risk_transaction_count", 0)),
+        }
 
+    def get_score_band(self, score: int) -> str:
+        for low, high, band in SCORE_BANDS:
+            if low <= score <= high:
+                return band
+        return "VERY_HIGH_RISK"
 
     def _amortize(self, principal: float, months: int, annual_rate_pct: float) -> float:
         """
@@ -424,3 +202,12 @@ class CreditScorer:
             return principal / months
         r = (annual_rate_pct / 100.0) / 12.0
         return principal * (r * (1 + r) ** months) / ((1 + r) ** months - 1)
+
+    def _amortize_batch(self, principal: np.ndarray, months: np.ndarray, annual_rate_pct: np.ndarray) -> np.ndarray:
+        """_amortize() over arrays, element for element."""
+        r      = (annual_rate_pct / 100.0) / 12.0
+        n      = np.maximum(months, 1)
+        safe_r = np.where(r == 0, 1.0, r)
+        growth = (1 + safe_r) ** n
+        payment = np.where(r == 0, principal / n, principal * (safe_r * growth) / (growth - 1))
+        return np.where(months <= 0, principal, payment)
@@ -0,0 +1,170 @@
+"""
+Score sensitivity.
+
+Explainability lists fixed strengths and weaknesses. Sensitivity shows
+which scorecard inputs actually move this applicant's score, and by how
+much. Every tiered input (a Bins term of the scorecard, app.scorecard) is
+moved into each of its other bins. All the moved rows are then scored in a
+single Scorecard.score_batch() call, on the same compiled tables that
+produced the score.
+
+A row changes one input and holds every other input at the applicant's
+values. The value used for a bin is the one nearest the current value: the
+bin's edge, or one resolution step past it when the edge belongs to the
+neighbouring bin. Counts, days and months step by 1 and everything else by
+0.01, so a value reads like data ("11 months", "0.69"), not like a float
+boundary.
+
+For each input that can move the score, the report gives:
+
+  down / up      the score change from moving into the neighbouring bin
+                 below / above the current value
+  to_next_gate   the smallest change of this input alone that lifts the
+                 score to the next policy gate (score_reject_floor,
+                 score_manual_floor, score_approve_floor); None when no
+                 bin gets there, or when the score is already past the
+                 last gate
+
+Linear terms (cash-flow ratio, overdraft discipline, ...) have no bins and
+are not perturbed. Inputs that are not available (NaN) are moved into every
+bin, with no change figure. The loan terms come in through total_dti, so
+its row says what a smaller or larger payment would do.
+
+The v1 scorecard gives about 30 moved rows, scored in one call rather
+than one calculate() each.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.models import FeatureSensitivity, RiskPolicy, ScoreSensitivity, SensitivityStep
+from app.scorecard import Bins, Scorecard
+
+# Inputs measured in whole units; every other input moves in steps of 0.01.
+WHOLE_UNIT_INPUTS = {
+    "credit_age_months", "account_age_months", "income_recency_days",
+    "days_below_1000_ngn", "high_risk_transaction_count",
+}
+DEFAULT_RESOLUTION = 0.01
+
+
+def policy_gates(policy: RiskPolicy) -> List[Tuple[str, int]]:
+    return [
+        ("score_reject_floor",  policy.score_reject_floor),
+        ("score_manual_floor",  policy.score_manual_floor),
+        ("score_approve_floor", policy.score_approve_floor),
+    ]
+
+
+def _binned_inputs(card: Scorecard) -> Dict[str, Tuple[str, List[Bins]]]:
+    """input → (first component that bins it, every Bins term on it)."""
+    binned: Dict[str, Tuple[str, List[Bins]]] = {}
+    for comp in card.components:
+        for term in comp.terms:
+            if isinstance(term, Bins):
+                binned.setdefault(term.input, (comp.name, []))[1].append(term)
+    return binned
+
+
+def _bin_index(term: Bins, x: float) -> int:
+    return bisect_left(term._edges, x) if term.upper else bisect_right(term._edges, x)
+
+
+def _bin_values(term: Bins, x: float, step: float) -> List[float]:
+    """The value nearest `x` inside each bin of `term` other than x's own."""
+    edges   = term._edges
+    current = _bin_index(term, x) if x == x else -1
+
+    values = []
+    for i in range(len(edges) + 1):
+        if i == current:
+            continue
+        if x == x and i < current:
+            # Below: just under the bin's upper edge when that edge opens the next bin.
+            v = edges[i] if term.upper else edges[i] - step
+        elif i == 0:
+            v = edges[0] if term.upper else edges[0] - step
+        else:
+            # Above (or no current value): just over the bin's lower edge.
+            v = edges[i - 1] + step if term.upper else edges[i - 1]
+        if _bin_index(term, v) == i:
+            values.append(float(v))
+    return values
+
+
+def score_sensitivity(
+    card: Scorecard,
+    inputs: Dict[str, float],
+    thin_file: bool,
+    score: int,
+    gates: Sequence[Tuple[str, int]],
+) -> ScoreSensitivity:
+    """
+    Sensitivity of `score` (scored by `card` on `inputs`, see
+    CreditScorer.scorecard_inputs) to each tiered input.
+    """
+    next_gate = next(((name, t) for name, t in gates if t > score), None)
+
+    # Row 0 is the applicant as scored; the rest move one input each.
+    moved: List[Tuple[str, float]] = []
+    binned = _binned_inputs(card)
+    for name, (_, terms) in binned.items():
+        x    = inputs[name]
+        step = 1.0 if name in WHOLE_UNIT_INPUTS else DEFAULT_RESOLUTION
+        for v in sorted({v for term in terms for v in _bin_values(term, x, step)}):
+            moved.append((name, v))
+
+    n    = len(moved) + 1
+    cols = {k: np.full(n, v, dtype=np.float64) for k, v in inputs.items()}
+    for row, (name, v) in enumerate(moved, start=1):
+        cols[name][row] = v
+    scores = card.score_batch(cols, np.full(n, thin_file)).scores
+    base   = int(scores[0])
+
+    by_input: Dict[str, List[Tuple[float, int]]] = {}
+    for row, (name, v) in enumerate(moved, start=1):
+        by_input.setdefault(name, []).append((v, int(scores[row])))
+
+    features: List[Tuple[int, FeatureSensitivity]] = []
+    for name, rows in by_input.items():
+        deltas = [s - base for _, s in rows]
+        if not any(deltas):
+            continue
+        x     = inputs[name]
+        known = x == x
+
+        def step(v: float, s: int) -> SensitivityStep:
+            return SensitivityStep(
+                value=round(v, 4),
+                change=round(v - x, 4) if known else None,
+                score=s,
+                delta=s - base,
+            )
+
+        down = max(((v, s) for v, s in rows if known and v < x), default=None)
+        up   = min(((v, s) for v, s in rows if known and v > x), default=None)
+        to_gate = None
+        if next_gate is not None:
+            crossing = [(v, s) for v, s in rows if s >= next_gate[1]]
+            if crossing:
+                v, s = min(crossing, key=lambda r: abs(r[0] - x)) if known else max(crossing, key=lambda r: r[1])
+                to_gate = step(v, s)
+
+        features.append((max(abs(d) for d in deltas), FeatureSensitivity(
+            input=name,
+            component=binned[name][0],
+            value=round(x, 4) if known else None,
+            down=step(*down) if down else None,
+            up=step(*up) if up else None,
+            to_next_gate=to_gate,
+        )))
+
+    features.sort(key=lambda f: -f[0])
+    return ScoreSensitivity(
+        score=base,
+        next_gate=next_gate[0] if next_gate else None,
+        next_gate_score=next_gate[1] if next_gate else None,
+        features=[f for _, f in features],
+    )
@@ -0,0 +1,206 @@
+"""
+Preloading multi-worker server for the Brain service.
+
+`fastapi run` / `uvicorn --workers N` start each worker from scratch (uvicorn
+spawns rather than forks), so every worker imports the app, builds its
+schemas and warms up independently, and nothing is shared between them.
+
+This entry point instead:
+  1. imports the app and runs warm_up() once in the parent,
+  2. collects garbage and gc.freeze()s everything allocated so far, so
+     collections in the workers never touch (and never copy) those pages,
+  3. binds the listening socket once and forks N workers that all accept
+     on it, each running a uvicorn.Server.
+
+Workers share the parent's read-only pages copy-on-write. The parent stays
+behind as a supervisor: it restarts workers that die and forwards
+SIGTERM/SIGINT for a graceful shutdown.
+
+Transport: besides TCP, the service can listen on a Unix domain socket
+(--uds) for a co-located gateway, which skips the TCP handshake and
+loopback stack per connection. Keep-alive timeout, listen backlog and the
+HTTP/1.1 parser (httptools handles pipelined requests fastest) are tunable.
+uvicorn speaks HTTP/1.1 only, so there is no h2c; persistent HTTP/1.1
+connections give the same connection reuse for this request/response API.
+
+Usage:
+    python -m app.serve --host 0.0.0.0 --port 8000 --workers 4
+    WEB_CONCURRENCY=4 python -m app.serve
+    python -m app.serve --uds /run/brain/brain.sock --no-tcp --keep-alive 75
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import stat
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+import uvicorn
+
+from app.logging_config import fields
+
+logger = logging.getLogger(__name__)
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock   = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def bind_unix_socket(path: str, backlog: int = 2048, mode: int = 0o660) -> socket.socket:
+    """Bind a Unix domain socket, replacing a stale socket file from a previous run."""
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise SystemExit(f"{path} exists and is not a socket")
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    os.chmod(path, mode)
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def bind_sockets(args: argparse.Namespace) -> List[socket.socket]:
+    sockets = []
+    if not args.no_tcp:
+        sockets.append(bind_socket(args.host, args.port, args.backlog))
+    if args.uds:
+        sockets.append(bind_unix_socket(args.uds, args.backlog, int(args.uds_mode, 8)))
+    if not sockets:
+        raise SystemExit("--no-tcp needs --uds")
+    return sockets
+
+
+def _server_config(app, args: argparse.Namespace) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        log_config=None,
+        access_log=False,
+        lifespan="on",
+        http=args.http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+    )
+
+
+class Supervisor:
+    """Forks and supervises worker processes sharing the listening sockets."""
+
+    def __init__(self, app, sockets: List[socket.socket], args: argparse.Namespace):
+        self._app      = app
+        self._sockets  = sockets
+        self._args     = args
+        self._workers: Dict[int, int] = {}
+        self._stopping = False
+
+    def _spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            gc.enable()
+            server = uvicorn.Server(_server_config(self._app, self._args))
+            code   = 0
+            try:
+                server.run(sockets=self._sockets)
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self._workers[pid] = slot
+
+    def _stop(self, signum, frame) -> None:
+        self._stopping = True
+        for pid in list(self._workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        for slot in range(self._args.workers):
+            self._spawn(slot)
+        gc.enable()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while self._workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot = self._workers.pop(pid, None)
+            if slot is None or self._stopping:
+                continue
+            logger.warning(
+                "Worker exited unexpectedly — restarting",
+                extra=fields(pid=pid, slot=slot, status=status),
+            )
+            time.sleep(0.5)
+            self._spawn(slot)
+        return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.serve",
+        description="Run the Brain API with warm-up, gc.freeze and preforked workers.",
+    )
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--uds", default=os.getenv("BRAIN_UDS"),
+                        help="Also listen on this Unix domain socket path")
+    parser.add_argument("--uds-mode", default="660", help="Permissions for the socket file (octal)")
+    parser.add_argument("--no-tcp", action="store_true", help="Listen on --uds only")
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE", "5")),
+                        help="Seconds to hold idle keep-alive connections open; set above the "
+                             "client's idle-socket timeout so the client always closes first")
+    parser.add_argument("--backlog", type=int, default=2048, help="Listen backlog")
+    parser.add_argument("--http", choices=("auto", "h11", "httptools"), default="auto",
+                        help="HTTP/1.1 implementation (auto prefers httptools)")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    gc.disable()
+
+    from app.main import app
+    from app.warmup import warm_up
+
+    warm_up(app)
+    gc.collect()
+    gc.freeze()
+
+    sockets = bind_sockets(args)
+    try:
+        if args.workers <= 1:
+            gc.enable()
+            uvicorn.Server(_server_config(app, args)).run(sockets=sockets)
+            return 0
+
+        return Supervisor(app, sockets, args).run()
+    finally:
+        if args.uds and os.path.exists(args.uds):
+            os.unlink(args.uds)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
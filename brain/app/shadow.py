@@ -0,0 +1,236 @@
+"""
+Shadow scoring.
+
+Runs a candidate CreditScorer / DecisionEngine next to production on live
+traffic, so a scorer or policy change can be judged on real applications
+before it ships. The candidate reuses the features production has already
+extracted; only scoring and the decision are repeated.
+
+  - submit() never blocks the request: it hands the work to a small thread
+    pool and returns. When `max_pending` comparisons are already queued or
+    running, the new one is dropped and counted, rather than queued.
+  - Each comparison is appended as one JSON line to the sink file:
+    production and candidate decision, score and breakdown, the score
+    delta, and whether the decision changed.
+  - Knocked-out requests are not shadowed (knockouts come before scoring).
+
+Configured from the environment (ShadowRunner.from_env):
+
+    SHADOW_SCORER=module:Class       candidate CreditScorer (default: production's)
+    SHADOW_SCORECARD=v2              candidate scorecard version (app.scorecard)
+    SHADOW_DECISION=module:Class     candidate DecisionEngine (default: production's)
+    SHADOW_LABEL=v2-income-tiers     written on every record (default: the class paths)
+    SHADOW_SINK=shadow.jsonl         output file; {pid} is replaced by the process id
+    SHADOW_SAMPLE_RATE=1.0           fraction of scored requests to shadow
+    SHADOW_WORKERS=1                 pool threads
+    SHADOW_MAX_PENDING=64            bound on queued + running comparisons
+
+Shadowing is off unless one of SHADOW_SCORER, SHADOW_SCORECARD or
+SHADOW_DECISION is set. The pool shares the interpreter with request
+handling, so it competes for the GIL; a single worker and the drop policy
+keep that cost bounded. The pool is created lazily and again after a fork,
+so the preload server's parent never starts threads its workers would
+inherit dead.
+"""
+
+import importlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from app.decision import DecisionEngine
+from app.logging_config import fields
+from app.models import AnalyzeRequest, AnalyzeResponse, DecisionTrace, RiskPolicy
+from app.scoring import CreditScorer
+
+logger = logging.getLogger(__name__)
+
+
+def load_object(path: str) -> Any:
+    """'package.module:Name' → the object."""
+    module, _, name = path.partition(":")
+    if not name:
+        raise ValueError(f"Expected 'module:Name', got '{path}'")
+    return getattr(importlib.import_module(module), name)
+
+
+class ShadowSink:
+    """Appends one JSON line per comparison; safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._fh   = None
+        self._pid  = None
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if self._fh is None or self._pid != os.getpid():
+                # Opened in the process that writes, so {pid} names the worker.
+                self._pid = os.getpid()
+                self._fh  = open(self.path.replace("{pid}", str(self._pid)), "a", encoding="utf-8")
+            self._fh.write(line)
+            self._fh.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None and self._pid == os.getpid():
+                self._fh.close()
+            self._fh = None
+
+
+class ShadowRunner:
+    """Bounded, drop-on-pressure background comparison of a candidate scorer/decision."""
+
+    def __init__(
+        self,
+        scorer: CreditScorer,
+        decision: DecisionEngine,
+        sink: ShadowSink,
+        label: str,
+        sample_rate: float = 1.0,
+        workers: int = 1,
+        max_pending: int = 64,
+    ):
+        self.scorer      = scorer
+        self.decision    = decision
+        self.sink        = sink
+        self.label       = label
+        self.sample_rate = sample_rate
+        self.workers     = workers
+        self.max_pending = max_pending
+
+        self._lock     = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid = None
+        self._pending  = 0
+
+        self.submitted        = 0
+        self.dropped          = 0
+        self.completed        = 0
+        self.failed           = 0
+        self.decision_changed = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ShadowRunner"]:
+        scorer_path   = os.getenv("SHADOW_SCORER")
+        scorecard     = os.getenv("SHADOW_SCORECARD")
+        decision_path = os.getenv("SHADOW_DECISION")
+        if not scorer_path and not scorecard and not decision_path:
+            return None
+
+        scorer_cls = load_object(scorer_path) if scorer_path else CreditScorer
+        scorer     = scorer_cls(version=scorecard) if scorecard else scorer_cls()
+        if scorecard:
+            scorer.scorecard()      # fail at startup, not per comparison, on an unknown version
+        decision = load_object(decision_path)() if decision_path else DecisionEngine()
+        label    = os.getenv("SHADOW_LABEL") or "+".join(
+            p for p in (scorer_path, scorecard and f"scorecard={scorecard}", decision_path) if p
+        )
+        return cls(
+            scorer=scorer,
+            decision=decision,
+            sink=ShadowSink(os.getenv("SHADOW_SINK", "shadow.jsonl")),
+            label=label,
+            sample_rate=float(os.getenv("SHADOW_SAMPLE_RATE", "1.0")),
+            workers=int(os.getenv("SHADOW_WORKERS", "1")),
+            max_pending=int(os.getenv("SHADOW_MAX_PENDING", "64")),
+        )
+
+    def _executor(self) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            self._pool     = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="shadow")
+            self._pool_pid = pid
+            self._pending  = 0
+        return self._pool
+
+    def submit(
+        self,
+        request: AnalyzeRequest,
+        features: Dict[str, Any],
+        policy: RiskPolicy,
+        production: AnalyzeResponse,
+        breakdown: Dict[str, float],
+    ) -> bool:
+        """Queue a comparison; False when it was sampled out or dropped. Never blocks on the pool."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            pool = self._executor()
+            self._pending  += 1
+            self.submitted += 1
+        pool.submit(self._compare, request, features, policy, production.decision, production.score, breakdown)
+        return True
+
+    def _compare(
+        self,
+        request: AnalyzeRequest,
+        features: Dict[str, Any],
+        policy: RiskPolicy,
+        prod_decision: str,
+        prod_score: int,
+        prod_breakdown: Dict[str, float],
+    ) -> None:
+        t0 = time.perf_counter()
+        try:
+            score, breakdown = self.scorer.calculate(
+                features, request.loan_amount, request.tenor_months, request.interest_rate,
+            )
+            candidate = self.decision.decide(
+                request, features, score, breakdown, policy,
+                DecisionTrace(applicant_id=request.applicant_id),
+            )
+            changed = candidate.decision != prod_decision
+            self.sink.write({
+                "ts":               time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "label":            self.label,
+                "applicant_id":     request.applicant_id,
+                "production":       {"decision": prod_decision, "score": prod_score,
+                                     "breakdown": prod_breakdown},
+                "candidate":        {"decision": candidate.decision, "score": candidate.score,
+                                     "breakdown": breakdown},
+                "score_delta":      candidate.score - prod_score,
+                "decision_changed": changed,
+                "duration_ms":      round((time.perf_counter() - t0) * 1000, 2),
+            })
+            with self._lock:
+                self.completed += 1
+                self.decision_changed += int(changed)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.warning(
+                "Shadow comparison failed",
+                extra=fields(applicant=request.applicant_id, error_type=type(e).__name__, error=str(e)),
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self) -> None:
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self.sink.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "label":            self.label,
+                "pending":          self._pending,
+                "max_pending":      self.max_pending,
+                "submitted":        self.submitted,
+                "dropped":          self.dropped,
+                "completed":        self.completed,
+                "failed":           self.failed,
+                "decision_changed": self.decision_changed,
+            }
@@ -0,0 +1,288 @@
+"""
+Incremental transaction aggregates.
+
+Accounts are re-analysed as new transactions sync in. Rather than
+recomputing every aggregate from the full history each time, the brain
+keeps them in a FeatureState (app.models) — per account: monthly credit and
+debit sums and counts, end-of-day balances for active days, overdraft /
+bounce / high-risk counters, salary-credit totals, oldest and latest-salary
+dates — and a `through` watermark per account.
+
+A caller that persists the state from one response (include_feature_state)
+and sends it back as request.feature_state gets only the transactions after
+each account's watermark folded in; the cost of re-analysis then scales with
+the new transactions, not the history. Sending the full history again is
+safe: rows at or before the watermark are skipped.
+
+  - Accounts without prior state are folded in full.
+  - For accounts with prior state, only dated rows strictly after the
+    watermark are folded; undated rows in a later sync are ignored.
+  - A state with a different version is discarded and rebuilt.
+  - Under an analysis window (app.columns) the prior state's months and
+    daily balances before the window are pruned, so a long-lived state stays
+    bounded too. Its counters cover whatever history they were folded from.
+    Rows the window dropped still count towards oldest_at.
+
+Transfers between the request's own accounts (app.transfers) are left out
+of the monthly credit and debit sums and counted in transfer_count instead;
+their balances still count.
+
+The transaction-level features, the account-health knockout and the review
+triggers read the combined TransactionAggregates for the request's accounts,
+whether or not a prior state was supplied.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.balances import daily_balance_series, last_balance_per_day
+from app.columns import TransactionColumns, transaction_columns
+from app.models import AccountFeatureState, FeatureState, MonthTotals, RiskPolicy
+from app.transfers import match_transfers
+
+STATE_VERSION = 3
+
+
+def month_key(ordinal: int) -> str:
+    """Month ordinal (months since 1970-01) → "YYYY-MM"."""
+    year, month = divmod(int(ordinal), 12)
+    return f"{1970 + year:04d}-{month + 1:02d}"
+
+
+def month_ordinal(key: str) -> int:
+    year, month = key.split("-")
+    return (int(year) - 1970) * 12 + int(month) - 1
+
+
+def _epoch(ts: np.datetime64) -> int:
+    return int(ts.astype("datetime64[s]").astype(np.int64))
+
+
+def _max_opt(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    return b if a is None else a if b is None else max(a, b)
+
+
+def _min_opt(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+@dataclass
+class TransactionAggregates:
+    """Aggregates combined across the request's accounts, as the extractors read them."""
+    months:                 np.ndarray   # int64 month ordinals, ascending
+    credits:                np.ndarray   # float64 credit sum per month
+    debits:                 np.ndarray   # float64 debit sum per month
+    credit_count:           np.ndarray   # int64 credits per month
+    debit_count:            np.ndarray   # int64 debits per month
+    daily_balance:          np.ndarray   # float64 combined end-of-day balance per calendar day
+    transaction_count:      int
+    overdraft_count:        int
+    bounced_count:          int
+    knockout_bounced_count: int
+    high_risk_count:        int
+    transfer_count:         int
+    salary_count:           int
+    salary_total:           float
+    latest_salary_at:       Optional[np.datetime64]
+    oldest_at:              Optional[np.datetime64]
+
+
+def fold_account(
+    prior: Optional[AccountFeatureState],
+    cols: TransactionColumns,
+    rows: np.ndarray,
+    first_dropped: Optional[int] = None,
+    transfers: Optional[np.ndarray] = None,
+) -> AccountFeatureState:
+    """
+    Fold the selected rows of cols into prior (or a fresh state); prior is not
+    modified. first_dropped is the earliest row the analysis window dropped;
+    transfers masks the rows of cols that are own-account transfer legs.
+    """
+    if prior is not None:
+        rows = rows & cols.has_date
+        if prior.through is not None:
+            rows = rows & (cols.ts > np.datetime64(prior.through, "s"))
+
+    ts      = cols.ts[rows]
+    amount  = cols.amount[rows]
+    balance = cols.balance[rows]
+    kind    = cols.kind[rows]
+    dated   = ~np.isnat(ts)
+    moved   = transfers[rows] if transfers is not None else np.zeros(len(ts), dtype=bool)
+
+    since = cols.window.since if cols.window is not None else None
+    month_floor = "" if since is None else month_key(since.astype("datetime64[M]").astype(np.int64))
+    day_floor   = "" if since is None else str(since.astype("datetime64[D]"))
+
+    months: Dict[str, MonthTotals] = {
+        key: totals.model_copy() for key, totals in (prior.months if prior else {}).items()
+        if key >= month_floor
+    }
+    flows = dated & (kind != 0) & ~moved
+    if flows.any():
+        ordinals          = ts[flows].astype("datetime64[M]").astype(np.int64)
+        uniq, month_idx   = np.unique(ordinals, return_inverse=True)
+        is_credit         = kind[flows] > 0
+        flow_amounts      = amount[flows]
+        n                 = len(uniq)
+        credit_sums       = np.bincount(month_idx, weights=np.where(is_credit, flow_amounts, 0.0), minlength=n)
+        debit_sums        = np.bincount(month_idx, weights=np.where(is_credit, 0.0, flow_amounts), minlength=n)
+        credit_counts     = np.bincount(month_idx[is_credit], minlength=n)
+        debit_counts      = np.bincount(month_idx[~is_credit], minlength=n)
+        for i, ordinal in enumerate(uniq):
+            totals = months.setdefault(month_key(ordinal), MonthTotals())
+            totals.credits      += float(credit_sums[i])
+            totals.debits       += float(debit_sums[i])
+            totals.credit_count += int(credit_counts[i])
+            totals.debit_count  += int(debit_counts[i])
+
+    daily_balance = {
+        day: value for day, value in (prior.daily_balance if prior else {}).items() if day >= day_floor
+    }
+    days, eod     = last_balance_per_day(ts, balance)
+    daily_balance.update(zip(np.datetime_as_string(days.astype("datetime64[D]")).tolist(), eod.tolist()))
+
+    salary = cols.salary_kw[rows] & (kind > 0) & dated
+    latest_salary = _epoch(ts[salary].max()) if salary.any() else None
+    through       = _epoch(ts[dated].max()) if dated.any() else None
+    oldest        = _epoch(ts[dated].min()) if dated.any() else None
+
+    base = prior or AccountFeatureState()
+    return AccountFeatureState(
+        through=_max_opt(base.through, through),
+        transaction_count=base.transaction_count + int(len(ts)),
+        months=months,
+        daily_balance=daily_balance,
+        overdraft_count=base.overdraft_count + int(np.count_nonzero(balance < 0)),
+        bounced_count=base.bounced_count + int(np.count_nonzero(cols.bounce_kw[rows])),
+        knockout_bounced_count=base.knockout_bounced_count + int(np.count_nonzero(cols.ko_bounce_kw[rows])),
+        high_risk_count=base.high_risk_count + int(np.count_nonzero(cols.high_risk_kw[rows])),
+        transfer_count=base.transfer_count + int(np.count_nonzero(moved)),
+        salary_count=base.salary_count + int(np.count_nonzero(salary)),
+        salary_total=base.salary_total + float(amount[salary].sum()),
+        latest_salary_at=_max_opt(base.latest_salary_at, latest_salary),
+        oldest_at=_min_opt(_min_opt(base.oldest_at, oldest), first_dropped),
+    )
+
+
+def fold(
+    prior: Optional[FeatureState],
+    cols: TransactionColumns,
+    account_ids: Sequence[str],
+    transfer_minutes: int = 0,
+) -> FeatureState:
+    """
+    New FeatureState with cols folded into prior, one entry per account id.
+    Legs of transfers between the accounts within transfer_minutes are netted out.
+    """
+    if prior is not None and prior.version != STATE_VERSION:
+        prior = None
+    known = prior.accounts if prior else {}
+
+    indexes: Dict[str, List[int]] = {}
+    for index, account_id in enumerate(account_ids):
+        indexes.setdefault(account_id, []).append(index)
+
+    transfers = None
+    if transfer_minutes > 0 and len(indexes) > 1:
+        owner     = np.unique(np.asarray(account_ids), return_inverse=True)[1]
+        transfers = match_transfers(owner[cols.account], cols.ts, cols.amount, cols.kind, transfer_minutes * 60)
+
+    window   = cols.window
+    accounts = {
+        account_id: fold_account(
+            known.get(account_id), cols, np.isin(cols.account, idx),
+            window.first_dropped(idx) if window is not None else None,
+            transfers,
+        )
+        for account_id, idx in indexes.items()
+    }
+    return FeatureState(version=STATE_VERSION, accounts=accounts)
+
+
+def combine(state: FeatureState, account_ids: Sequence[str]) -> TransactionAggregates:
+    """Sum the per-account states of account_ids into request-level aggregates."""
+    accounts = [state.accounts[a] for a in dict.fromkeys(account_ids) if a in state.accounts]
+
+    by_month: Dict[int, List[float]] = {}
+    for acct in accounts:
+        for key, totals in acct.months.items():
+            row = by_month.setdefault(month_ordinal(key), [0.0, 0.0, 0, 0])
+            row[0] += totals.credits
+            row[1] += totals.debits
+            row[2] += totals.credit_count
+            row[3] += totals.debit_count
+    ordinals = sorted(by_month)
+    table    = [by_month[o] for o in ordinals]
+
+    def column(i: int, dtype) -> np.ndarray:
+        return np.array([row[i] for row in table], dtype=dtype)
+
+    def stamp(value: Optional[int]) -> Optional[np.datetime64]:
+        return None if value is None else np.datetime64(value, "s")
+
+    latest_salary = None
+    oldest        = None
+    for acct in accounts:
+        latest_salary = _max_opt(latest_salary, acct.latest_salary_at)
+        oldest        = _min_opt(oldest, acct.oldest_at)
+
+    daily_balance = daily_balance_series(
+        (
+            np.array(list(acct.daily_balance), dtype="datetime64[D]").astype(np.int64),
+            np.fromiter(acct.daily_balance.values(), dtype=np.float64, count=len(acct.daily_balance)),
+        )
+        for acct in accounts
+    )
+
+    return TransactionAggregates(
+        months=np.array(ordinals, dtype=np.int64),
+        credits=column(0, np.float64),
+        debits=column(1, np.float64),
+        credit_count=column(2, np.int64),
+        debit_count=column(3, np.int64),
+        daily_balance=daily_balance,
+        transaction_count=sum(a.transaction_count for a in accounts),
+        overdraft_count=sum(a.overdraft_count for a in accounts),
+        bounced_count=sum(a.bounced_count for a in accounts),
+        knockout_bounced_count=sum(a.knockout_bounced_count for a in accounts),
+        high_risk_count=sum(a.high_risk_count for a in accounts),
+        transfer_count=sum(a.transfer_count for a in accounts),
+        salary_count=sum(a.salary_count for a in accounts),
+        salary_total=sum(a.salary_total for a in accounts),
+        latest_salary_at=stamp(latest_salary),
+        oldest_at=stamp(oldest),
+    )
+
+
+@dataclass
+class _Folded:
+    state:      FeatureState
+    aggregates: TransactionAggregates
+
+
+def _folded(request: Any) -> _Folded:
+    folded: Optional[_Folded] = request._state
+    if folded is None:
+        account_ids = [a.account_id for a in request.accounts]
+        policy      = request.risk_policy or RiskPolicy()
+        state       = fold(
+            request.feature_state, transaction_columns(request), account_ids,
+            policy.transfer_match_minutes,
+        )
+        folded      = _Folded(state=state, aggregates=combine(state, account_ids))
+        request._state = folded
+    return folded
+
+
+def feature_state(request: Any) -> FeatureState:
+    """The request's FeatureState: its prior state (if any) with its transactions folded in."""
+    return _folded(request).state
+
+
+def transaction_aggregates(request: Any) -> TransactionAggregates:
+    """Combined aggregates for the request's accounts, folded on first use and cached."""
+    return _folded(request).aggregates
@@ -0,0 +1,102 @@
+"""
+Inter-account transfer matching.
+
+Money an applicant moves between their own linked accounts shows up twice:
+as a debit on one account and a credit on the other. Left in, it inflates
+the monthly credits (and safe_income with them) and the monthly debits by
+the same amount.
+
+match_transfers() pairs such legs: same amount to the kobo, opposite type,
+different account, dated within a tolerance of each other. Other rows of
+the same amount can sit between the two legs (round amounts are common), so
+legs are paired within each amount group rather than among sort neighbours:
+
+  - rows are sorted by (amount, date) and each amount group is walked once
+    in time order;
+  - unmatched legs wait in one FIFO per account and kind, and drop out once
+    they are more than the tolerance old;
+  - each leg is paired with the oldest waiting leg of the opposite kind on
+    another account, which is the one that would expire first; with no
+    such leg it waits in turn.
+
+A leg is only left unmatched when no unmatched leg of the opposite kind on
+another account is within the tolerance. The walk is linear in the number
+of rows after the sort (times the number of accounts, which is small), and
+memory stays linear, so matching stays on for every multi-account request.
+Single-account requests and amount groups without both kinds on two
+accounts are skipped.
+
+Legs are matched among the rows of one request. With an incremental
+FeatureState (app.state), a leg already folded into the prior state is not
+revisited.
+"""
+
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+import numpy as np
+
+
+def match_transfers(
+    owner: np.ndarray,
+    ts: np.ndarray,
+    amount: np.ndarray,
+    kind: np.ndarray,
+    tolerance_seconds: int,
+) -> np.ndarray:
+    """
+    Boolean mask of the rows that are one leg of an inter-account transfer.
+
+    owner identifies the account of each row (equal values are the same
+    account); ts is datetime64, kind is > 0 for credits and < 0 for debits.
+    """
+    matched = np.zeros(len(amount), dtype=bool)
+    if tolerance_seconds <= 0 or len(amount) < 2:
+        return matched
+
+    candidates = (kind != 0) & ~np.isnat(ts) & (amount > 0)
+    if len(np.unique(owner[candidates])) < 2:
+        return matched
+
+    rows  = np.flatnonzero(candidates)
+    cents = np.rint(amount[rows] * 100).astype(np.int64)
+    secs  = ts[rows].astype("datetime64[s]").astype(np.int64)
+    order = np.lexsort((secs, cents))
+    rows, cents, secs = rows[order], cents[order], secs[order]
+    credit = kind[rows] > 0
+    owners = owner[rows]
+
+    # Only groups holding both kinds, on at least two accounts, can match.
+    starts = np.flatnonzero(np.r_[True, cents[1:] != cents[:-1]])
+    ends   = np.r_[starts[1:], len(rows)]
+    n_credit = np.add.reduceat(credit.astype(np.int64), starts)
+    mixed    = (n_credit > 0) & (n_credit < ends - starts)
+    multi    = np.maximum.reduceat(owners, starts) != np.minimum.reduceat(owners, starts)
+
+    secs_l, credit_l, owners_l, rows_l = secs.tolist(), credit.tolist(), owners.tolist(), rows.tolist()
+    paired: List[int] = []
+    for start, end in zip(starts[mixed & multi].tolist(), ends[mixed & multi].tolist()):
+        # waiting[is_credit][account] → unmatched legs, oldest first, as (secs, row).
+        waiting: Tuple[Dict[int, Deque[Tuple[int, int]]], ...] = ({}, {})
+        for i in range(start, end):
+            t, is_credit, acct = secs_l[i], credit_l[i], owners_l[i]
+            horizon = t - tolerance_seconds
+            partner = None
+            for other, legs in waiting[not is_credit].items():
+                if other == acct:
+                    continue
+                while legs and legs[0][0] < horizon:
+                    legs.popleft()
+                if legs and (partner is None or legs[0] < partner[0]):
+                    partner = legs
+            if partner is None:
+                own = waiting[is_credit].get(acct)
+                if own is None:
+                    own = waiting[is_credit][acct] = deque()
+                own.append((t, rows_l[i]))
+            else:
+                paired.append(partner.popleft()[1])
+                paired.append(rows_l[i])
+
+    matched[paired] = True
+    return matched
@@ -9,6 +9,9 @@ import { MonoService } from 'src/mono/mono.service';
 import { RiskPolicyService } from 'src/risk-policy/risk-policy.service';
 
 const SYNC_DATA_MAX_AGE_MS = 24 * 60 * 60 * 1000;
+const BRAIN_TIMEOUT_MS = 30_000;
+// Budget announced to the brain, leaving room for the response to travel back.
+const BRAIN_DEADLINE_MS = BRAIN_TIMEOUT_MS - 1_000;
 
 export class BrainUnavailableError extends Error {
   constructor(message: string) {
@@ -118,7 +121,7 @@ export class ApplicationProcessorService {
         accounts:       accountsData,
         credit_history: creditHistory,
         risk_policy:    riskPolicy,
-      });
+      }, applicant.fintechId);
 
       this.logger.info(
         { applicationId, decision: brainResponse.decision, score: brainResponse.score },
@@ -245,18 +248,22 @@ export class ApplicationProcessorService {
     accounts:       any[];
     credit_history: any;
     risk_policy:    Record<string, number>;
-  }) {
+  }, fintechId: string) {
     this.logger.info(`Calling brain at ${this.brainUrl}/analyze`);
 
     const controller = new AbortController();
-    const timeout = setTimeout(() => controller.abort(), 30_000);
+    const timeout = setTimeout(() => controller.abort(), BRAIN_TIMEOUT_MS);
 
     let response: Response;
 
     try {
       response = await fetch(`${this.brainUrl}/analyze`, {
         method:  'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type':        'application/json',
+          'X-Tenant-Id':         fintechId,
+          'X-Brain-Deadline-Ms': String(BRAIN_DEADLINE_MS),
+        },
         body:    JSON.stringify(payload),
         signal:  controller.signal,
       });
@@ -271,7 +278,9 @@ export class ApplicationProcessorService {
       const errorText = await response.text();
       this.logger.error({ status: response.status, errorText }, 'Brain service returned an error');
 
-      if (response.status >= 500) {
+      // 429: the brain's admission control is saturated; 504: it ran out of
+      // the deadline. Both are transient — retry later like a 5xx.
+      if (response.status >= 500 || response.status === 429) {
         throw new BrainUnavailableError(`Brain service unavailable (${response.status}): ${errorText}`);
       }
 